@@ -0,0 +1,50 @@
+from typing import List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from sketch import group_quantiles
+
+QUANTILES = (0.25, 0.5, 0.75)
+
+
+def quantile_name(q: float) -> str:
+    return 'median' if q == 0.5 else f"p{q * 100:g}"
+
+def aggregate(df: pd.DataFrame, keys: List[str], value: str = 'price', quantiles: Sequence[float] = QUANTILES, error: Optional[float] = None) -> pd.DataFrame:
+    df = df[df[value].notnull()]
+    grouped = df.groupby(keys, sort=True, observed=True, dropna=True)
+    codes = grouped.ngroup().fillna(-1).to_numpy(dtype=np.int64)
+    index = grouped.size().index
+    valid = codes >= 0 # Rows with a missing key belong to no group
+    codes, values = codes[valid], df[value].to_numpy(dtype=float)[valid]
+
+    counts = np.bincount(codes, minlength=len(index))
+    stats = {
+        'count': counts,
+        'mean': np.bincount(codes, weights=values, minlength=len(index)) / counts,
+    }
+
+    if error is not None: # Estimate the quantiles with a sketch per group instead of sorting every value
+        stats['min'] = np.full(len(index), np.inf)
+        stats['max'] = np.full(len(index), -np.inf)
+        np.minimum.at(stats['min'], codes, values)
+        np.maximum.at(stats['max'], codes, values)
+        estimates = group_quantiles(codes, values, len(index), quantiles, error)
+        for i, q in enumerate(quantiles):
+            stats[quantile_name(q)] = estimates[:, i]
+        return pd.DataFrame(stats, index=index)
+
+    # Sort once by group then value, so every group is a contiguous, ordered run
+    order = np.lexsort((values, codes))
+    codes, values = codes[order], values[order]
+    starts = np.cumsum(counts) - counts
+
+    stats['min'] = values[starts]
+    stats['max'] = values[starts + counts - 1]
+    for q in quantiles: # Linear interpolation between the closest ranks, as in pandas
+        position = starts + (counts - 1) * q
+        low, high = np.floor(position).astype(int), np.ceil(position).astype(int)
+        stats[quantile_name(q)] = values[low] + (values[high] - values[low]) * (position - low)
+
+    return pd.DataFrame(stats, index=index)
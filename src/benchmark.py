@@ -0,0 +1,152 @@
+import io
+import json
+import os
+import sys
+import tracemalloc
+from argparse import ArgumentParser
+from contextlib import chdir, redirect_stdout
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from typing import Callable, Dict, List, NamedTuple, Tuple
+
+import pandas as pd
+
+from bonus import query_data as bonus_query_data
+from main import (RULES, analyze_data, clean_data, load_data,
+                  profile_dish_data, profile_menu_data, query_data)
+from report import (save_coffee_price_trend, save_dish_profile,
+                    save_menu_profile, save_query_result)
+
+MIN_SECONDS = 0.01 # Stages faster than this are dominated by noise and are not compared
+MIN_BYTES = 2**20
+
+Tables = Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame, pd.DataFrame]
+
+
+class Measurement(NamedTuple):
+    stage: str
+    seconds: float # Fastest of the repeats
+    rows: int
+    peak_bytes: int # Peak Python allocation of one extra, traced run
+
+class Regression(NamedTuple):
+    stage: str
+    metric: str
+    baseline: float
+    current: float
+
+
+def measure(stage: str, function: Callable, arguments: Callable[[], Tuple], rows: int, repeat: int) -> Measurement:
+    seconds = []
+    with redirect_stdout(io.StringIO()): # Drop the timer printouts
+        for _ in range(repeat):
+            args = arguments() # Stages that modify their tables get fresh copies outside the timed region
+            start = perf_counter()
+            function(*args)
+            seconds.append(perf_counter() - start)
+
+        args = arguments()
+        tracemalloc.start()
+        try:
+            function(*args)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    return Measurement(stage, min(seconds), rows, peak)
+
+def copies(tables: Tables) -> Callable[[], Tables]:
+    return lambda: tuple(df.copy() for df in tables) # type: ignore[return-value]
+
+def benchmark(dataset_path: str, repeat: int = 3, engines: Tuple[str, ...] = ('native', 'sqlite')) -> List[Measurement]:
+    results = []
+    with TemporaryDirectory() as directory:
+        cache_dir = f"{directory}/cache"
+        with redirect_stdout(io.StringIO()):
+            dirty = load_data(dataset_path, cache_dir) # Fills the cache
+        rows = sum(map(len, dirty))
+        results.append(measure("load_data (csv)", load_data, lambda: (dataset_path, None), rows, repeat))
+        results.append(measure("load_data (cache)", load_data, lambda: (dataset_path, cache_dir), rows, repeat))
+
+        clean = copies(dirty)()
+        for rule in RULES: # Each rule runs alone on the output of the rules before it
+            written = sum(len(df) for table, df in zip(['menu', 'page', 'item', 'dish'], clean) if table in rule.writes)
+            results.append(measure(f"clean: {rule.name}", rule.function, copies(clean), written, repeat))
+            rule.function(*clean)
+        results.append(measure("clean_data", clean_data, copies(dirty), rows, repeat))
+
+        analyses = {}
+        datasets: List[Tuple[str, Tables]] = [('dirty', dirty), ('clean', clean)]
+        for dataset, tables in datasets:
+            menu_df, page_df, item_df, dish_df = tables
+            results.append(measure(f"profile_menu_data ({dataset})", profile_menu_data, lambda: (menu_df,), len(menu_df), repeat))
+            results.append(measure(f"profile_dish_data ({dataset})", profile_dish_data, lambda: (dish_df,), len(dish_df), repeat))
+            for engine in engines:
+                results.append(measure(f"query_data ({dataset}, {engine})", query_data, lambda: (*tables, engine), rows, repeat))
+                results.append(measure(f"bonus query_data ({dataset}, {engine})", bonus_query_data, lambda: (*copies(tables)(), engine), rows, repeat))
+            with redirect_stdout(io.StringIO()):
+                analyses[dataset] = analyze_data(*tables, dataset)
+
+        with redirect_stdout(io.StringIO()):
+            coffee = bonus_query_data(*copies(clean)())
+        (dirty_menu, dirty_dish, dirty_prices), (clean_menu, clean_dish, clean_prices) = analyses['dirty'], analyses['clean']
+
+        os.makedirs(f"{directory}/doc")
+        with chdir(directory): # The savers write to doc/ under the working directory
+            results.append(measure("save_menu_profile", save_menu_profile, lambda: (dirty_menu, clean_menu), len(dirty_menu) + len(clean_menu), repeat))
+            results.append(measure("save_dish_profile", save_dish_profile, lambda: (dirty_dish, clean_dish), 2, repeat))
+            results.append(measure("save_query_result", save_query_result, lambda: (dirty_prices, clean_prices), len(dirty_prices) + len(clean_prices), repeat))
+            results.append(measure("save_coffee_price_trend", save_coffee_price_trend, lambda: (coffee,), len(coffee), repeat))
+
+    return results
+
+def report(dataset_path: str, repeat: int, results: List[Measurement]) -> Dict:
+    return {
+        'dataset': dataset_path,
+        'repeat': repeat,
+        'results': [ {**result._asdict(), 'rows_per_sec': result.rows / result.seconds if result.seconds else None} for result in results ],
+    }
+
+def compare(results: List[Measurement], baseline: Dict, tolerance: float) -> List[Regression]:
+    previous = { result['stage']: result for result in baseline['results'] }
+    regressions = []
+    for result in results:
+        if result.stage not in previous:
+            continue
+        old = previous[result.stage]
+        if result.seconds > MIN_SECONDS and result.seconds > old['seconds'] * (1 + tolerance):
+            regressions.append(Regression(result.stage, 'seconds', old['seconds'], result.seconds))
+        if result.peak_bytes - old['peak_bytes'] > MIN_BYTES and result.peak_bytes > old['peak_bytes'] * (1 + tolerance):
+            regressions.append(Regression(result.stage, 'peak_bytes', old['peak_bytes'], result.peak_bytes))
+    return regressions
+
+def main() -> None:
+    parser = ArgumentParser()
+    parser.add_argument('dataset_path', help='Path to the directory of the dataset to run on')
+    parser.add_argument('--repeat', type=int, default=3, help='Time each stage this many times and keep the fastest (default: 3)')
+    parser.add_argument('--engine', action='append', choices=['sqlite', 'native'], help='Query engine to time, may be repeated (default: both)')
+    parser.add_argument('--out', help='Write the results as JSON to this path')
+    parser.add_argument('--baseline', help='Compare against the JSON results of an earlier run')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Fraction a stage may slow down or grow before it is flagged (default: 0.2)')
+    args = parser.parse_args()
+
+    results = benchmark(args.dataset_path, args.repeat, tuple(args.engine or ['native', 'sqlite']))
+
+    for result in results:
+        print(f"  {result.stage:55} {result.seconds:9.4f} secs {result.rows / result.seconds if result.seconds else 0:14,.0f} rows/sec {result.peak_bytes / 2**20:9.1f} MiB")
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report(args.dataset_path, args.repeat, results), f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"  Regressed {regression.stage:55} {regression.metric:10} {regression.baseline:14,.4f} -> {regression.current:14,.4f}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
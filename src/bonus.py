@@ -1,75 +1,146 @@
 import sqlite3
 from argparse import ArgumentParser
-from statistics import mean, median
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 
-import matplotlib.pyplot as plt
+import numpy as np
 import pandas as pd
-import seaborn as sns
 
-from main import clean_data, load_data, timer
+from aggregate import aggregate
+from classify import classify
+from dates import add_year_columns, menu_years
+from dishindex import containing, dish_index, dish_rows, find_names
+from instrument import profiling, span, timer
+from main import (add_cache_arguments, add_compact_argument,
+                  add_engine_argument, add_profile_argument,
+                  add_report_arguments, add_workers_argument, clean_data,
+                  compact, load_data, resolve_cache_dir, save_json)
+from partition import set_workers
+from regex import IS_CUP_OF_COFFEE, IS_NEW_YORK
+from sketch import k_for_error, rank_error
 
+GROUPS = ['year', 'decade', 'region', 'dish', 'currency'] # Keys that coffee price trends can be grouped by
 
-@timer
-def query_data(menu_df: pd.DataFrame, page_df: pd.DataFrame, item_df: pd.DataFrame, dish_df: pd.DataFrame) -> List[Tuple[int, float, float]]:
-    menu_df['year'] = pd.to_datetime(menu_df.date, errors='coerce').dt.year
 
+def query_data_sqlite(menu_df: pd.DataFrame, page_df: pd.DataFrame, item_df: pd.DataFrame, dish_df: pd.DataFrame) -> List[Tuple[int, float]]:
     con = sqlite3.connect(":memory:")
     cur = con.cursor()
 
-    menu_df.to_sql("Menu", con, if_exists='replace', index=False, method='multi', chunksize=10_000)
-    page_df.to_sql("Page", con, if_exists='replace', index=False, method='multi', chunksize=10_000)
-    item_df.to_sql("Item", con, if_exists='replace', index=False, method='multi', chunksize=10_000)
-    dish_df.to_sql("Dish", con, if_exists='replace', index=False, method='multi', chunksize=10_000)
-
-    results = cur.execute("""
-        SELECT menu.year, item.price FROM item
-        INNER JOIN dish ON item.dish_id = dish.id
-        INNER JOIN page ON item.menu_page_id = page.id
-        INNER JOIN menu ON page.menu_id = menu.id
-        WHERE dish.name LIKE "%coffee%"
-        AND menu.year IS NOT NULL
-        AND menu.currency = "Dollars"
-        AND item.price IS NOT NULL;
-        """).fetchall()
+    with span("to_sql"):
+        menu_df.to_sql("Menu", con, if_exists='replace', index=False, method='multi', chunksize=10_000)
+        page_df.to_sql("Page", con, if_exists='replace', index=False, method='multi', chunksize=10_000)
+        item_df.to_sql("Item", con, if_exists='replace', index=False, method='multi', chunksize=10_000)
+        dish_df.to_sql("Dish", con, if_exists='replace', index=False, method='multi', chunksize=10_000)
+
+    with span("query"):
+        results = cur.execute("""
+            SELECT menu.year, item.price FROM item
+            INNER JOIN dish ON item.dish_id = dish.id
+            INNER JOIN page ON item.menu_page_id = page.id
+            INNER JOIN menu ON page.menu_id = menu.id
+            WHERE dish.name LIKE "%coffee%"
+            AND menu.year IS NOT NULL
+            AND menu.currency = "Dollars"
+            AND item.price IS NOT NULL;
+            """).fetchall()
 
     con.close()
 
-    results = [ (int(year), price) for year, price in results ]
-    years = sorted({ year for year, _ in results })
-    results = [ (year, mean([ p for y, p in results if y == year ]), median([ p for y, p in results if y == year ])) for year in years ]
+    return [ (int(year), price) for year, price in results ]
+
+def query_data_native(menu_df: pd.DataFrame, page_df: pd.DataFrame, item_df: pd.DataFrame, dish_df: pd.DataFrame) -> List[Tuple[int, float]]:
+    menus = menu_df.loc[menu_df['year'].notnull() & (menu_df['currency'] == "Dollars"), ['id', 'year']].rename(columns={'id': 'menu_id'})
+    pages = page_df[['id', 'menu_id']].rename(columns={'id': 'menu_page_id'})
+    index = dish_index(dish_df)
+    dishes = pd.DataFrame({'dish_id': dish_df['id'].iloc[dish_rows(index, containing(index, "coffee"))].to_numpy()})
+    items = item_df.loc[item_df['price'].notnull(), ['menu_page_id', 'dish_id', 'price']]
+
+    joined = items.merge(dishes, on='dish_id').merge(pages, on='menu_page_id').merge(menus, on='menu_id')
+
+    return [ (int(year), price) for year, price in zip(joined['year'], joined['price']) ]
+
+@timer
+def query_data(menu_df: pd.DataFrame, page_df: pd.DataFrame, item_df: pd.DataFrame, dish_df: pd.DataFrame, engine: str = 'native', error: Optional[float] = None) -> List[Tuple[int, float, float]]:
+    menu_df = add_year_columns(menu_df)
+
+    engines = {'sqlite': query_data_sqlite, 'native': query_data_native}
+    prices = engines[engine](menu_df, page_df, item_df, dish_df)
+
+    stats = aggregate(pd.DataFrame(prices, columns=['year', 'price']), ['year'], quantiles=[0.5], error=error)
+    results = [ (int(year), float(mean), float(median)) for year, mean, median in zip(stats.index, stats['mean'], stats['median']) ]
 
     return results
 
+def price_rows(menu_df: pd.DataFrame, page_df: pd.DataFrame, item_df: pd.DataFrame, dish_df: pd.DataFrame) -> pd.DataFrame:
+    year = menu_years(menu_df)
+    region = pd.Series(np.where(classify(menu_df['place'], IS_NEW_YORK), "New York", "Elsewhere"), index=menu_df.index).where(menu_df['place'].notnull())
+    menus = pd.DataFrame({
+        'menu_id': menu_df['id'],
+        'year': year,
+        'decade': year // 10 * 10,
+        'region': region,
+        'currency': menu_df['currency'],
+    })
+    index = dish_index(dish_df)
+    coffee = dish_rows(index, containing(index, "coffee"))
+    cups = np.isin(coffee, dish_rows(index, find_names(index, pattern=IS_CUP_OF_COFFEE)))
+    dishes = pd.DataFrame({
+        'dish_id': dish_df['id'].iloc[coffee].to_numpy(),
+        'dish': np.where(cups, "Cup of coffee", "Other coffee"),
+    })
+    pages = page_df[['id', 'menu_id']].rename(columns={'id': 'menu_page_id'})
+    items = item_df.loc[item_df['price'].notnull(), ['menu_page_id', 'dish_id', 'price']]
+
+    return items.merge(dishes, on='dish_id').merge(pages, on='menu_page_id').merge(menus, on='menu_id')
+
 @timer
-def save_query_results(results: List[Tuple[int, float, float]]) -> None:
-    x =        [ x for x, _, _ in results ]
-    y_mean =   [ x for _, x, _ in results ]
-    y_median = [ x for _, _, x in results ]
-
-    sns.set_theme()
-    plt.plot(x, y_mean, label="Mean")
-    plt.plot(x, y_median, label="Median")
-    plt.title("Price of Coffee")
-    plt.xlabel("Year")
-    plt.ylabel("Price ($)")
-    plt.legend()
-    plt.show()
-    plt.close()
+def price_trends(menu_df: pd.DataFrame, page_df: pd.DataFrame, item_df: pd.DataFrame, dish_df: pd.DataFrame, keys: List[str], error: Optional[float] = None) -> pd.DataFrame:
+    rows = price_rows(menu_df, page_df, item_df, dish_df)
+    if 'currency' not in keys: # Prices in different currencies only compare when the currency is a key
+        rows = rows[rows['currency'] == "Dollars"]
+    return aggregate(rows, keys, error=error)
 
 @timer
 def main() -> None:
     parser = ArgumentParser()
     parser.add_argument('dataset_path', help='Path to the directory of the dataset to run on')
+    add_cache_arguments(parser)
+    add_workers_argument(parser)
+    add_engine_argument(parser)
+    add_compact_argument(parser)
+    add_profile_argument(parser)
+    add_report_arguments(parser)
+    parser.add_argument('--trend', nargs='+', choices=GROUPS, metavar='KEY', help=f"Also print coffee price statistics grouped by these keys ({', '.join(GROUPS)})")
+    parser.add_argument('--sketch-error', type=float, metavar='EPS', help='Estimate medians and quartiles with mergeable KLL sketches within this normalized rank error (e.g. 0.01) instead of sorting every price')
     args = parser.parse_args()
+    set_workers(args.workers)
+
+    with profiling(args.profile):
+        menu_df, page_df, item_df, dish_df = load_data(args.dataset_path, resolve_cache_dir(args))
+
+        if args.compact:
+            compact(menu_df, page_df, item_df, dish_df)
+
+        clean_data(menu_df, page_df, item_df, dish_df)
 
-    menu_df, page_df, item_df, dish_df = load_data(args.dataset_path)
+        results = query_data(menu_df, page_df, item_df, dish_df, args.engine, args.sketch_error)
+        bound = None if args.sketch_error is None else rank_error(k_for_error(args.sketch_error))
+        if bound is not None:
+            print(f"  Quantiles are estimates within {bound:.2%} of the exact rank (99% confidence)")
 
-    clean_data(menu_df, page_df, item_df, dish_df)
+        trends = price_trends(menu_df, page_df, item_df, dish_df, args.trend, args.sketch_error) if args.trend else None
+        if trends is not None:
+            print(trends.to_string(float_format='{:.2f}'.format))
 
-    results = query_data(menu_df, page_df, item_df, dish_df)
+        if args.json_out:
+            save_json(args.json_out, {
+                'prices_by_year': [ {'year': year, 'mean': mean, 'median': median} for year, mean, median in results ],
+                'trends': [] if trends is None else trends.reset_index().astype(object).to_dict(orient='records'),
+                'quantile_rank_error': bound,
+            })
 
-    save_query_results(results)
+        if not args.no_plots:
+            from report import save_coffee_price_trend # Importing the plotting libraries is slow, so only plotting runs pay for it
+            save_coffee_price_trend(results)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,78 @@
+import hashlib
+import json
+import os
+from typing import Dict, Optional
+
+import pandas as pd
+
+SCHEMAS: Dict[str, Dict[str, str]] = {
+    'Menu':     {'id': 'int64', 'date': 'object', 'call_number': 'object', 'place': 'object', 'currency': 'object'},
+    'MenuPage': {'id': 'int64', 'menu_id': 'Int64'}, # The NYPL data has pages without a menu
+    'MenuItem': {'id': 'int64', 'menu_page_id': 'int64', 'dish_id': 'float64', 'price': 'float64'},
+    'Dish':     {'id': 'int64', 'name': 'object'},
+}
+
+
+def file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def fingerprint(path: str) -> Dict[str, int]:
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+def read_csv(dataset_path: str, table: str) -> pd.DataFrame:
+    schema = SCHEMAS[table]
+    return pd.read_csv(f"{dataset_path}/{table}.csv", usecols=list(schema), dtype={column: dtype for column, dtype in schema.items()})[list(schema)]
+
+def is_fresh(csv_path: str, meta: Dict, schema: Dict[str, str]) -> bool:
+    if meta.get('schema') != schema:
+        return False
+    current = fingerprint(csv_path)
+    if current['size'] != meta.get('size'):
+        return False
+    if current['mtime_ns'] == meta.get('mtime_ns'):
+        return True
+    return file_hash(csv_path) == meta.get('sha256') # Touched but not modified
+
+def read_table(dataset_path: str, table: str, cache_dir: Optional[str] = None) -> pd.DataFrame:
+    if cache_dir is None:
+        return read_csv(dataset_path, table)
+
+    csv_path = f"{dataset_path}/{table}.csv"
+    cache_path = f"{cache_dir}/{table}.parquet"
+    meta_path = f"{cache_dir}/{table}.json"
+    schema = SCHEMAS[table]
+
+    if os.path.exists(cache_path) and os.path.exists(meta_path):
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if is_fresh(csv_path, meta, schema):
+            if meta['mtime_ns'] != fingerprint(csv_path)['mtime_ns']:
+                meta.update(fingerprint(csv_path))
+                write_meta(meta_path, meta)
+            return restore_missing(pd.read_parquet(cache_path))
+
+    df = read_csv(dataset_path, table)
+
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        df.to_parquet(cache_path, index=False)
+        write_meta(meta_path, {'schema': schema, 'sha256': file_hash(csv_path), **fingerprint(csv_path)})
+    except OSError as e:
+        print(f"Skipped caching {table}: {e}")
+
+    return df
+
+def restore_missing(df: pd.DataFrame) -> pd.DataFrame:
+    for column in df.columns:
+        if df[column].dtype == object:
+            df[column] = df[column].where(df[column].notna(), float('nan')) # Parquet round-trips NaN as None
+    return df
+
+def write_meta(meta_path: str, meta: Dict) -> None:
+    with open(meta_path, 'w') as f:
+        json.dump(meta, f)
@@ -0,0 +1,69 @@
+import glob
+import os
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from cache import restore_missing
+
+COLUMNS = ['row', 'old', 'new', 'rule']
+
+
+@dataclass
+class ChangeLog:
+    # Changes per table and column, in the order the rules made them. Each table is cleaned by
+    # one thread at a time, so appending to its lists needs no lock.
+    chunks: Dict[Tuple[str, str], List[pd.DataFrame]] = field(default_factory=dict)
+
+
+def row_ids(df: pd.DataFrame) -> pd.Index:
+    return pd.Index(df['id']) if 'id' in df.columns else df.index
+
+def record(log: ChangeLog, df: pd.DataFrame, table: str, column: str, rule: str, positions: np.ndarray, old: np.ndarray, new: np.ndarray) -> None:
+    if len(positions) == 0:
+        return
+    chunk = pd.DataFrame({'row': row_ids(df)[positions], 'old': old, 'new': new, 'rule': rule})
+    log.chunks.setdefault((table, column), []).append(chunk)
+
+def changes(log: ChangeLog, table: str, column: str) -> pd.DataFrame:
+    chunks = log.chunks.get((table, column), [])
+    if not chunks:
+        return pd.DataFrame(columns=COLUMNS)
+    df = pd.concat(chunks, ignore_index=True)
+    df['rule'] = df['rule'].astype('category')
+    return df
+
+def summary(log: ChangeLog) -> pd.DataFrame:
+    counts = [ (table, column, rule, count) for table, column in log.chunks for rule, count in changes(log, table, column)['rule'].value_counts(sort=False).items() if count ]
+    return pd.DataFrame(counts, columns=['table', 'column', 'rule', 'cells'])
+
+def write_log(log: ChangeLog, directory: str) -> None:
+    os.makedirs(directory, exist_ok=True)
+    for path in glob.glob(f"{directory}/*.parquet"):
+        os.remove(path)
+    for table, column in log.chunks:
+        changes(log, table, column).to_parquet(f"{directory}/{table}.{column}.parquet", index=False)
+
+def read_log(directory: str) -> ChangeLog:
+    log = ChangeLog()
+    for path in sorted(glob.glob(f"{directory}/*.parquet")):
+        table, column = os.path.basename(path)[:-len('.parquet')].split('.', 1)
+        df = restore_missing(pd.read_parquet(path))
+        df['rule'] = df['rule'].astype(str)
+        log.chunks[(table, column)] = [df]
+    return log
+
+def dirty_table(clean_df: pd.DataFrame, table: str, log: ChangeLog) -> pd.DataFrame:
+    # Shares every unchanged column with the clean table and rebuilds only the changed ones
+    df = clean_df.copy(deep=False)
+    for name, column in log.chunks:
+        if name != table:
+            continue
+        original = changes(log, table, column).drop_duplicates('row', keep='first') # The oldest change holds the dirty value
+        positions = row_ids(df).get_indexer(original['row'])
+        values = df[column].astype(object) if isinstance(df[column].dtype, pd.CategoricalDtype) else df[column].copy()
+        values.iloc[positions] = original['old'].astype(values.dtype).to_numpy()
+        df[column] = values
+    return df
@@ -0,0 +1,34 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable
+
+import numpy as np
+import pandas as pd
+
+from partition import match_values
+
+MAX_PATTERNS = 64 # The server classifies by the patterns in its queries, so only the most recently used are kept
+
+MATCHES: OrderedDict[str, Dict[Hashable, bool]] = OrderedDict() # Memoized results by pattern, least recently used first, then by distinct value
+LOCK = threading.Lock()
+
+
+def pattern_memo(pattern: str) -> Dict[Hashable, bool]:
+    with LOCK:
+        memo = MATCHES.setdefault(pattern, {})
+        MATCHES.move_to_end(pattern)
+        while len(MATCHES) > MAX_PATTERNS:
+            MATCHES.popitem(last=False)
+        return memo
+
+def classify(values: pd.Series, pattern: str) -> pd.Series:
+    memo = pattern_memo(pattern)
+
+    codes, uniques = pd.factorize(values)
+    unknown = [ value for value in uniques if value not in memo ]
+    if unknown:
+        memo.update(zip(unknown, match_values(pattern, unknown)))
+    unique_matches = np.fromiter((memo[value] for value in uniques), dtype=bool, count=len(uniques))
+    row_matches = np.append(unique_matches, False)[codes] # Missing values have code -1
+
+    return pd.Series(row_matches, index=values.index, name=values.name)
@@ -0,0 +1,71 @@
+import os
+from typing import List, NamedTuple, Optional
+
+import numpy as np
+import pandas as pd
+
+MISSING_ID = -1 # Ids are stored as int64, so missing ids need a sentinel instead of NaN
+
+
+class ColumnStore(NamedTuple):
+    # The MenuPage and MenuItem columns that the joins read, as plain arrays that are cheap to
+    # share. Attached stores are read-only memory maps of .npy files, so any number of processes
+    # can use one without copying it.
+    page_id: np.ndarray
+    page_menu_id: np.ndarray
+    item_id: np.ndarray
+    item_menu_page_id: np.ndarray
+    item_dish_id: np.ndarray
+    item_price: np.ndarray
+
+
+def id_array(values: pd.Series) -> np.ndarray:
+    if values.dtype == np.int64:
+        return values.to_numpy() # No copy
+    return values.fillna(MISSING_ID).to_numpy(dtype=np.int64)
+
+def price_array(values: pd.Series) -> np.ndarray:
+    return values.to_numpy(dtype=np.float64, na_value=np.nan)
+
+def column_store(page_df: pd.DataFrame, item_df: pd.DataFrame) -> ColumnStore:
+    return ColumnStore(
+        page_id=id_array(page_df['id']),
+        page_menu_id=id_array(page_df['menu_id']),
+        item_id=id_array(item_df['id']) if 'id' in item_df.columns else np.arange(len(item_df), dtype=np.int64),
+        item_menu_page_id=id_array(item_df['menu_page_id']),
+        item_dish_id=id_array(item_df['dish_id']),
+        item_price=price_array(item_df['price']),
+    )
+
+def concat_stores(stores: List[ColumnStore]) -> ColumnStore:
+    # One store from the stores of consecutive chunks of MenuItem, which share their MenuPage columns
+    return stores[0]._replace(**{ name: np.concatenate([ getattr(store, name) for store in stores ]) for name in ColumnStore._fields if name.startswith('item_') })
+
+def write_store(store: ColumnStore, directory: str) -> None:
+    os.makedirs(directory, exist_ok=True)
+    for name, values in store._asdict().items():
+        np.save(f"{directory}/{name}.npy", values)
+
+def attach(directory: str) -> ColumnStore:
+    if not os.path.exists(f"{directory}/{ColumnStore._fields[0]}.npy"):
+        raise FileNotFoundError(f"No column store at {directory} (run src/ingest.py --column-store first)")
+    return ColumnStore(*( np.load(f"{directory}/{name}.npy", mmap_mode='r') for name in ColumnStore._fields ))
+
+def is_in(values: np.ndarray, ids: np.ndarray) -> np.ndarray:
+    if len(values) == 0 or len(ids) == 0:
+        return np.zeros(len(values), dtype=bool)
+    size = int(max(values.max(), ids.max())) + 1
+    if size > 4 * (len(values) + len(ids)): # Too sparse for a lookup table
+        return np.isin(values, ids[ids >= 0])
+    table = np.zeros(size + 1, dtype=bool) # The extra last slot stays False for missing ids
+    table[ids[ids >= 0]] = True
+    return table[np.where(values >= 0, values, size)]
+
+def menu_items(page_id: np.ndarray, page_menu_id: np.ndarray, item_menu_page_id: np.ndarray, menu_ids: np.ndarray) -> np.ndarray:
+    return is_in(item_menu_page_id, page_id[is_in(page_menu_id, menu_ids)])
+
+def select_items(store: ColumnStore, menu_ids: np.ndarray, dish_ids: np.ndarray, max_price: Optional[float] = None) -> np.ndarray:
+    items = menu_items(store.page_id, store.page_menu_id, store.item_menu_page_id, menu_ids) & is_in(store.item_dish_id, dish_ids) & ~np.isnan(store.item_price)
+    if max_price is not None:
+        items &= store.item_price < max_price
+    return items
@@ -0,0 +1,44 @@
+from typing import List, NamedTuple
+
+import numpy as np
+import pandas as pd
+
+MAX_CATEGORY_RATIO = 0.5 # Columns with more distinct values than this fraction of rows stay as Python strings
+
+
+class MemoryReport(NamedTuple):
+    table: str
+    before: int
+    after: int
+
+
+def compact_ids(values: pd.Series) -> pd.Series:
+    if values.isna().all():
+        return values.astype('Int8')
+    if values.min() >= np.iinfo(np.int32).min and values.max() <= np.iinfo(np.int32).max:
+        return values.astype('Int32')
+    return values.astype('Int64')
+
+def compact_strings(values: pd.Series) -> pd.Series:
+    if values.nunique() > len(values) * MAX_CATEGORY_RATIO:
+        return values
+    return values.astype('category')
+
+def compact_table(df: pd.DataFrame) -> None:
+    # Prices stay float64. As float32, 0.16 reads back as 0.1599999964, which would reach the results.
+    for column in df.columns:
+        if column == 'id' or column.endswith('_id'):
+            df[column] = compact_ids(df[column])
+        elif df[column].dtype == object:
+            df[column] = compact_strings(df[column])
+
+def memory_usage(df: pd.DataFrame) -> int:
+    return int(df.memory_usage(deep=True).sum())
+
+def compact_data(menu_df: pd.DataFrame, page_df: pd.DataFrame, item_df: pd.DataFrame, dish_df: pd.DataFrame) -> List[MemoryReport]:
+    reports = []
+    for table, df in zip(['menu', 'page', 'item', 'dish'], [menu_df, page_df, item_df, dish_df]):
+        before = memory_usage(df)
+        compact_table(df)
+        reports.append(MemoryReport(table, before, memory_usage(df)))
+    return reports
@@ -0,0 +1,157 @@
+from argparse import ArgumentParser
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from aggregate import aggregate
+from classify import classify
+from colstore import id_array, price_array
+from dates import menu_years
+from dishindex import containing, dish_index
+from instrument import profiling, timer
+from main import (add_cache_arguments, add_compact_argument,
+                  add_profile_argument, add_workers_argument, clean_data,
+                  compact, load_data, resolve_cache_dir)
+from partition import set_workers
+from regex import IS_CUP_OF_COFFEE, IS_NEW_YORK
+from relindex import parent_rows
+
+
+class Classifier(NamedTuple):
+    name: str
+    pattern: str
+    hints: Tuple[str, ...] = () # Text that every value matching the pattern contains at least one of, to skip the pattern on the rest
+
+
+REGIONS: List[Classifier] = [
+    Classifier("New York", IS_NEW_YORK),
+    Classifier("Boston", r"(?i)\bboston\b"),
+    Classifier("Philadelphia", r"(?i)\bphiladelphia\b"),
+    Classifier("Washington", r"(?i)\bwashington\b"),
+    Classifier("Chicago", r"(?i)\bchicago\b"),
+    Classifier("St. Louis", r"(?i)\b(?:st\.?|saint) louis\b"),
+    Classifier("San Francisco", r"(?i)\bsan francisco\b"),
+    Classifier("London", r"(?i)\blondon\b"),
+    Classifier("Paris", r"(?i)\bparis\b"),
+    Classifier("Berlin", r"(?i)\bberlin\b"),
+    Classifier("Other", r"\S"), # Every other menu with a place, so no priced item goes missing from the cube
+]
+BEVERAGES: List[Classifier] = [
+    Classifier("Cup of coffee", IS_CUP_OF_COFFEE, ("coffee",)),
+    Classifier("Other coffee", r"(?i)\bcoffee\b", ("coffee",)),
+    Classifier("Tea", r"(?i)\btea\b", ("tea",)),
+    Classifier("Cocoa", r"(?i)\b(?:cocoa|hot chocolate)\b|^chocolate$", ("cocoa", "chocolate")),
+    Classifier("Milk", r"(?i)\b(?:butter)?milk\b", ("milk",)),
+    Classifier("Lemonade", r"(?i)\blemonade\b", ("lemonade",)),
+    Classifier("Beer", r"(?i)\b(?:beer|ale|lager|porter)\b", ("beer", "ale", "lager", "porter")),
+    Classifier("Wine", r"(?i)\b(?:wine|claret|champagne|sherry|port)\b", ("wine", "claret", "champagne", "sherry", "port")),
+]
+KEYS = ['region', 'period', 'beverage']
+STATISTICS = ['count', 'mean', 'median', 'max']
+
+
+def first_match(values: pd.Series, classifiers: List[Classifier]) -> np.ndarray:
+    # Code of the first classifier each value matches, or -1 when it matches none, so every row
+    # falls in at most one cell
+    codes = np.full(len(values), -1)
+    for code, classifier in reversed(list(enumerate(classifiers))):
+        codes[classify(values, classifier.pattern).to_numpy()] = code
+    return codes
+
+def dish_classes(dish_df: pd.DataFrame, classifiers: List[Classifier]) -> np.ndarray:
+    # first_match over the distinct dish names, where a pattern only runs on the names that contain
+    # one of its hints
+    index = dish_index(dish_df)
+    name_codes = np.full(len(index.names), -1)
+    for code, classifier in reversed(list(enumerate(classifiers))):
+        candidates = np.unique(np.concatenate([ containing(index, hint) for hint in classifier.hints ])) if classifier.hints else np.arange(len(index.names))
+        name_codes[candidates[classify(index.names.iloc[candidates], classifier.pattern).to_numpy()]] = code
+
+    codes = np.full(len(dish_df), -1)
+    codes[index.name_rows.rows] = np.repeat(name_codes[index.name_rows.keys], np.diff(index.name_rows.offsets))
+    return codes
+
+def names(classifiers: List[Classifier]) -> Dict[int, str]:
+    return { code: classifier.name for code, classifier in enumerate(classifiers) }
+
+@timer
+def price_cube(menu_df: pd.DataFrame, page_df: pd.DataFrame, item_df: pd.DataFrame, dish_df: pd.DataFrame,
+               regions: List[Classifier] = REGIONS, beverages: List[Classifier] = BEVERAGES, period_years: int = 10,
+               currency: Optional[str] = "Dollars", max_price: Optional[float] = 1, error: Optional[float] = None) -> pd.DataFrame:
+    # Price statistics for every region, period and beverage at once. The classifiers run once per
+    # menu and dish, and every item is tagged with its cell in a single pass over MenuItem.
+    menu_regions = first_match(menu_df['place'], regions)
+    menu_periods = (menu_years(menu_df) // period_years * period_years).to_numpy(dtype=float, na_value=np.nan)
+    qualifies = (menu_regions >= 0) & ~np.isnan(menu_periods)
+    if currency is not None:
+        qualifies &= (menu_df['currency'] == currency).to_numpy()
+    dish_beverages = dish_classes(dish_df, beverages)
+
+    pages = parent_rows(id_array(page_df['id']), id_array(item_df['menu_page_id']))
+    menus = np.where(pages >= 0, parent_rows(id_array(menu_df['id']), id_array(page_df['menu_id']))[pages], -1)
+    dishes = parent_rows(id_array(dish_df['id']), id_array(item_df['dish_id']))
+    prices = price_array(item_df['price'])
+
+    items = (menus >= 0) & (dishes >= 0) & ~np.isnan(prices)
+    items[items] &= qualifies[menus[items]] & (dish_beverages[dishes[items]] >= 0)
+    if max_price is not None:
+        items &= prices < max_price
+    menus, dishes = menus[items], dishes[items]
+
+    cells = pd.DataFrame({
+        'region': menu_regions[menus],
+        'period': menu_periods[menus].astype(np.int64),
+        'beverage': dish_beverages[dishes],
+        'price': prices[items],
+    })
+    cube = aggregate(cells, KEYS, quantiles=[0.5], error=error)[STATISTICS] # Grouped by classifier code, so the cells come out in classifier order
+    return cube.rename(index=names(regions), level='region').rename(index=names(beverages), level='beverage')
+
+def parse_classifier(text: str) -> Classifier:
+    name, _, pattern = text.partition('=')
+    if not name or not pattern:
+        raise ValueError(f"Expected NAME=PATTERN, got {text!r}")
+    return Classifier(name, pattern)
+
+def save_cube(path: str, cube: pd.DataFrame) -> None:
+    if path.endswith('.parquet'):
+        cube.to_parquet(path)
+    else:
+        cube.to_csv(path)
+
+@timer
+def main() -> None:
+    parser = ArgumentParser()
+    parser.add_argument('dataset_path', help='Path to the directory of the dataset to run on')
+    parser.add_argument('--out', required=True, metavar='PATH', help='Write the cube to PATH (Parquet if PATH ends in .parquet, CSV otherwise)')
+    parser.add_argument('--region', type=parse_classifier, action='append', metavar='NAME=PATTERN', help='Place classifier, in priority order (default: major cities, then Other)')
+    parser.add_argument('--beverage', type=parse_classifier, action='append', metavar='NAME=PATTERN', help='Dish name classifier, in priority order (default: common beverages)')
+    parser.add_argument('--period-years', type=int, default=10, metavar='N', help='Group menu years into periods of N years (default: 10)')
+    parser.add_argument('--max-price', type=float, default=1, help='Exclusive upper bound on prices (default: 1, as in main.py)')
+    parser.add_argument('--sketch-error', type=float, metavar='EPS', help='Estimate the medians with a KLL sketch per cell within this normalized rank error (e.g. 0.01)')
+    add_cache_arguments(parser)
+    add_workers_argument(parser)
+    add_compact_argument(parser)
+    add_profile_argument(parser)
+    args = parser.parse_args()
+    set_workers(args.workers)
+
+    with profiling(args.profile):
+        menu_df, page_df, item_df, dish_df = load_data(args.dataset_path, resolve_cache_dir(args))
+
+        if args.compact:
+            compact(menu_df, page_df, item_df, dish_df)
+
+        options = dict(regions=args.region or REGIONS, beverages=args.beverage or BEVERAGES, period_years=args.period_years, max_price=args.max_price, error=args.sketch_error)
+        dirty = price_cube(menu_df, page_df, item_df, dish_df, **options)
+        clean_data(menu_df, page_df, item_df, dish_df)
+        clean = price_cube(menu_df, page_df, item_df, dish_df, **options)
+
+        cube = pd.concat([dirty, clean], keys=['dirty', 'clean'], names=['dataset'])
+        save_cube(args.out, cube)
+        print(f"  Wrote {len(cube)} cells to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+import json
+import os
+import sqlite3
+from contextlib import contextmanager
+from typing import Dict, Iterator, List
+
+import pandas as pd
+
+TABLES: Dict[str, Dict[str, str]] = {
+    'Menu': {'id': 'INTEGER PRIMARY KEY', 'date': 'TEXT', 'call_number': 'TEXT', 'place': 'TEXT', 'currency': 'TEXT', 'year': 'INTEGER', 'decade': 'INTEGER', 'place_is_new_york': 'INTEGER'},
+    'Page': {'id': 'INTEGER PRIMARY KEY', 'menu_id': 'INTEGER'},
+    'Item': {'id': 'INTEGER PRIMARY KEY', 'menu_page_id': 'INTEGER', 'dish_id': 'INTEGER', 'price': 'REAL'},
+    'Dish': {'id': 'INTEGER PRIMARY KEY', 'name': 'TEXT', 'name_is_cup_of_coffee': 'INTEGER'},
+}
+
+INDEXES: Dict[str, List[List[str]]] = {
+    'Menu': [['place_is_new_york', 'currency', 'year']],
+    'Page': [['menu_id']],
+    'Item': [['menu_page_id'], ['dish_id']],
+    'Dish': [['name_is_cup_of_coffee']],
+}
+
+
+def create_tables(con: sqlite3.Connection, dataset: str) -> None:
+    for table, columns in TABLES.items():
+        con.execute(f"DROP TABLE IF EXISTS {dataset}_{table}")
+        con.execute(f"CREATE TABLE {dataset}_{table} ({', '.join(f'{name} {kind}' for name, kind in columns.items())})")
+
+def create_indexes(con: sqlite3.Connection, dataset: str) -> None:
+    for table, indexes in INDEXES.items():
+        for columns in indexes:
+            con.execute(f"CREATE INDEX {dataset}_{table}_{'_'.join(columns)} ON {dataset}_{table} ({', '.join(columns)})")
+
+def insert_rows(con: sqlite3.Connection, dataset: str, table: str, df: pd.DataFrame, chunksize: int = 50_000) -> None:
+    columns = list(TABLES[table])
+    statement = f"INSERT INTO {dataset}_{table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+    df = df[columns] # Once, rather than copying the whole selection for every chunk
+    for start in range(0, len(df), chunksize):
+        chunk = df.iloc[start:start + chunksize].astype(object)
+        con.executemany(statement, chunk.where(chunk.notnull(), None).itertuples(index=False, name=None))
+
+@contextmanager
+def transaction(con: sqlite3.Connection) -> Iterator[None]:
+    con.execute("BEGIN")
+    try:
+        yield
+    except BaseException:
+        con.execute("ROLLBACK")
+        raise
+    con.execute("COMMIT")
+
+def connect(database_path: str) -> sqlite3.Connection:
+    con = sqlite3.connect(database_path, isolation_level=None) # Transactions are explicit
+    con.execute("PRAGMA journal_mode = WAL")
+    con.execute("PRAGMA synchronous = NORMAL")
+    return con
+
+def close(con: sqlite3.Connection) -> None:
+    con.execute("PRAGMA journal_mode = DELETE") # Leave a single self-contained file for read-only users
+    con.close()
+
+def read_sources(con: sqlite3.Connection) -> Dict[str, Dict]:
+    if con.execute("SELECT name FROM sqlite_master WHERE name = 'sources'").fetchone() is None:
+        return {}
+    return { csv: json.loads(meta) for csv, meta in con.execute("SELECT csv, meta FROM sources") }
+
+def write_sources(con: sqlite3.Connection, sources: Dict[str, Dict]) -> None:
+    con.execute("CREATE TABLE IF NOT EXISTS sources (csv TEXT PRIMARY KEY, meta TEXT)")
+    con.executemany("INSERT OR REPLACE INTO sources VALUES (?, ?)", [ (csv, json.dumps(meta)) for csv, meta in sources.items() ])
+
+def matches_schema(con: sqlite3.Connection) -> bool:
+    for dataset in ('dirty', 'clean'):
+        for table, columns in TABLES.items():
+            if [ row[1] for row in con.execute(f"PRAGMA table_info({dataset}_{table})") ] != list(columns):
+                return False
+    return True
+
+def open_database(database_path: str, dataset: str) -> sqlite3.Connection:
+    if not os.path.exists(database_path):
+        raise FileNotFoundError(f"No database at {database_path} (run src/ingest.py first)")
+    con = sqlite3.connect(f"file:{database_path}?mode=ro", uri=True)
+    for table in TABLES:
+        con.execute(f"CREATE TEMP VIEW {table} AS SELECT rowid AS rowid, * FROM main.{dataset}_{table}") # Views have no rowid of their own
+    return con
@@ -0,0 +1,50 @@
+from typing import Callable, Dict, Hashable
+
+import numpy as np
+import pandas as pd
+
+ISO_DATE = r"^\d{4}(?:-\d{2}){0,2}$" # YYYY, YYYY-MM or YYYY-MM-DD
+CALL_NUMBER_YEAR = r"^(\d{4})-" # Call numbers start with the year the menu was catalogued under
+
+Cache = Dict[Hashable, float] # Year of every distinct value parsed so far, NaN when it has none
+
+DATE_YEARS: Cache = {}
+CALL_NUMBER_YEARS: Cache = {}
+
+
+def by_distinct_value(values: pd.Series, parse: Callable[[pd.Series], np.ndarray], cache: Cache) -> pd.Series:
+    codes, uniques = pd.factorize(values)
+    unknown = pd.Series([ value for value in uniques if value not in cache ], dtype=object)
+    if len(unknown):
+        cache.update(zip(unknown, parse(unknown.where(unknown.map(type) == str))))
+
+    lookup = np.append(np.array([ cache[value] for value in uniques ], dtype=float), np.nan) # Missing values have code -1
+    return pd.Series(lookup[codes], index=values.index).astype('Int64')
+
+def parse_dates(text: pd.Series) -> np.ndarray:
+    iso = text.str.match(ISO_DATE).fillna(False).astype(bool)
+    years = np.full(len(text), np.nan)
+    years[iso.to_numpy()] = text[iso].str[:4].astype(int)
+    other = (~iso & text.notnull()).to_numpy()
+    if other.any(): # Only the few dates in other formats take the slow path through the datetime parser
+        years[other] = pd.to_datetime(text[other], errors='coerce', format='mixed').dt.year
+    return years
+
+def parse_call_numbers(text: pd.Series) -> np.ndarray:
+    return text.str.extract(CALL_NUMBER_YEAR, expand=False).astype(float).to_numpy()
+
+def date_years(values: pd.Series) -> pd.Series:
+    return by_distinct_value(values, parse_dates, DATE_YEARS)
+
+def call_number_years(values: pd.Series) -> pd.Series:
+    return by_distinct_value(values, parse_call_numbers, CALL_NUMBER_YEARS)
+
+def menu_years(menu_df: pd.DataFrame) -> pd.Series:
+    return menu_df['year'] if 'year' in menu_df.columns else date_years(menu_df['date'])
+
+def between_years(menu_df: pd.DataFrame, low: int, high: int) -> pd.Series:
+    return menu_years(menu_df).between(low, high).fillna(False).astype(bool)
+
+def add_year_columns(menu_df: pd.DataFrame) -> pd.DataFrame:
+    year = date_years(menu_df['date']) # Always reparse, since cleaning may have changed the dates
+    return menu_df.assign(year=year, decade=year // 10 * 10)
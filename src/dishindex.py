@@ -0,0 +1,103 @@
+import re
+import threading
+import weakref
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from classify import classify
+from relindex import Children, children, lookup
+from regex import IS_CUP_OF_COFFEE
+
+KEYWORDS: Dict[str, List[str]] = { # Words that every name matching a pattern contains
+    IS_CUP_OF_COFFEE: ['coffee'],
+}
+
+
+@dataclass
+class DishIndex:
+    names: pd.Series # Distinct dish names
+    name_rows: Children # Name code to Dish rows
+    postings: OrderedDict[str, np.ndarray] = field(default_factory=OrderedDict) # Lowercase word, or text for substring searches, to the sorted codes of the names that contain it, least recently used first
+    text: Optional[str] = None # The lowercase names joined by NUL, for substring searches
+    ends: Optional[np.ndarray] = None # End of each name in text, separator included
+
+
+MAX_POSTINGS = 1024 # Postings kept per index. The server looks up the words in its queries, so only the most recently used are kept.
+
+INDEXES: Dict[int, Tuple[weakref.ref, DishIndex]] = {} # By the id of the Dish frame
+LOCK = threading.Lock() # The server searches one index from many threads
+
+
+def build_dish_index(dish_df: pd.DataFrame) -> DishIndex:
+    codes, uniques = pd.factorize(dish_df['name'])
+    return DishIndex(pd.Series(np.asarray(uniques, dtype=object), dtype=object), children(codes))
+
+def dish_index(dish_df: pd.DataFrame) -> DishIndex:
+    # Built once per Dish frame and kept until the frame is collected or forget_dish_index is called
+    key = id(dish_df)
+    if key in INDEXES and INDEXES[key][0]() is dish_df:
+        return INDEXES[key][1]
+    index = build_dish_index(dish_df)
+    INDEXES[key] = (weakref.ref(dish_df, lambda _: INDEXES.pop(key, None)), index)
+    return index
+
+def forget_dish_index(dish_df: pd.DataFrame) -> None:
+    INDEXES.pop(id(dish_df), None) # The names changed
+
+def posting(index: DishIndex, key: str, find: Callable[[], np.ndarray]) -> np.ndarray:
+    # The postings of a word are found with one scan of the distinct names the first time the word
+    # is queried, and reused while it stays among the MAX_POSTINGS most recently used
+    with LOCK:
+        if key in index.postings:
+            index.postings.move_to_end(key)
+            return index.postings[key]
+    codes = find()
+    with LOCK:
+        index.postings[key] = codes
+        while len(index.postings) > MAX_POSTINGS:
+            index.postings.popitem(last=False)
+    return codes
+
+def with_word(index: DishIndex, word: str) -> np.ndarray:
+    pattern = rf"\b{re.escape(word.lower())}\b"
+    return posting(index, word.lower(), lambda: np.flatnonzero(index.names.str.contains(pattern, case=False, regex=True).to_numpy(dtype=bool)))
+
+def lowercase_text(index: DishIndex) -> Tuple[str, np.ndarray]:
+    if index.text is None or index.ends is None:
+        names = [ name if isinstance(name, str) else '' for name in index.names ]
+        text = "\0".join(names).lower() # One call for all the names
+        if len(text) != sum(map(len, names)) + len(names) - 1: # Lowercasing changed the length of some name
+            names = [ name.lower() for name in names ]
+            text = "\0".join(names)
+        index.ends = np.cumsum(np.fromiter(map(len, names), dtype=np.int64, count=len(names)) + 1)
+        index.text = text
+    return index.text, index.ends
+
+def containing(index: DishIndex, text: str) -> np.ndarray:
+    # Codes of the names that contain text anywhere, ignoring case. One scan of all the names
+    # joined into one string visits only the matches, instead of calling into Python per name.
+    def find() -> np.ndarray:
+        joined, ends = lowercase_text(index)
+        starts = np.fromiter(( match.start() for match in re.finditer(re.escape(text.lower()), joined) ), dtype=np.int64)
+        return np.unique(np.searchsorted(ends, starts, side='right'))
+    return posting(index, f"*{text.lower()}*", find)
+
+def find_names(index: DishIndex, words: Sequence[str] = (), exclude: Sequence[str] = (), pattern: Optional[str] = None) -> np.ndarray:
+    # Codes of the names that contain every word in words and none in exclude, and match pattern.
+    # The pattern only runs on the names that pass the word filters.
+    words = [ *words, *KEYWORDS.get(pattern, []) ] if pattern is not None else list(words)
+    candidates = np.arange(len(index.names))
+    for word in sorted(words, key=lambda word: len(with_word(index, word))): # Rarest first keeps the intersections small
+        candidates = np.intersect1d(candidates, with_word(index, word), assume_unique=True)
+    for word in exclude:
+        candidates = np.setdiff1d(candidates, with_word(index, word), assume_unique=True)
+    if pattern is not None:
+        candidates = candidates[classify(index.names.iloc[candidates], pattern).to_numpy()]
+    return candidates
+
+def dish_rows(index: DishIndex, name_codes: np.ndarray) -> np.ndarray:
+    return np.sort(lookup(index.name_rows, name_codes))
@@ -1,68 +1,69 @@
 from argparse import ArgumentParser
+from typing import Optional, Tuple
 
-import matplotlib.pyplot as plt
+import numpy as np
 import pandas as pd
-import seaborn as sns
 
-from main import timer
+from cache import read_table
+from classify import classify
+from dates import add_year_columns, between_years
+from instrument import profiling, timer
+from main import (add_cache_arguments, add_profile_argument,
+                  add_report_arguments, add_workers_argument,
+                  resolve_cache_dir, save_json)
+from partition import set_workers
 from regex import IS_1900_TO_1909, IS_DOLLARS, IS_NEW_YORK
+from regions import marginals, profile
 
 
 @timer
-def load_data(dataset_path: str) -> pd.DataFrame:
-    menu_df = pd.read_csv(f"{dataset_path}/Menu.csv")
+def load_data(dataset_path: str, cache_dir: Optional[str] = None) -> pd.DataFrame:
+    menu_df = read_table(dataset_path, 'Menu', cache_dir)
     return menu_df
 
 @timer
-def explore_menu_table(menu_df: pd.DataFrame) -> None:
-    place_ny    =  menu_df['place'].str.contains(IS_NEW_YORK, na=False)
-    place_other = ~menu_df['place'].str.contains(IS_NEW_YORK, na=False) & menu_df['place'].notnull()
-    place_null  =  menu_df['place'].isna()
-
-    date_1900s =  menu_df['date'].str.contains(IS_1900_TO_1909, na=False)
-    date_other = ~menu_df['date'].str.contains(IS_1900_TO_1909, na=False) & menu_df['date'].notnull()
-    date_null  =  menu_df['date'].isna()
-
-    currency_dollars =  menu_df['currency'].str.contains(IS_DOLLARS, na=False)
-    currency_other   = ~menu_df['currency'].str.contains(IS_DOLLARS, na=False) & menu_df['currency'].notnull()
-    currency_null    =  menu_df['currency'].isna()
-
-    assert (menu_df[place_ny]['place'].size + menu_df[place_other]['place'].size + menu_df[place_null]['place'].size) == menu_df['place'].size, "Invalid place value assumptions"
-    assert (menu_df[date_1900s]['date'].size + menu_df[date_other]['date'].size + menu_df[date_null]['date'].size) == menu_df['date'].size, "Invalid date value assumptions"
-    assert (menu_df[currency_dollars]['currency'].size + menu_df[currency_other]['currency'].size + menu_df[currency_null]['currency'].size) == menu_df['currency'].size, "Invalid currency value assumptions"
-    assert menu_df['place'].size == menu_df['date'].size == menu_df['currency'].size, "Invalid attribute length assumption"
-
-    bar_df = pd.DataFrame({
-            'Target value': [menu_df[currency_dollars]['currency'].size, menu_df[date_1900s]['date'].size, menu_df[place_ny]   ['place'].size],
-            'Other value':  [menu_df[currency_other]  ['currency'].size, menu_df[date_other]['date'].size, menu_df[place_other]['place'].size],
-            'No value':     [menu_df[currency_null]   ['currency'].size, menu_df[date_null] ['date'].size, menu_df[place_null] ['place'].size]
-        },
-        index=['currency', 'date', 'place']
-    )
-
-    sns.set_theme()
-    bar_df.plot(kind='barh', stacked=True, color=['green', 'grey', 'lightgrey'], xlabel="Number of Records", title="Applicable Menu Table Attributes", alpha=0.75)
-    plt.savefig("doc/menu-bar-chart.png", bbox_inches='tight')
-    plt.close()
-
-    menu_df['year'] = pd.to_datetime(menu_df.date, errors='coerce').dt.year
-    menu_df['decade'] = menu_df.year - (menu_df.year % 10)
-
-    assert menu_df[menu_df['decade'] == 1900.0]['decade'].size == menu_df[date_1900s]['date'].size, "Invalid date range assumption"
-
-    menu_df['decade'].plot(kind='hist', x='date', xlabel="Decade", ylabel="Count", title="Number of Menus By Decade", bins=range(1850, 2011, 10), alpha=0.75)
-    plt.savefig("doc/menu-date-histogram.png", bbox_inches='tight')
-    plt.close()
+def explore_menu_table(menu_df: pd.DataFrame) -> Tuple[pd.DataFrame, pd.Series]:
+    menu_df = add_year_columns(menu_df)
+
+    attributes = ['currency', 'date', 'place']
+    counts = profile([ menu_df[attribute] for attribute in attributes ], [
+        classify(menu_df['currency'], IS_DOLLARS),
+        between_years(menu_df, 1900, 1909),
+        classify(menu_df['place'], IS_NEW_YORK),
+    ])
+
+    bar_df = pd.DataFrame(np.array(marginals(counts)), index=attributes, columns=['Target value', 'Other value', 'No value'])
+
+    assert (menu_df['decade'] == 1900).sum() == classify(menu_df['date'], IS_1900_TO_1909).sum(), "Invalid date range assumption"
+
+    return bar_df, menu_df['decade']
 
 @timer
 def main() -> None:
     parser = ArgumentParser()
     parser.add_argument('dataset_path', help='Path to the directory of the dataset to run on')
+    add_cache_arguments(parser)
+    add_workers_argument(parser)
+    add_profile_argument(parser)
+    add_report_arguments(parser)
     args = parser.parse_args()
+    set_workers(args.workers)
+
+    with profiling(args.profile):
+        menu_df = load_data(args.dataset_path, resolve_cache_dir(args))
+
+        bar_df, decades = explore_menu_table(menu_df)
 
-    menu_df = load_data(args.dataset_path)
+        if args.json_out:
+            save_json(args.json_out, {
+                'attributes': bar_df.to_dict(orient='index'),
+                'menus_by_decade': { int(decade): int(count) for decade, count in decades.value_counts().sort_index().items() },
+            })
 
-    explore_menu_table(menu_df)
+        if not args.no_plots:
+            from report import save_menu_bar_chart, save_menu_date_histogram # Importing the plotting libraries is slow, so only plotting runs pay for it
+            save_menu_bar_chart(bar_df)
+            save_menu_date_histogram(decades)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,197 @@
+import os
+from argparse import ArgumentParser
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from instrument import timer
+
+SIZES = {'Menu': 17_545, 'MenuPage': 66_937, 'MenuItem': 1_332_726, 'Dish': 423_397} # Rows in the NYPL release at scale 1
+
+COLUMNS = {
+    'Menu':     ['id', 'name', 'sponsor', 'event', 'venue', 'place', 'physical_description', 'occasion', 'notes', 'call_number', 'keywords', 'language', 'date', 'location', 'location_type', 'currency', 'currency_symbol', 'status', 'page_count', 'dish_count'],
+    'MenuPage': ['id', 'menu_id', 'page_number', 'image_id', 'full_height', 'full_width', 'uuid'],
+    'MenuItem': ['id', 'menu_page_id', 'price', 'high_price', 'dish_id', 'created_at', 'updated_at', 'xpos', 'ypos'],
+    'Dish':     ['id', 'name', 'description', 'menus_appeared', 'times_appeared', 'first_appeared', 'last_appeared', 'lowest_price', 'highest_price'],
+}
+
+CHUNK_ROWS = 500_000 # Tables are written in chunks so that large scales fit in memory
+
+Vocabulary = List[Tuple[str, float]] # Value and relative weight
+
+PLACES: Vocabulary = [
+    ("New York", 10), ("NEW YORK", 3), ("New York, NY", 4), ("NEW YORK CITY", 2), ("Waldorf-Astoria, New York", 2), ("Hotel Astor, NY", 1),
+    ("Brooklyn, NY", 1), ("Albany, NY", 1), ("Chicago", 3), ("Boston, MA", 2), ("Philadelphia", 2), ("San Francisco", 2),
+    ("Washington, DC", 1), ("St. Louis", 1), ("London", 2), ("Paris", 2), ("Berlin", 1), ("On board ship", 2),
+]
+CURRENCIES: Vocabulary = [
+    ("Dollars", 80), ("Cents", 5), ("Francs", 4), ("Shillings", 3), ("Marks", 3), ("Lire", 1), ("Pesetas", 1), ("Canadian Dollars", 1),
+]
+DATE_TYPOS = ["0190", "1091", "2928"] # Year prefixes that the cleaning rules repair
+
+PREPARATIONS = ["", "", "", "Broiled", "Fried", "Stewed", "Roast", "Boiled", "Fresh", "Cold", "Hot", "Braised", "Grilled", "Baked", "Creamed", "Stuffed", "Smoked", "Deviled", "Pickled", "Imported"]
+BASES = [
+    "Chicken", "Lamb Chops", "Sirloin Steak", "Oysters", "Clams", "Lobster", "Salmon", "Halibut", "Bluefish", "Shad Roe", "Turkey", "Duck",
+    "Ham", "Bacon", "Eggs", "Omelette", "Potatoes", "Asparagus", "Green Peas", "Spinach", "Tomatoes", "Celery", "Lettuce", "Mushrooms",
+    "Consomme", "Chicken Broth", "Clam Chowder", "Sweetbreads", "Calf's Liver", "Veal Cutlet", "Pork Chops", "Corned Beef", "Welsh Rarebit",
+    "Apple Pie", "Rice Pudding", "Ice Cream", "Strawberries", "Cheese", "Crackers", "Toast", "Rolls", "Waffles", "Griddle Cakes",
+]
+STYLES = ["", "", "", "a la Maryland", "with Mushrooms", "au Gratin", "on Toast", "Bordelaise", "Parisienne", "Creole", "a la Newburg", "Lyonnaise", "Hollandaise", "en Casserole", "Julienne", "Florentine", "Milanaise", "Country Style", "Southern Style", "Saratoga"]
+SIDES = ["", "", "", "", "with Bacon", "with Potatoes", "with Green Peas", "with Rice", "with Tomato Sauce", "with Cream Sauce", "with Jelly", "and Cress", "(half portion)", "(for two)", "(to order)", "(20 minutes)"]
+BEVERAGES: Vocabulary = [
+    ("Coffee", 12), ("Cup of Coffee", 4), ("Coffee, per cup", 3), ("Coffee, demi-tasse", 4), ("Demi Tasse Coffee", 2), ("Black Coffee", 2),
+    ("Coffee with Cream", 2), ("Pot of Coffee", 2), ("Iced Coffee", 1), ("Coffee, glass", 1), ("Tea", 10), ("Cup of Tea", 3), ("Green Tea", 2),
+    ("Cocoa", 3), ("Chocolate", 3), ("Milk", 4), ("Buttermilk", 1), ("Lemonade", 2), ("Beer", 3), ("Claret", 2),
+]
+BEVERAGE_RATE = 0.03
+WHITESPACE = [" ", "  ", "\n", "\t", "\r\n", " \n "]
+
+
+def choose(rng: np.random.Generator, vocabulary: Vocabulary, size: int) -> np.ndarray:
+    values, weights = zip(*vocabulary)
+    return rng.choice(np.array(values, dtype=object), size=size, p=np.array(weights) / sum(weights))
+
+def misspell(rng: np.random.Generator, word: str) -> str:
+    if len(word) < 2:
+        return word
+    i = int(rng.integers(len(word) - 1))
+    kind = rng.integers(4)
+    if kind == 0:
+        return word[:i] + word[i + 1:] # Dropped letter
+    if kind == 1:
+        return word[:i] + word[i] + word[i:] # Doubled letter
+    if kind == 2:
+        return word[:i] + word[i + 1] + word[i] + word[i + 2:] # Swapped letters
+    return word[:i] + chr(ord('a') + int(rng.integers(26))) + word[i + 1:]
+
+def add_typos(rng: np.random.Generator, values: np.ndarray, rate: float) -> np.ndarray:
+    rows = np.flatnonzero(rng.random(len(values)) < rate)
+    values[rows] = [ misspell(rng, value) if isinstance(value, str) else value for value in values[rows] ]
+    return values
+
+def add_whitespace(rng: np.random.Generator, values: np.ndarray, rate: float) -> np.ndarray:
+    rows = np.flatnonzero((rng.random(len(values)) < rate) & pd.notnull(values))
+    padding = np.array(WHITESPACE, dtype=object)
+    values[rows] = padding[rng.integers(len(padding), size=len(rows))] + values[rows].astype(str) + padding[rng.integers(len(padding), size=len(rows))]
+    return values
+
+def add_missing(rng: np.random.Generator, values: np.ndarray, rate: float) -> np.ndarray:
+    values = values.astype(object)
+    values[rng.random(len(values)) < rate] = None
+    return values
+
+def years(rng: np.random.Generator, size: int) -> np.ndarray:
+    # Most menus cluster around the turn of the century, the rest spread across the collection
+    clustered = np.clip(rng.normal(1905, 8, size), 1851, 2012)
+    spread = rng.uniform(1851, 2012, size)
+    return np.where(rng.random(size) < 0.6, clustered, spread).astype(int)
+
+def menu_chunk(rng: np.random.Generator, ids: np.ndarray, sizes: Dict[str, int]) -> pd.DataFrame:
+    size = len(ids)
+    year = years(rng, size)
+    dates = pd.Series(year).astype(str).str.zfill(4) + "-" + pd.Series(rng.integers(1, 13, size)).astype(str).str.zfill(2) + "-" + pd.Series(rng.integers(1, 29, size)).astype(str).str.zfill(2)
+    date = dates.to_numpy(dtype=object)
+    typos = np.flatnonzero(rng.random(size) < 0.002)
+    date[typos] = [ prefix + value[4:] for prefix, value in zip(rng.choice(DATE_TYPOS, len(typos)), date[typos]) ]
+    date = add_missing(rng, date, 0.035)
+
+    call_number = pd.Series(year).astype(str) + "-" + pd.Series(rng.integers(0, 10_000, size)).astype(str).str.zfill(4)
+    place = add_whitespace(rng, add_typos(rng, add_missing(rng, choose(rng, PLACES, size), 0.55), 0.03), 0.01)
+    currency = add_whitespace(rng, add_typos(rng, add_missing(rng, choose(rng, CURRENCIES, size), 0.63), 0.01), 0.01)
+
+    return pd.DataFrame({
+        'id': ids,
+        'place': place,
+        'call_number': add_missing(rng, call_number.to_numpy(dtype=object), 0.1),
+        'date': date,
+        'currency': currency,
+        'status': "complete",
+        'page_count': rng.integers(1, 9, size),
+        'dish_count': rng.integers(1, 200, size),
+    })
+
+def page_chunk(rng: np.random.Generator, ids: np.ndarray, sizes: Dict[str, int]) -> pd.DataFrame:
+    menu_id = np.sort(rng.integers(1, sizes['Menu'] + 1, len(ids))) # Pages of a menu are numbered consecutively
+    return pd.DataFrame({
+        'id': ids,
+        'menu_id': menu_id,
+        'page_number': pd.Series(menu_id).groupby(menu_id).cumcount().to_numpy() + 1,
+        'image_id': rng.integers(1_000_000, 5_000_000, len(ids)),
+        'full_height': rng.integers(2000, 5000, len(ids)),
+        'full_width': rng.integers(1500, 4000, len(ids)),
+    })
+
+def item_chunk(rng: np.random.Generator, ids: np.ndarray, sizes: Dict[str, int]) -> pd.DataFrame:
+    size = len(ids)
+    dish_id = np.floor(sizes['Dish'] ** rng.random(size)).astype(float) # Log-uniform, so that a few dishes appear on most menus
+    dish_id[rng.random(size) < 0.0002] = np.nan
+    price = np.round(rng.lognormal(-0.9, 1.2, size), 2)
+    price[rng.random(size) < 0.33] = np.nan
+    high_price = np.where(rng.random(size) < 0.07, np.round(price * 1.5, 2), np.nan)
+    return pd.DataFrame({
+        'id': ids,
+        'menu_page_id': rng.integers(1, sizes['MenuPage'] + 1, size),
+        'price': price,
+        'high_price': high_price,
+        'dish_id': dish_id,
+        'xpos': np.round(rng.random(size), 6),
+        'ypos': np.round(rng.random(size), 6),
+    })
+
+def dish_chunk(rng: np.random.Generator, ids: np.ndarray, sizes: Dict[str, int]) -> pd.DataFrame:
+    size = len(ids)
+    parts = [ np.array(words, dtype=object)[rng.integers(len(words), size=size)] for words in (PREPARATIONS, BASES, STYLES, SIDES) ]
+    name = pd.Series(parts[0] + " " + parts[1] + " " + parts[2] + " " + parts[3]).str.split().str.join(" ").to_numpy(dtype=object)
+    upper = rng.random(size) < 0.15
+    name[upper] = pd.Series(name[upper], dtype=object).str.upper().to_numpy(dtype=object)
+    beverages = rng.random(size) < BEVERAGE_RATE
+    name[beverages] = choose(rng, BEVERAGES, int(beverages.sum()))
+    name = add_whitespace(rng, add_typos(rng, name, 0.03), 0.01)
+
+    first = years(rng, size)
+    lowest = np.round(rng.lognormal(-0.9, 1.2, size), 2)
+    return pd.DataFrame({
+        'id': ids,
+        'name': name,
+        'menus_appeared': rng.integers(1, 50, size),
+        'times_appeared': rng.integers(1, 60, size),
+        'first_appeared': first,
+        'last_appeared': first + rng.integers(0, 40, size),
+        'lowest_price': lowest,
+        'highest_price': np.round(lowest * rng.uniform(1, 3, size), 2),
+    })
+
+CHUNKS: Dict[str, Callable[[np.random.Generator, np.ndarray, Dict[str, int]], pd.DataFrame]] = {
+    'Menu': menu_chunk, 'MenuPage': page_chunk, 'MenuItem': item_chunk, 'Dish': dish_chunk,
+}
+
+def scaled_sizes(scale: float) -> Dict[str, int]:
+    return { table: max(1, round(rows * scale)) for table, rows in SIZES.items() }
+
+@timer
+def generate(dataset_path: str, scale: float = 1.0, seed: int = 0) -> Dict[str, int]:
+    os.makedirs(dataset_path, exist_ok=True)
+    sizes = scaled_sizes(scale)
+    for number, (table, chunk) in enumerate(CHUNKS.items()):
+        path = f"{dataset_path}/{table}.csv"
+        for start in range(0, sizes[table], CHUNK_ROWS):
+            rng = np.random.default_rng([seed, number, start]) # Each chunk is reproducible on its own
+            ids = np.arange(start + 1, min(start + CHUNK_ROWS, sizes[table]) + 1)
+            df = chunk(rng, ids, sizes).reindex(columns=COLUMNS[table])
+            df.to_csv(path, mode='w' if start == 0 else 'a', header=start == 0, index=False)
+    return sizes
+
+def main() -> None:
+    parser = ArgumentParser()
+    parser.add_argument('dataset_path', help='Directory to write Menu.csv, MenuPage.csv, MenuItem.csv and Dish.csv to')
+    parser.add_argument('--scale', type=float, default=1.0, help='Rows relative to the NYPL dataset, e.g. 1, 10 or 100 (default: 1)')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the random generator (default: 0)')
+    args = parser.parse_args()
+
+    for table, rows in generate(args.dataset_path, args.scale, args.seed).items():
+        print(f"  Wrote {table:8} {rows:12,} rows")
+
+
+if __name__ == "__main__":
+    main()
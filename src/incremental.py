@@ -0,0 +1,171 @@
+import json
+import os
+from argparse import ArgumentParser
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import pandas as pd
+
+from cache import restore_missing
+from instrument import timer
+from main import (Analysis, add_cache_arguments, add_report_arguments,
+                  add_workers_argument, clean_data, load_data,
+                  profile_dish_data, profile_menu_data, resolve_cache_dir,
+                  save_json, select_prices)
+from partition import set_workers
+
+TABLES = ['menu', 'page', 'item', 'dish']
+
+Tables = Dict[str, pd.DataFrame]
+
+
+class Changes(NamedTuple):
+    changed: pd.Index # Ids of inserted and updated rows
+    deleted: pd.Index
+
+class Results(NamedTuple):
+    menu_profile: List[int]
+    dish_profile: int
+    prices: pd.Series # Price by item id
+
+class State(NamedTuple):
+    dirty: Tables
+    clean: Tables
+    results: Dict[str, Results]
+
+
+def diff_table(old: pd.DataFrame, new: pd.DataFrame) -> Changes:
+    old_ids, new_ids = pd.Index(old['id']), pd.Index(new['id'])
+    common = new_ids.intersection(old_ids)
+
+    columns = [ column for column in new.columns if column != 'id' ]
+    before = old.set_index('id').loc[common, columns]
+    after = new.set_index('id').loc[common, columns]
+    updated = common[~((before == after) | (before.isna() & after.isna())).all(axis=1).to_numpy()]
+
+    return Changes(new_ids.difference(old_ids).union(updated), old_ids.difference(new_ids))
+
+def rows(df: pd.DataFrame, ids: pd.Index) -> pd.DataFrame:
+    return df[df['id'].isin(ids)]
+
+def dependents(tables: Tables, changes: Dict[str, Changes]) -> Dict[str, pd.Index]:
+    menu_df, page_df, item_df = tables['menu'], tables['page'], tables['item']
+
+    changed_pages = rows(page_df, changes['page'].changed)
+    changed_items = rows(item_df, changes['item'].changed)
+
+    menus = changes['menu'].changed.union(pd.Index(changed_pages['menu_id'])).union(pd.Index(rows(page_df, pd.Index(changed_items['menu_page_id']))['menu_id']))
+    pages = changes['page'].changed.union(pd.Index(page_df.loc[page_df['menu_id'].isin(menus.union(changes['menu'].deleted)), 'id']))
+    items = changes['item'].changed.union(pd.Index(item_df.loc[item_df['menu_page_id'].isin(pages.union(changes['page'].deleted)), 'id']))
+
+    return {'menu': menus.intersection(pd.Index(menu_df['id'])), 'page': pages, 'item': items, 'dish': changes['dish'].changed}
+
+def query_items(tables: Tables, item_ids: pd.Index) -> pd.Series:
+    item_df = rows(tables['item'], item_ids)
+    prices = select_prices(tables['menu'], tables['page'], item_df, tables['dish'])
+    return pd.Series(prices.to_numpy(), index=item_df.loc[prices.index, 'id'].to_numpy())
+
+def analyze_tables(tables: Tables) -> Results:
+    return Results(profile_menu_data(tables['menu']), profile_dish_data(tables['dish']), query_items(tables, pd.Index(tables['item']['id'])))
+
+def update_results(results: Results, old: Tables, new: Tables, menu_ids: pd.Index, dish_ids: pd.Index, item_ids: pd.Index) -> Results:
+    removed, added = profile_menu_data(rows(old['menu'], menu_ids)), profile_menu_data(rows(new['menu'], menu_ids))
+    menu_profile = [ count - old_count + new_count for count, old_count, new_count in zip(results.menu_profile, removed, added) ]
+    dish_profile = results.dish_profile - profile_dish_data(rows(old['dish'], dish_ids)) + profile_dish_data(rows(new['dish'], dish_ids))
+    prices = pd.concat([results.prices.drop(item_ids, errors='ignore'), query_items(new, item_ids)])
+    return Results(menu_profile, dish_profile, prices)
+
+def reclean(clean: Tables, dirty: Tables, ids: Dict[str, pd.Index], changes: Dict[str, Changes]) -> Tables:
+    recleaned = { table: rows(dirty[table], ids[table]).copy() for table in TABLES }
+    clean_data(*(recleaned[table] for table in TABLES))
+
+    tables = {}
+    for table in TABLES:
+        kept = clean[table][~clean[table]['id'].isin(ids[table].union(changes[table].deleted))]
+        combined = pd.concat([kept, recleaned[table]]).set_index('id')
+        tables[table] = combined.loc[dirty[table]['id']].reset_index()[dirty[table].columns] # Keep the row order of the dataset
+    return tables
+
+def save_state(state_dir: str, state: State) -> None:
+    os.makedirs(state_dir, exist_ok=True)
+    for dataset, tables in [('dirty', state.dirty), ('clean', state.clean)]:
+        for table, df in tables.items():
+            df.to_parquet(f"{state_dir}/{dataset}_{table}.parquet", index=False)
+        results = state.results[dataset]
+        results.prices.rename('price').rename_axis('id').reset_index().to_parquet(f"{state_dir}/{dataset}_prices.parquet", index=False)
+        with open(f"{state_dir}/{dataset}_profiles.json", 'w') as f:
+            json.dump({'menu_profile': results.menu_profile, 'dish_profile': results.dish_profile}, f)
+
+def load_state(state_dir: str) -> Optional[State]:
+    if not os.path.exists(f"{state_dir}/clean_profiles.json"):
+        return None
+    tables: Dict[str, Tables] = {}
+    results: Dict[str, Results] = {}
+    for dataset in ['dirty', 'clean']:
+        tables[dataset] = { table: restore_missing(pd.read_parquet(f"{state_dir}/{dataset}_{table}.parquet")) for table in TABLES }
+        prices = pd.read_parquet(f"{state_dir}/{dataset}_prices.parquet")
+        with open(f"{state_dir}/{dataset}_profiles.json") as f:
+            profiles = json.load(f)
+        results[dataset] = Results(profiles['menu_profile'], profiles['dish_profile'], pd.Series(prices['price'].to_numpy(), index=prices['id'].to_numpy()))
+    return State(tables['dirty'], tables['clean'], results)
+
+def analysis(results: Results, tables: Tables) -> Analysis:
+    item_ids = tables['item']['id']
+    prices = results.prices.reindex(item_ids[item_ids.isin(results.prices.index)])
+    return results.menu_profile, results.dish_profile, prices.tolist()
+
+@timer
+def update(menu_df: pd.DataFrame, page_df: pd.DataFrame, item_df: pd.DataFrame, dish_df: pd.DataFrame, state_dir: str) -> Tuple[Analysis, Analysis]:
+    dirty = dict(zip(TABLES, [menu_df, page_df, item_df, dish_df]))
+    state = load_state(state_dir)
+
+    if state is None or any(list(state.dirty[table].columns) != list(dirty[table].columns) for table in TABLES):
+        clean = { table: df.copy() for table, df in dirty.items() }
+        dirty_results = analyze_tables(dirty)
+        clean_data(*(clean[table] for table in TABLES))
+        clean_results = analyze_tables(clean)
+    else:
+        changes = { table: diff_table(state.dirty[table], dirty[table]) for table in TABLES }
+        for table in TABLES:
+            print(f"  {table:5} {len(changes[table].changed):8} inserted or updated {len(changes[table].deleted):8} deleted")
+
+        ids = dependents(dirty, changes)
+        clean = reclean(state.clean, dirty, ids, changes)
+
+        dish_ids = changes['dish'].changed.union(changes['dish'].deleted)
+        item_ids = ids['item'].union(changes['item'].deleted).union(pd.Index(dirty['item'].loc[dirty['item']['dish_id'].isin(dish_ids), 'id']))
+
+        dirty_results = update_results(state.results['dirty'], state.dirty, dirty, changes['menu'].changed.union(changes['menu'].deleted), dish_ids, item_ids)
+        clean_results = update_results(state.results['clean'], state.clean, clean, ids['menu'].union(changes['menu'].deleted), dish_ids, item_ids)
+
+    save_state(state_dir, State(dirty, clean, {'dirty': dirty_results, 'clean': clean_results}))
+
+    return analysis(dirty_results, dirty), analysis(clean_results, clean)
+
+@timer
+def main() -> None:
+    parser = ArgumentParser()
+    parser.add_argument('dataset_path', help='Path to the directory of the dataset to run on')
+    parser.add_argument('state_dir', help='Directory holding the tables and results of the previous run')
+    add_cache_arguments(parser)
+    add_workers_argument(parser)
+    add_report_arguments(parser, parallel=True)
+    args = parser.parse_args()
+    set_workers(args.workers)
+
+    menu_df, page_df, item_df, dish_df = load_data(args.dataset_path, resolve_cache_dir(args))
+
+    (menu_profile_dirty, dish_profile_dirty, prices_dirty), (menu_profile_clean, dish_profile_clean, prices_clean) = update(menu_df, page_df, item_df, dish_df, args.state_dir)
+
+    if args.json_out:
+        save_json(args.json_out, {
+            'dirty': {'menu_profile': menu_profile_dirty, 'dish_profile': dish_profile_dirty, 'prices': prices_dirty},
+            'clean': {'menu_profile': menu_profile_clean, 'dish_profile': dish_profile_clean, 'prices': prices_clean},
+        })
+
+    if not args.no_plots:
+        from report import save_reports # Importing the plotting libraries is slow, so only plotting runs pay for it
+        save_reports(menu_profile_dirty, menu_profile_clean, dish_profile_dirty, dish_profile_clean, prices_dirty, prices_clean, args.parallel_plots)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import os
+from argparse import ArgumentParser
+from typing import Dict, List, Optional
+
+from cache import SCHEMAS, file_hash, fingerprint, is_fresh
+from changes import ChangeLog
+from colstore import ColumnStore, column_store, concat_stores, write_store
+from database import (close, connect, create_indexes, create_tables,
+                      insert_rows, matches_schema, read_sources, transaction,
+                      write_sources)
+from instrument import span, timer
+from main import (add_cache_arguments, add_flag_columns, add_workers_argument,
+                  clean_data, resolve_cache_dir)
+from partition import set_workers
+from stream import (cents_menu_ids, clean_prices, item_chunks,
+                    load_small_tables, menu_page_ids)
+
+DATASETS = ['dirty', 'clean']
+CHUNK_ROWS = 100_000 # SQLite takes the rows one at a time anyway, so bigger chunks only cost memory
+
+
+def source_meta(dataset_path: str, table: str) -> Dict:
+    csv_path = f"{dataset_path}/{table}.csv"
+    return {'schema': SCHEMAS[table], 'sha256': file_hash(csv_path), **fingerprint(csv_path)}
+
+def is_current(dataset_path: str, sources: Dict[str, Dict]) -> bool:
+    return all(table in sources and is_fresh(f"{dataset_path}/{table}.csv", sources[table], schema) for table, schema in SCHEMAS.items())
+
+def has_stores(store_dir: str) -> bool:
+    return all(os.path.exists(f"{store_dir}/{dataset}/{name}.npy") for dataset in DATASETS for name in ColumnStore._fields)
+
+@timer
+def ingest(dataset_path: str, database_path: str, cache_dir: Optional[str] = None, force: bool = False, store_dir: Optional[str] = None, chunk_rows: int = CHUNK_ROWS) -> bool:
+    # Rebuilds both datasets from scratch when any CSV changed. Menu, MenuPage and Dish are cleaned in
+    # memory, and MenuItem is streamed into both datasets a chunk at a time, as in stream.py.
+    con = connect(database_path)
+
+    if not force and matches_schema(con) and is_current(dataset_path, read_sources(con)) and (store_dir is None or has_stores(store_dir)):
+        close(con)
+        return False
+
+    menu_df, page_df, item_df, dish_df = load_small_tables(dataset_path, cache_dir)
+
+    with transaction(con):
+        for dataset in DATASETS:
+            create_tables(con, dataset)
+
+        menu_flagged_df, dish_flagged_df = add_flag_columns(menu_df, dish_df)
+        for table, df in {'Menu': menu_flagged_df, 'Page': page_df, 'Dish': dish_flagged_df}.items():
+            insert_rows(con, 'dirty', table, df)
+
+        log = ChangeLog() # Tells which menus were in cents, since those are Dollars after cleaning
+        clean_data(menu_df, page_df, item_df, dish_df, log=log)
+        cents_page_ids = menu_page_ids(page_df, cents_menu_ids(log))
+
+        menu_flagged_df, dish_flagged_df = add_flag_columns(menu_df, dish_df)
+        for table, df in {'Menu': menu_flagged_df, 'Page': page_df, 'Dish': dish_flagged_df}.items():
+            insert_rows(con, 'clean', table, df)
+
+        stores: Dict[str, List[ColumnStore]] = { dataset: [column_store(page_df, item_df)] for dataset in DATASETS }
+        with span("stream MenuItem"):
+            for chunk in item_chunks(dataset_path, chunk_rows, list(SCHEMAS['MenuItem'])):
+                for dataset, df in (('dirty', chunk), ('clean', chunk.assign(price=clean_prices(chunk, cents_page_ids)))):
+                    insert_rows(con, dataset, 'Item', df)
+                    if store_dir is not None:
+                        stores[dataset].append(column_store(page_df, df))
+
+        for dataset in DATASETS:
+            create_indexes(con, dataset) # Building indexes after the bulk insert is cheaper than maintaining them
+            if store_dir is not None: # The exported arrays themselves are the one thing held for all of MenuItem
+                write_store(concat_stores(stores.pop(dataset)), f"{store_dir}/{dataset}")
+
+        write_sources(con, { table: source_meta(dataset_path, table) for table in SCHEMAS })
+
+    close(con)
+    return True
+
+@timer
+def main() -> None:
+    parser = ArgumentParser()
+    parser.add_argument('dataset_path', help='Path to the directory of the dataset to run on')
+    parser.add_argument('database_path', help='Path of the SQLite database to create or update')
+    parser.add_argument('--force', action='store_true', help='Rebuild the database even if the CSVs are unchanged')
+    parser.add_argument('--column-store', metavar='DIR', help='Also export the item and page key columns as memory-mappable arrays to DIR')
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS, metavar='N', help=f"Read MenuItem.csv N rows at a time (default: {CHUNK_ROWS:,})")
+    add_cache_arguments(parser)
+    add_workers_argument(parser)
+    args = parser.parse_args()
+    set_workers(args.workers)
+
+    if not ingest(args.dataset_path, args.database_path, resolve_cache_dir(args), args.force, args.column_store, args.chunk_rows):
+        print(f"{args.database_path} is up to date")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+import functools
+import json
+import os
+import resource
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from time import perf_counter, thread_time, time
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import pandas as pd
+
+ENABLED = False # Spans cost nothing but this check unless profiling is enabled
+
+EVENTS: List[Dict[str, Any]] = []
+ORIGIN = perf_counter()
+OPEN: Dict[int, Dict[str, int]] = {} # Memory of the open spans on every thread, by id
+MEMORY_LOCK = threading.Lock()
+
+
+def enable(trace_memory: bool = True) -> None:
+    global ENABLED
+    ENABLED = True
+    EVENTS.clear()
+    if trace_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+def disable() -> None:
+    global ENABLED
+    ENABLED = False
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+def max_rss() -> int:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024 # Linux reports KiB
+
+def rows(value: Any) -> Optional[int]:
+    if isinstance(value, (pd.DataFrame, pd.Series, list)):
+        return len(value)
+    if isinstance(value, tuple) and value and all(isinstance(item, pd.DataFrame) for item in value):
+        return sum(len(item) for item in value)
+    return None
+
+@contextmanager
+def span(name: str, **args: Any) -> Iterator[Dict[str, Any]]:
+    if not ENABLED:
+        yield args
+        return
+
+    # The traced peak is one counter for the whole process, so before a span resets it, every open
+    # span, on any thread, keeps the peak so far. A span's peak is thus the process's peak while it
+    # was open, which includes what other threads allocated meanwhile.
+    tracing = tracemalloc.is_tracing()
+    frame = {'peak': 0, 'current': 0}
+    if tracing:
+        with MEMORY_LOCK:
+            current, peak = tracemalloc.get_traced_memory()
+            for open_frame in OPEN.values():
+                open_frame['peak'] = max(open_frame['peak'], peak)
+            tracemalloc.reset_peak()
+            frame = {'peak': current, 'current': current}
+            OPEN[id(frame)] = frame
+
+    start, cpu_start = perf_counter(), thread_time()
+    try:
+        yield args
+    finally:
+        wall, cpu = perf_counter() - start, thread_time() - cpu_start
+        args.update({'cpu_secs': round(cpu, 6), 'max_rss_bytes': max_rss()})
+        if tracing:
+            with MEMORY_LOCK:
+                del OPEN[id(frame)]
+                peak = max(frame['peak'], tracemalloc.get_traced_memory()[1])
+            args['peak_alloc_bytes'] = max(0, peak - frame['current']) # Other threads may have freed memory since the start
+        EVENTS.append({
+            'name': name, 'ph': 'X', 'pid': os.getpid(), 'tid': threading.get_ident(),
+            'ts': round((start - ORIGIN) * 1e6), 'dur': round(wall * 1e6), 'args': args,
+        })
+
+def timer(func: Callable) -> Callable:
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time()
+        with span(func.__name__) as details:
+            if ENABLED:
+                rows_in = [ count for count in map(rows, args) if count is not None ]
+                details['rows_in'] = sum(rows_in) if rows_in else None
+            value = func(*args, **kwargs)
+            if ENABLED:
+                details['rows_out'] = rows(value)
+        runtime = time() - start
+        print(f"Finished {func.__name__:20} in {(runtime):7.3f} secs")
+        return value
+    return wrapper
+
+def write_trace(path: str) -> None:
+    with open(path, 'w') as f:
+        json.dump({'traceEvents': sorted(EVENTS, key=lambda event: event['ts']), 'displayTimeUnit': 'ms'}, f)
+
+@contextmanager
+def profiling(path: Optional[str], name: str = 'run') -> Iterator[None]:
+    if path is None:
+        yield
+        return
+    enable()
+    try:
+        with span(name):
+            yield
+    finally:
+        disable()
+        write_trace(path)
@@ -1,217 +1,294 @@
-import functools
+import json
 import re
 import sqlite3
-from argparse import ArgumentParser
-from statistics import mean, median
-from time import time
-from typing import Callable, List, Tuple
+from argparse import ArgumentParser, Namespace
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence, Tuple
 
-import matplotlib.pyplot as plt
+import numpy as np
 import pandas as pd
-import seaborn as sns
-from matplotlib_venn import venn3_unweighted
-
-from regex import IS_1900_TO_1909, IS_CUP_OF_COFFEE, IS_DOLLARS, IS_NEW_YORK
-
-
-def remove_leading_and_trailing_whitespace(menu_df: pd.DataFrame, page_df: pd.DataFrame, item_df: pd.DataFrame, dish_df: pd.DataFrame) -> None:
-    menu_df['date'] = menu_df['date'].apply(lambda x: x.strip() if isinstance(x, str) else x)
-    menu_df['call_number'] = menu_df['call_number'].apply(lambda x: x.strip() if isinstance(x, str) else x)
-    menu_df['place'] = menu_df['place'].apply(lambda x: x.strip() if isinstance(x, str) else x)
-    menu_df['currency'] = menu_df['currency'].apply(lambda x: x.strip() if isinstance(x, str) else x)
-    item_df['price'] = item_df['price'].apply(lambda x: x.strip() if isinstance(x, str) else x)
-    dish_df['name'] = dish_df['name'].apply(lambda x: x.strip() if isinstance(x, str) else x)
 
+from cache import read_table
+from changes import ChangeLog, write_log
+from classify import classify
+from colstore import attach, id_array, select_items
+from compact import compact_data
+from database import open_database
+from dates import add_year_columns, between_years, call_number_years
+from dishindex import dish_index, dish_rows, find_names, forget_dish_index
+from instrument import profiling, span, timer
+from partition import set_workers
+from rules import RULES, RuleStats, frame_rule, run_rules, value_rule
+from regions import profile, venn_regions
+from relindex import item_rows
+from typos import build_index, repair_typos
+from regex import IS_CUP_OF_COFFEE, IS_DOLLARS, IS_NEW_YORK
+
+Analysis = Tuple[List[int], int, List[float]] # Menu profile, dish profile, prices
+
+NEW_YORK_TYPOS = build_index(["New York"])
+DOLLARS_TYPOS = build_index(["Dollars"])
+COFFEE_TYPOS = build_index(["Coffee"], protected=["toffee", "coffees", "coffer"])
+
+
+@value_rule(menu=['date', 'call_number', 'place', 'currency'], item=['price'], dish=['name'])
+def remove_leading_and_trailing_whitespace(value: str) -> str:
+    return value.strip()
+
+@frame_rule(reads={'menu': ['date', 'call_number']}, writes={'menu': ['date']})
 def repair_menu_date_from_call_number(menu_df: pd.DataFrame, page_df: pd.DataFrame, item_df: pd.DataFrame, dish_df: pd.DataFrame) -> None:
-    regex = r"^[0-9][0-9][0-9][0-9]-.*"
-    menu_df.loc[menu_df['date'].isna() & menu_df['call_number'].str.contains(regex, na=False), 'date'] = menu_df['call_number'].str[:4]
+    menu_df.loc[menu_df['date'].isna() & call_number_years(menu_df['call_number']).notna(), 'date'] = menu_df['call_number'].str[:4]
 
-def repair_menu_date_outside_expected_range(menu_df: pd.DataFrame, page_df: pd.DataFrame, item_df: pd.DataFrame, dish_df: pd.DataFrame) -> None:
-    menu_df['date'] = menu_df['date'].str.replace(r"^0190", "1900", regex=True) # Typos observed in manual data exploration
-    menu_df['date'] = menu_df['date'].str.replace(r"^1091", "1901", regex=True)
-    menu_df['date'] = menu_df['date'].str.replace(r"^2928", "1928", regex=True)
+@value_rule(menu=['date'])
+def repair_menu_date_outside_expected_range(value: str) -> str:
+    value = re.sub(r"^0190", "1900", value) # Typos observed in manual data exploration
+    value = re.sub(r"^1091", "1901", value)
+    value = re.sub(r"^2928", "1928", value)
+    return value
 
-def repair_menu_place_new_york_spelling(menu_df: pd.DataFrame, page_df: pd.DataFrame, item_df: pd.DataFrame, dish_df: pd.DataFrame) -> None:
-    regex = r"(?i)enw york|nwe york|ne wyork|newy ork|new yrok|new yokr|\bew york|nw york|ne york|newyork|new ork|new yrk|new yok|new yor\b|[^n]ew york|n[^e]w york|ne[^w] york|new[^ ]york|new [^y]ork|new y[^o]rk|new yo[^r]k|new yor[^k]"
-    menu_df['place'] = menu_df['place'].str.replace(regex, 'New York', regex=True)
+@value_rule(menu=['place'])
+def repair_menu_place_new_york_spelling(value: str) -> str:
+    return repair_typos(value, NEW_YORK_TYPOS)
 
-def repair_menu_currency_dollars_spelling(menu_df: pd.DataFrame, page_df: pd.DataFrame, item_df: pd.DataFrame, dish_df: pd.DataFrame) -> None:
-    regex = r"(?i)^(?:odllars|dlolars|dolalrs|dollras|dollasr|ollars|dllars|dolars|dollrs|dollas|dollar|[^d]ollars|d[^o]llars|do[^l]lars|dol[^l]ars|doll[^a]rs|dolla[^r]s|dollar[^s])$"
-    menu_df['currency'] = menu_df['currency'].str.replace(regex, 'Dollars', regex=True)
+@value_rule(menu=['currency'])
+def repair_menu_currency_dollars_spelling(value: str) -> str:
+    return repair_typos(value, DOLLARS_TYPOS, whole=True)
 
+@frame_rule(reads={'menu': ['id', 'currency'], 'page': ['id', 'menu_id'], 'item': ['menu_page_id', 'price']}, writes={'menu': ['currency'], 'item': ['price']})
 def repair_menu_currency_convert_cents_to_dollars(menu_df: pd.DataFrame, page_df: pd.DataFrame, item_df: pd.DataFrame, dish_df: pd.DataFrame) -> None:
-    menu_ids = menu_df.loc[menu_df['currency'] == 'Cents', 'id']
+    menu_ids = id_array(menu_df.loc[menu_df['currency'] == 'Cents', 'id'])
     menu_df.loc[menu_df['currency'] == 'Cents', 'currency'] = "Dollars"
-    page_ids = page_df.loc[page_df['menu_id'].isin(menu_ids), 'id']
-    item_df.loc[item_df['menu_page_id'].isin(page_ids) & item_df['price'].notnull(), 'price'] /= 100
-
-def repair_dish_name_coffee_spelling(menu_df: pd.DataFrame, page_df: pd.DataFrame, item_df: pd.DataFrame, dish_df: pd.DataFrame) -> None:
-    regex = r"(?i)\b(?:ocffee|cfofee|cofefe|offee|cffee|cofee|coffe|[^ct]offee|c[^o]ffee|co[^f]fee|cof[^f]ee|coff[^e]e|coffe[^e])\b"
-    dish_df['name'] = dish_df['name'].str.replace(regex, 'Coffee', regex=True)
-
-def timer(func: Callable) -> Callable:
-    @functools.wraps(func)
-    def wrapper(*args, **kwargs):
-        start = time()
-        value = func(*args, **kwargs)
-        runtime = time() - start
-        print(f"Finished {func.__name__:20} in {(runtime):7.3f} secs")
-        return value
-    return wrapper
+    rows = item_rows(page_df, item_df, menu_ids)
+    item_df.loc[item_df.index[rows[item_df['price'].iloc[rows].notnull().to_numpy()]], 'price'] /= 100
+
+@value_rule(dish=['name'])
+def repair_dish_name_coffee_spelling(value: str) -> str:
+    return repair_typos(value, COFFEE_TYPOS)
+
+def add_cache_arguments(parser: ArgumentParser) -> None:
+    parser.add_argument('--cache-dir', help='Directory of the columnar table cache (default: DATASET_PATH/.cache)')
+    parser.add_argument('--no-cache', action='store_true', help='Always parse the CSVs and skip the table cache')
+
+def resolve_cache_dir(args: Namespace) -> Optional[str]:
+    if args.no_cache:
+        return None
+    return args.cache_dir or f"{args.dataset_path}/.cache"
+
+def add_engine_argument(parser: ArgumentParser) -> None:
+    parser.add_argument('--engine', choices=['sqlite', 'native'], default='native', help='Query backend (default: native)')
+
+def add_workers_argument(parser: ArgumentParser) -> None:
+    parser.add_argument('--workers', type=int, default=1, metavar='N', help='Split the string cleaning and matching of large tables across N processes (default: 1)')
+
+def add_profile_argument(parser: ArgumentParser) -> None:
+    parser.add_argument('--profile', metavar='PATH', help='Write a Chrome trace of the nested stage timings, CPU time and memory to PATH')
+
+def add_report_arguments(parser: ArgumentParser, parallel: bool = False) -> None:
+    parser.add_argument('--no-plots', action='store_true', help='Skip the figures and the plotting libraries entirely')
+    parser.add_argument('--json-out', metavar='PATH', help='Write the numeric results as JSON to PATH')
+    if parallel:
+        parser.add_argument('--parallel-plots', action='store_true', help='Render the figures concurrently in worker processes')
+
+def save_json(path: str, results: Dict[str, Any]) -> None:
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2)
+
+def add_compact_argument(parser: ArgumentParser) -> None:
+    parser.add_argument('--compact', action='store_true', help='Store repetitive strings as categoricals and ids as narrow integers')
 
 @timer
-def load_data(dataset_path: str) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame, pd.DataFrame]:
-    menu_df = pd.read_csv(f"{dataset_path}/Menu.csv")
-    page_df = pd.read_csv(f"{dataset_path}/MenuPage.csv")
-    item_df = pd.read_csv(f"{dataset_path}/MenuItem.csv")
-    dish_df = pd.read_csv(f"{dataset_path}/Dish.csv")
+def compact(menu_df: pd.DataFrame, page_df: pd.DataFrame, item_df: pd.DataFrame, dish_df: pd.DataFrame) -> None:
+    for report in compact_data(menu_df, page_df, item_df, dish_df):
+        print(f"  Compacted {report.table:5} from {report.before / 2**20:8.1f} MiB to {report.after / 2**20:8.1f} MiB")
+
+@timer
+def load_data(dataset_path: str, cache_dir: Optional[str] = None) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    with span("read Menu"):
+        menu_df = read_table(dataset_path, 'Menu', cache_dir)
+    with span("read MenuPage"):
+        page_df = read_table(dataset_path, 'MenuPage', cache_dir)
+    with span("read MenuItem"):
+        item_df = read_table(dataset_path, 'MenuItem', cache_dir)
+    with span("read Dish"):
+        dish_df = read_table(dataset_path, 'Dish', cache_dir)
     return menu_df, page_df, item_df, dish_df
 
 @timer
 def profile_menu_data(menu_df: pd.DataFrame) -> List[int]:
-    place_ny         =  menu_df['place']   .str.contains(IS_NEW_YORK,     na=False)
-    date_1900s       =  menu_df['date']    .str.contains(IS_1900_TO_1909, na=False)
-    currency_dollars =  menu_df['currency'].str.contains(IS_DOLLARS,      na=False)
-
-    return [
-        menu_df[ place_ny & ~date_1900s & ~currency_dollars]['id'].size,
-        menu_df[~place_ny &  date_1900s & ~currency_dollars]['id'].size,
-        menu_df[ place_ny &  date_1900s & ~currency_dollars]['id'].size,
-        menu_df[~place_ny & ~date_1900s &  currency_dollars]['id'].size,
-        menu_df[ place_ny & ~date_1900s &  currency_dollars]['id'].size,
-        menu_df[~place_ny &  date_1900s &  currency_dollars]['id'].size,
-        menu_df[ place_ny &  date_1900s &  currency_dollars]['id'].size
-    ]
+    place_ny         =  classify(menu_df['place'],    IS_NEW_YORK)
+    date_1900s       =  between_years(menu_df, 1900, 1909)
+    currency_dollars =  classify(menu_df['currency'], IS_DOLLARS)
 
-@timer
-def profile_dish_data(dish_df: pd.DataFrame) -> int:
-    return dish_df[dish_df['name'].str.contains(IS_CUP_OF_COFFEE, na=False)]['id'].size
+    counts = profile([menu_df['place'], menu_df['date'], menu_df['currency']], [place_ny, date_1900s, currency_dollars])
+    return venn_regions(counts)
 
 @timer
-def query_data(menu_df: pd.DataFrame, page_df: pd.DataFrame, item_df: pd.DataFrame, dish_df: pd.DataFrame) -> List[float]:
-    def regexp(expr, item):
-        regex = re.compile(expr, re.IGNORECASE)
-        return bool(regex.search(item))
-
-    con = sqlite3.connect(":memory:")
-    con.create_function("REGEXP", 2, regexp)
-    cur = con.cursor()
+def profile_dish_data(dish_df: pd.DataFrame) -> int:
+    index = dish_index(dish_df)
+    return len(dish_rows(index, find_names(index, pattern=IS_CUP_OF_COFFEE)))
 
-    menu_df.to_sql("Menu", con, if_exists='replace', index=False, method='multi', chunksize=10_000)
-    page_df.to_sql("Page", con, if_exists='replace', index=False, method='multi', chunksize=10_000)
-    item_df.to_sql("Item", con, if_exists='replace', index=False, method='multi', chunksize=10_000)
-    dish_df.to_sql("Dish", con, if_exists='replace', index=False, method='multi', chunksize=10_000)
+def add_flag_columns(menu_df: pd.DataFrame, dish_df: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    menu_df = add_year_columns(menu_df).assign(place_is_new_york=classify(menu_df['place'], IS_NEW_YORK))
+    dish_df = dish_df.assign(name_is_cup_of_coffee=classify(dish_df['name'], IS_CUP_OF_COFFEE))
+    return menu_df, dish_df
 
-    results = cur.execute("""
+def query_prices(con: sqlite3.Connection) -> List[float]:
+    results = con.execute("""
         SELECT price FROM item
         WHERE menu_page_id IN (
             SELECT id FROM page
             WHERE menu_id IN (
                 SELECT id FROM menu
-                WHERE menu.place IS NOT NULL AND menu.place REGEXP ?
-                AND date BETWEEN 1900 AND 1909
+                WHERE place_is_new_york = 1
+                AND year BETWEEN 1900 AND 1909
                 AND currency = "Dollars"))
-        AND dish_id IN (SELECT id FROM dish WHERE dish.name IS NOT NULL AND dish.name REGEXP ?)
+        AND dish_id IN (SELECT id FROM dish WHERE name_is_cup_of_coffee = 1)
         AND price IS NOT NULL
-        AND price < 1;
-        """, [IS_NEW_YORK, IS_CUP_OF_COFFEE]).fetchall()
+        AND price < 1
+        ORDER BY rowid;
+        """).fetchall()
+
+    return [ result[0] for result in results ]
+
+def query_data_sqlite(menu_df: pd.DataFrame, page_df: pd.DataFrame, item_df: pd.DataFrame, dish_df: pd.DataFrame) -> List[float]:
+    con = sqlite3.connect(":memory:")
+
+    menu_df, dish_df = add_flag_columns(menu_df, dish_df)
+
+    with span("to_sql"):
+        menu_df.to_sql("Menu", con, if_exists='replace', index=False, method='multi', chunksize=10_000)
+        page_df.to_sql("Page", con, if_exists='replace', index=False, method='multi', chunksize=10_000)
+        item_df.to_sql("Item", con, if_exists='replace', index=False, method='multi', chunksize=10_000)
+        dish_df.to_sql("Dish", con, if_exists='replace', index=False, method='multi', chunksize=10_000)
+
+    with span("query"):
+        prices = query_prices(con)
 
     con.close()
 
-    prices = [ result[0] for result in results ]
+    return prices
+
+def select_keys(menu_df: pd.DataFrame, dish_df: pd.DataFrame, place: str = IS_NEW_YORK, low: int = 1900, high: int = 1909, currency: Optional[str] = "Dollars", dish: str = IS_CUP_OF_COFFEE,
+                words: Sequence[str] = (), exclude: Sequence[str] = ()) -> Tuple[np.ndarray, np.ndarray]:
+    menus = classify(menu_df['place'], place) & between_years(menu_df, low, high)
+    if currency is not None:
+        menus &= menu_df['currency'] == currency
+    index = dish_index(dish_df)
+    return id_array(menu_df.loc[menus, 'id']), id_array(dish_df['id'].iloc[dish_rows(index, find_names(index, words, exclude, dish))])
+
+def select_prices(menu_df: pd.DataFrame, page_df: pd.DataFrame, item_df: pd.DataFrame, dish_df: pd.DataFrame,
+                  place: str = IS_NEW_YORK, low: int = 1900, high: int = 1909, currency: Optional[str] = "Dollars", dish: str = IS_CUP_OF_COFFEE, max_price: Optional[float] = 1,
+                  words: Sequence[str] = (), exclude: Sequence[str] = ()) -> pd.Series:
+    menu_ids, dish_ids = select_keys(menu_df, dish_df, place, low, high, currency, dish, words, exclude)
+    rows = item_rows(page_df, item_df, menu_ids, dish_ids)
+
+    prices = item_df['price'].iloc[rows]
+    prices = prices[prices.notnull() if max_price is None else prices < max_price]
 
     return prices
 
+def query_data_native(menu_df: pd.DataFrame, page_df: pd.DataFrame, item_df: pd.DataFrame, dish_df: pd.DataFrame) -> List[float]:
+    return select_prices(menu_df, page_df, item_df, dish_df).tolist()
+
 @timer
-def clean_data(menu_df: pd.DataFrame, page_df: pd.DataFrame, item_df: pd.DataFrame, dish_df: pd.DataFrame) -> None:
-    cleaning_routines = [
-        remove_leading_and_trailing_whitespace,
-        repair_menu_date_from_call_number,
-        repair_menu_date_outside_expected_range,
-        repair_menu_place_new_york_spelling,
-        repair_menu_currency_dollars_spelling,
-        repair_menu_currency_convert_cents_to_dollars,
-        repair_dish_name_coffee_spelling,
-    ]
-
-    for cleaning_routine in cleaning_routines:
-        cleaning_routine(menu_df, page_df, item_df, dish_df)
+def query_data(menu_df: pd.DataFrame, page_df: pd.DataFrame, item_df: pd.DataFrame, dish_df: pd.DataFrame, engine: str = 'native') -> List[float]:
+    engines = {'sqlite': query_data_sqlite, 'native': query_data_native}
+    return engines[engine](menu_df, page_df, item_df, dish_df)
 
 @timer
-def save_menu_profile(dirty: List[int], clean: List[int]) -> None:
-    labels = ["New York", "1900 - 1909", "Dollars"]
-    colors = ['teal', 'purple', 'blue']
-    sns.set_theme()
-    plt.figure(figsize=(10, 4))
-    plt.subplot(1, 2, 1)
-    venn3_unweighted(subsets=dirty, set_labels=labels, set_colors=colors)
-    plt.title("Menus With Target Values (dirty data)")
-    plt.subplot(1, 2, 2)
-    venn3_unweighted(subsets=clean, set_labels=labels, set_colors=colors)
-    plt.title("Menus With Target Values (clean data)")
-    plt.tight_layout()
-    plt.savefig("doc/menu-venn-diagram.png", bbox_inches='tight')
-    plt.close()
+def query_database(database_path: str, dataset: str) -> List[float]:
+    con = open_database(database_path, dataset)
+    prices = query_prices(con)
+    con.close()
+    return prices
 
 @timer
-def save_dish_profile(dirty: int, clean: int) -> None:
-    sns.set_theme()
-    plt.bar(x=['Dirty Data', 'Clean Data'], height=[dirty, clean], alpha=0.75)
-    plt.title('Dishes Matching the "is_cup_of_coffee" Regex')
-    plt.savefig("doc/dish-name-coffee-bar-chart.png", bbox_inches='tight')
-    plt.close()
+def query_column_store(store_dir: str, dataset: str, menu_df: pd.DataFrame, dish_df: pd.DataFrame) -> List[float]:
+    store = attach(f"{store_dir}/{dataset}")
+    return store.item_price[select_items(store, *select_keys(menu_df, dish_df), max_price=1)].tolist()
 
 @timer
-def save_query_result(dirty: List[float], clean: List[float]) -> None:
-    width = 5
-    bins = [ x / 100 for x in range(0, int(max(dirty + clean) * 100) + width, width)]
-    sns.set_theme()
-    plt.hist([dirty, clean], bins=bins, color=['r','b'], alpha=0.75)
-    plt.title("Price of a Cup of Coffee in New York State (1900 - 1909)")
-    plt.xlabel("Price ($)")
-    plt.ylabel("Menu Appearances (count)")
-    plt.legend(loc="upper right", labels=['Dirty', 'Clean'])
-    plt.axvline(mean(dirty),   color='r', linestyle='dashed', linewidth=1, alpha=0.75)
-    plt.axvline(median(dirty), color='r', linestyle='dashed', linewidth=1, alpha=0.75)
-    plt.axvline(mean(clean),   color='b', linestyle='dashed', linewidth=1, alpha=0.75)
-    plt.axvline(median(clean), color='b', linestyle='dashed', linewidth=1, alpha=0.75)
-    x = max([mean(dirty), median(dirty), mean(clean), median(clean)]) * 1.7
-    _, y = plt.ylim()
-    font = plt.rcParams['font.family']
-    plt.rcParams['font.family'] = 'monospace'
-    plt.text(x, y * 0.90, f"Count:  {len(dirty):4}",      color='r', alpha=0.75)
-    plt.text(x, y * 0.85, f"Max:    {max(dirty):.2f}",    color='r', alpha=0.75)
-    plt.text(x, y * 0.80, f"Mean:   {mean(dirty):.2f}",   color='r', alpha=0.75)
-    plt.text(x, y * 0.75, f"Median: {median(dirty):.2f}", color='r', alpha=0.75)
-    plt.text(x, y * 0.65, f"Count:  {len(clean):4}",      color='b', alpha=0.75)
-    plt.text(x, y * 0.60, f"Max:    {max(clean):.2f}",    color='b', alpha=0.75)
-    plt.text(x, y * 0.55, f"Mean:   {mean(clean):.2f}",   color='b', alpha=0.75)
-    plt.text(x, y * 0.50, f"Median: {median(clean):.2f}", color='b', alpha=0.75)
-    plt.rcParams['font.family'] = font
-    plt.savefig("doc/coffee-price-histogram.png", bbox_inches='tight')
-    plt.close()
+def clean_data(menu_df: pd.DataFrame, page_df: pd.DataFrame, item_df: pd.DataFrame, dish_df: pd.DataFrame, parallel: bool = True, log: Optional[ChangeLog] = None) -> List[RuleStats]:
+    stats = run_rules(RULES, {'menu': menu_df, 'page': page_df, 'item': item_df, 'dish': dish_df}, parallel, log)
+    forget_dish_index(dish_df)
+
+    for stat in stats:
+        print(f"  Applied {stat.rule:45} in {stat.seconds:7.3f} secs ({stat.cells} cells)")
+
+    return stats
+
+def analyze_data(menu_df: pd.DataFrame, page_df: pd.DataFrame, item_df: pd.DataFrame, dish_df: pd.DataFrame, dataset: str, engine: str = 'native', database: Optional[str] = None, column_store: Optional[str] = None) -> Analysis:
+    with span(f"analyze {dataset}"):
+        menu_df = add_year_columns(menu_df) # Parse the dates once for both the profile and the query
+        menu_profile = profile_menu_data(menu_df)
+        dish_profile = profile_dish_data(dish_df)
+        if database is not None:
+            prices = query_database(database, dataset)
+        elif column_store is not None:
+            prices = query_column_store(column_store, dataset, menu_df, dish_df)
+        else:
+            prices = query_data(menu_df, page_df, item_df, dish_df, engine)
+    return menu_profile, dish_profile, prices
+
+def clean_and_analyze_data(menu_df: pd.DataFrame, page_df: pd.DataFrame, item_df: pd.DataFrame, dish_df: pd.DataFrame, engine: str = 'native', database: Optional[str] = None, log: Optional[ChangeLog] = None, column_store: Optional[str] = None) -> Analysis:
+    clean_data(menu_df, page_df, item_df, dish_df, log=log)
+    return analyze_data(menu_df, page_df, item_df, dish_df, 'clean', engine, database, column_store)
+
+@timer
+def analyze_data_concurrently(menu_df: pd.DataFrame, page_df: pd.DataFrame, item_df: pd.DataFrame, dish_df: pd.DataFrame, engine: str = 'native', database: Optional[str] = None, log: Optional[ChangeLog] = None, column_store: Optional[str] = None) -> Tuple[Analysis, Analysis]:
+    with pd.option_context('mode.copy_on_write', True): # Cleaning copies only the columns it modifies out from under the dirty snapshot
+        dirty_menu_df, dirty_page_df, dirty_item_df, dirty_dish_df = ( df.copy(deep=False) for df in (menu_df, page_df, item_df, dish_df) )
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            dirty = executor.submit(analyze_data, dirty_menu_df, dirty_page_df, dirty_item_df, dirty_dish_df, 'dirty', engine, database, column_store)
+            clean = executor.submit(clean_and_analyze_data, menu_df, page_df, item_df, dish_df, engine, database, log, column_store)
+            return dirty.result(), clean.result()
 
 @timer
 def main() -> None:
     parser = ArgumentParser()
     parser.add_argument('dataset_path', help='Path to the directory of the dataset to run on')
+    add_cache_arguments(parser)
+    add_engine_argument(parser)
+    parser.add_argument('--database', help='Query this database built by src/ingest.py instead of the loaded tables')
+    parser.add_argument('--column-store', metavar='DIR', help='Join over the memory-mapped item and page arrays exported by src/ingest.py --column-store')
+    add_compact_argument(parser)
+    add_workers_argument(parser)
+    parser.add_argument('--concurrent', action='store_true', help='Analyze the dirty data while cleaning and analyzing the clean data')
+    parser.add_argument('--change-log', metavar='DIR', help='Write every cell changed by the cleaning rules to Parquet files in DIR')
+    add_profile_argument(parser)
+    add_report_arguments(parser, parallel=True)
     args = parser.parse_args()
+    set_workers(args.workers)
+
+    with profiling(args.profile):
+        menu_df, page_df, item_df, dish_df = load_data(args.dataset_path, resolve_cache_dir(args))
+
+        if args.compact:
+            compact(menu_df, page_df, item_df, dish_df)
+
+        log = ChangeLog() if args.change_log else None
 
-    menu_df, page_df, item_df, dish_df = load_data(args.dataset_path)
+        if args.concurrent:
+            dirty, clean = analyze_data_concurrently(menu_df, page_df, item_df, dish_df, args.engine, args.database, log, args.column_store)
+        else:
+            dirty = analyze_data(menu_df, page_df, item_df, dish_df, 'dirty', args.engine, args.database, args.column_store)
+            clean = clean_and_analyze_data(menu_df, page_df, item_df, dish_df, args.engine, args.database, log, args.column_store)
 
-    menu_profile_dirty = profile_menu_data(menu_df)
-    dish_profile_dirty = profile_dish_data(dish_df)
-    prices_dirty = query_data(menu_df, page_df, item_df, dish_df)
+        if log is not None:
+            write_log(log, args.change_log)
 
-    clean_data(menu_df, page_df, item_df, dish_df)
+        menu_profile_dirty, dish_profile_dirty, prices_dirty = dirty
+        menu_profile_clean, dish_profile_clean, prices_clean = clean
 
-    menu_profile_clean = profile_menu_data(menu_df)
-    dish_profile_clean = profile_dish_data(dish_df)
-    prices_clean = query_data(menu_df, page_df, item_df, dish_df)
+        if args.json_out:
+            save_json(args.json_out, {
+                'dirty': {'menu_profile': menu_profile_dirty, 'dish_profile': dish_profile_dirty, 'prices': prices_dirty},
+                'clean': {'menu_profile': menu_profile_clean, 'dish_profile': dish_profile_clean, 'prices': prices_clean},
+            })
 
-    save_menu_profile(menu_profile_dirty, menu_profile_clean)
-    save_dish_profile(dish_profile_dirty, dish_profile_clean)
-    save_query_result(prices_dirty, prices_clean)
+        if not args.no_plots:
+            from report import save_reports # Importing the plotting libraries is slow, so only plotting runs pay for it
+            save_reports(menu_profile_dirty, menu_profile_clean, dish_profile_dirty, dish_profile_clean, prices_dirty, prices_clean, args.parallel_plots)
 
 
 if __name__ == "__main__":
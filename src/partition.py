@@ -0,0 +1,100 @@
+import importlib
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+from typing import Callable, Hashable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+WORKERS = 1 # Processes for the string stages. With 1, everything runs in this process.
+MIN_VALUES = 20_000 # Fewer distinct values than this cost more to ship to the workers than to process here
+
+EXECUTOR: Optional[ProcessPoolExecutor] = None
+LOCK = threading.Lock() # Rules on different tables run on separate threads and share the pool
+
+
+def set_workers(workers: int) -> None:
+    global WORKERS, EXECUTOR
+    with LOCK:
+        if EXECUTOR is not None and workers != WORKERS:
+            EXECUTOR.shutdown()
+            EXECUTOR = None
+        WORKERS = max(1, workers)
+
+def rule_modules() -> List[str]:
+    # The modules that register the rules. Rules defined in the script this process runs need no
+    # import, as each worker imports that script itself on start.
+    from rules import RULES # rules applies its transforms through this module
+    return sorted({ rule.function.__module__ for rule in RULES } - {'__main__'})
+
+def import_modules(modules: Sequence[str]) -> None:
+    for module in modules:
+        importlib.import_module(module)
+
+def process_pool(workers: int, modules: Sequence[str] = ()) -> ProcessPoolExecutor:
+    # Every process pool forks its workers from one fork server rather than from this process,
+    # which may be running other threads. Each worker imports modules before its first task. The
+    # fork server imports them too if it is not running yet, so that the workers start with them,
+    # but on Python 3.11 it only finds installed packages, not the modules beside the script.
+    context = get_context('forkserver')
+    context.set_forkserver_preload(['numpy', 'pandas', *modules])
+    return ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=import_modules, initargs=(list(modules),))
+
+def executor() -> ProcessPoolExecutor:
+    # Started on first use and kept for the rest of the run
+    global EXECUTOR
+    with LOCK:
+        if EXECUTOR is None:
+            EXECUTOR = process_pool(WORKERS, rule_modules()) # Registers the same rules in each worker
+        return EXECUTOR
+
+def ranges(count: int, parts: int) -> List[Tuple[int, int]]:
+    bounds = np.linspace(0, count, parts + 1).astype(int)
+    return [ (int(start), int(end)) for start, end in zip(bounds[:-1], bounds[1:]) if end > start ]
+
+def partitioned(count: int) -> bool:
+    return WORKERS > 1 and count >= MIN_VALUES
+
+def find_transform(name: str) -> Callable[[str], str]:
+    from rules import RULES
+    return next( rule.transform for rule in RULES if rule.name == name and rule.transform is not None )
+
+def transform_range(name: str, values: Sequence[Hashable]) -> List[Hashable]:
+    transform = find_transform(name)
+    return [ transform(value) if isinstance(value, str) else value for value in values ]
+
+def transform_values(name: str, transform: Callable[[str], str], values: List[Hashable]) -> List[Hashable]:
+    # Applies a value rule to each value, splitting the values across the workers and reassembling
+    # the results in order. Rules are sent by name, not pickled.
+    if not partitioned(len(values)):
+        return [ transform(value) if isinstance(value, str) else value for value in values ]
+
+    futures = [ executor().submit(transform_range, name, values[start:end]) for start, end in ranges(len(values), WORKERS) ]
+    return [ value for future in futures for value in future.result() ]
+
+def match_range(pattern: str, values: Sequence[Hashable], memory: str, start: int) -> None:
+    regex = re.compile(pattern)
+    shared = SharedMemory(memory)
+    try:
+        np.ndarray(len(values), dtype=bool, buffer=shared.buf, offset=start)[:] = [ isinstance(value, str) and regex.search(value) is not None for value in values ]
+    finally:
+        shared.close()
+
+def match_values(pattern: str, values: List[Hashable]) -> np.ndarray:
+    # Whether each value matches pattern. The workers write their ranges straight into one shared
+    # result array, so only the values travel between processes.
+    if not partitioned(len(values)):
+        regex = re.compile(pattern)
+        return np.fromiter((isinstance(value, str) and regex.search(value) is not None for value in values), dtype=bool, count=len(values))
+
+    shared = SharedMemory(create=True, size=len(values))
+    try:
+        futures = [ executor().submit(match_range, pattern, values[start:end], shared.name, start) for start, end in ranges(len(values), WORKERS) ]
+        for future in futures:
+            future.result()
+        return np.ndarray(len(values), dtype=bool, buffer=shared.buf).copy()
+    finally:
+        shared.close()
+        shared.unlink()
@@ -0,0 +1,34 @@
+from typing import List
+
+import numpy as np
+import pandas as pd
+
+TARGET, OTHER, MISSING = 0, 1, 2 # The class of an attribute value
+CLASSES = 3
+
+
+def attribute_classes(values: pd.Series, target: pd.Series) -> np.ndarray:
+    classes = np.where(values.isna().to_numpy(), MISSING, OTHER).astype(np.int64)
+    classes[target.to_numpy(dtype=bool)] = TARGET
+    return classes
+
+def profile(values: List[pd.Series], targets: List[pd.Series]) -> np.ndarray:
+    # Count the rows in every combination of attribute classes in one pass. Each row's classes are
+    # packed into one base-3 code, so the result has one axis of size 3 per attribute, in order.
+    codes = np.zeros(len(values[0]) if values else 0, dtype=np.int64)
+    for column, target in zip(values, targets):
+        codes = codes * CLASSES + attribute_classes(column, target)
+    return np.bincount(codes, minlength=CLASSES ** len(values)).reshape((CLASSES,) * len(values))
+
+def marginals(counts: np.ndarray) -> List[np.ndarray]:
+    # Target, other and missing counts of each attribute
+    return [ counts.sum(axis=tuple(other for other in range(counts.ndim) if other != axis)) for axis in range(counts.ndim) ]
+
+def venn_regions(counts: np.ndarray) -> List[int]:
+    # Rows per combination of attributes on target, in Venn diagram order: region r holds the rows
+    # whose attribute i is on target exactly when bit i of r is set. Rows on target for no
+    # attribute (region 0) are left out.
+    on_target = counts
+    for axis in range(counts.ndim):
+        on_target = np.stack([on_target.take(TARGET, axis), on_target.take(OTHER, axis) + on_target.take(MISSING, axis)], axis=axis)
+    return [ int(on_target[tuple(0 if region >> axis & 1 else 1 for axis in range(counts.ndim))]) for region in range(1, 2 ** counts.ndim) ]
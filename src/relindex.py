@@ -0,0 +1,100 @@
+import weakref
+from typing import Dict, NamedTuple, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from colstore import MISSING_ID, id_array, is_in, menu_items
+
+
+class Children(NamedTuple):
+    # CSR index from parent ids to child rows: the rows of the children of keys[i] are
+    # rows[offsets[i]:offsets[i + 1]]
+    keys: np.ndarray
+    offsets: np.ndarray
+    rows: np.ndarray
+
+class RelationIndex(NamedTuple):
+    page_ids: np.ndarray # MenuPage id by row
+    menu_pages: Children # Menu id to MenuPage rows
+    page_items: Children # MenuPage id to MenuItem rows
+    dish_items: Children # Dish id to MenuItem rows
+
+
+INDEXES: Dict[Tuple[int, int], Tuple[weakref.ref, weakref.ref, RelationIndex]] = {} # By the ids of the page and item frames
+
+
+def children(parent_ids: np.ndarray) -> Children:
+    order = np.argsort(parent_ids, kind='stable')
+    order = order[parent_ids[order] >= 0] # Rows without a parent belong to no key
+    keys, starts = np.unique(parent_ids[order], return_index=True)
+    return Children(keys, np.append(starts, len(order)), order)
+
+def lookup(index: Children, ids: np.ndarray) -> np.ndarray:
+    # Rows of the children of ids, in time proportional to the number of ids and rows found
+    positions = np.searchsorted(index.keys, ids)
+    found = positions < len(index.keys)
+    found[found] = index.keys[positions[found]] == ids[found]
+    starts, ends = index.offsets[positions[found]], index.offsets[positions[found] + 1]
+    lengths = ends - starts
+    shifts = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths) # Concatenate the ranges without a Python loop
+    return index.rows[np.arange(len(shifts)) + shifts]
+
+def parent_rows(parent_ids: np.ndarray, ids: np.ndarray) -> np.ndarray:
+    # Row of each id among parent_ids, or -1 when no parent has it
+    if len(parent_ids) == 0:
+        return np.full(len(ids), -1)
+    order = np.argsort(parent_ids, kind='stable')
+    positions = np.minimum(np.searchsorted(parent_ids[order], ids), len(order) - 1)
+    return np.where((parent_ids[order[positions]] == ids) & (ids >= 0), order[positions], -1)
+
+def build_relation_index(page_df: pd.DataFrame, item_df: pd.DataFrame) -> RelationIndex:
+    page_ids = id_array(page_df['id'])
+    return RelationIndex(
+        page_ids=page_ids,
+        menu_pages=children(id_array(page_df['menu_id'])),
+        page_items=children(id_array(item_df['menu_page_id'])),
+        dish_items=children(id_array(item_df['dish_id']) if 'dish_id' in item_df.columns else np.full(len(item_df), MISSING_ID)),
+    )
+
+def built_index(page_df: pd.DataFrame, item_df: pd.DataFrame) -> Optional[RelationIndex]:
+    key = (id(page_df), id(item_df))
+    if key in INDEXES:
+        page_ref, item_ref, index = INDEXES[key]
+        if page_ref() is page_df and item_ref() is item_df:
+            return index
+    return None
+
+def relation_index(page_df: pd.DataFrame, item_df: pd.DataFrame) -> RelationIndex:
+    # Built once per pair of tables and kept while they live. Only the server builds one, after
+    # cleaning, since it looks up the same tables for every query. Cleaning never changes ids or
+    # reorders rows, so an index would also stay valid if its tables were cleaned later.
+    index = built_index(page_df, item_df)
+    if index is not None:
+        return index
+
+    key = (id(page_df), id(item_df))
+    index = build_relation_index(page_df, item_df)
+    INDEXES[key] = (weakref.ref(page_df, lambda _: INDEXES.pop(key, None)), weakref.ref(item_df, lambda _: INDEXES.pop(key, None)), index)
+    return index
+
+def menu_item_rows(index: RelationIndex, menu_ids: np.ndarray) -> np.ndarray:
+    return np.unique(lookup(index.page_items, index.page_ids[lookup(index.menu_pages, menu_ids)]))
+
+def dish_item_rows(index: RelationIndex, dish_ids: np.ndarray) -> np.ndarray:
+    return np.unique(lookup(index.dish_items, dish_ids))
+
+def item_rows(page_df: pd.DataFrame, item_df: pd.DataFrame, menu_ids: np.ndarray, dish_ids: Optional[np.ndarray] = None) -> np.ndarray:
+    # Rows of the items on the menus menu_ids, and of the dishes dish_ids if given. Goes through the
+    # relation index if one was built for these tables, and scans the id columns otherwise.
+    # Cleaning and the one-off queries of main.py and incremental.py look up once or twice per
+    # run, and a build costs several scans, so they scan.
+    index = built_index(page_df, item_df)
+    if index is not None:
+        rows = menu_item_rows(index, menu_ids)
+        return rows if dish_ids is None else np.intersect1d(rows, dish_item_rows(index, dish_ids), assume_unique=True)
+
+    items = menu_items(id_array(page_df['id']), id_array(page_df['menu_id']), id_array(item_df['menu_page_id']), menu_ids)
+    if dish_ids is not None:
+        items &= is_in(id_array(item_df['dish_id']), dish_ids)
+    return np.flatnonzero(items)
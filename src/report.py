@@ -0,0 +1,117 @@
+from typing import List, Tuple
+
+import matplotlib
+matplotlib.use('Agg') # Render to files only, so nothing blocks on a display
+
+import matplotlib.pyplot as plt
+import pandas as pd
+import seaborn as sns
+from matplotlib_venn import venn3_unweighted
+
+from instrument import timer
+from partition import process_pool
+from sketch import Prices, summarize
+
+
+@timer
+def save_menu_profile(dirty: List[int], clean: List[int]) -> None:
+    labels = ["New York", "1900 - 1909", "Dollars"]
+    colors = ['teal', 'purple', 'blue']
+    sns.set_theme()
+    plt.figure(figsize=(10, 4))
+    plt.subplot(1, 2, 1)
+    venn3_unweighted(subsets=dirty, set_labels=labels, set_colors=colors)
+    plt.title("Menus With Target Values (dirty data)")
+    plt.subplot(1, 2, 2)
+    venn3_unweighted(subsets=clean, set_labels=labels, set_colors=colors)
+    plt.title("Menus With Target Values (clean data)")
+    plt.tight_layout()
+    plt.savefig("doc/menu-venn-diagram.png", bbox_inches='tight')
+    plt.close()
+
+@timer
+def save_dish_profile(dirty: int, clean: int) -> None:
+    sns.set_theme()
+    plt.bar(x=['Dirty Data', 'Clean Data'], height=[dirty, clean], alpha=0.75)
+    plt.title('Dishes Matching the "is_cup_of_coffee" Regex')
+    plt.savefig("doc/dish-name-coffee-bar-chart.png", bbox_inches='tight')
+    plt.close()
+
+@timer
+def save_query_result(dirty_prices: Prices, clean_prices: Prices) -> None:
+    # Either list of prices can be a sketch, whose sample stands in for the prices in the histogram
+    dirty, clean = summarize(dirty_prices), summarize(clean_prices)
+    width = 5
+    bins = [ x / 100 for x in range(0, int(max(dirty.max, clean.max) * 100) + width, width)]
+    sns.set_theme()
+    plt.hist([dirty.values, clean.values], bins=bins, weights=[dirty.weights, clean.weights], color=['r','b'], alpha=0.75)
+    plt.title("Price of a Cup of Coffee in New York State (1900 - 1909)")
+    plt.xlabel("Price ($)")
+    plt.ylabel("Menu Appearances (count)")
+    plt.legend(loc="upper right", labels=['Dirty', 'Clean'])
+    plt.axvline(dirty.mean,   color='r', linestyle='dashed', linewidth=1, alpha=0.75)
+    plt.axvline(dirty.median, color='r', linestyle='dashed', linewidth=1, alpha=0.75)
+    plt.axvline(clean.mean,   color='b', linestyle='dashed', linewidth=1, alpha=0.75)
+    plt.axvline(clean.median, color='b', linestyle='dashed', linewidth=1, alpha=0.75)
+    x = max([dirty.mean, dirty.median, clean.mean, clean.median]) * 1.7
+    _, y = plt.ylim()
+    font = plt.rcParams['font.family']
+    plt.rcParams['font.family'] = 'monospace'
+    plt.text(x, y * 0.90, f"Count:  {dirty.count:4}",     color='r', alpha=0.75)
+    plt.text(x, y * 0.85, f"Max:    {dirty.max:.2f}",     color='r', alpha=0.75)
+    plt.text(x, y * 0.80, f"Mean:   {dirty.mean:.2f}",    color='r', alpha=0.75)
+    plt.text(x, y * 0.75, f"Median: {dirty.median:.2f}",  color='r', alpha=0.75)
+    plt.text(x, y * 0.65, f"Count:  {clean.count:4}",     color='b', alpha=0.75)
+    plt.text(x, y * 0.60, f"Max:    {clean.max:.2f}",     color='b', alpha=0.75)
+    plt.text(x, y * 0.55, f"Mean:   {clean.mean:.2f}",    color='b', alpha=0.75)
+    plt.text(x, y * 0.50, f"Median: {clean.median:.2f}",  color='b', alpha=0.75)
+    plt.rcParams['font.family'] = font
+    plt.savefig("doc/coffee-price-histogram.png", bbox_inches='tight')
+    plt.close()
+
+@timer
+def save_coffee_price_trend(results: List[Tuple[int, float, float]]) -> None:
+    x =        [ x for x, _, _ in results ]
+    y_mean =   [ x for _, x, _ in results ]
+    y_median = [ x for _, _, x in results ]
+
+    sns.set_theme()
+    plt.plot(x, y_mean, label="Mean")
+    plt.plot(x, y_median, label="Median")
+    plt.title("Price of Coffee")
+    plt.xlabel("Year")
+    plt.ylabel("Price ($)")
+    plt.legend()
+    plt.savefig("doc/coffee-price-trend.png", bbox_inches='tight')
+    plt.close()
+
+@timer
+def save_menu_bar_chart(bar_df: pd.DataFrame) -> None:
+    sns.set_theme()
+    bar_df.plot(kind='barh', stacked=True, color=['green', 'grey', 'lightgrey'], xlabel="Number of Records", title="Applicable Menu Table Attributes", alpha=0.75)
+    plt.savefig("doc/menu-bar-chart.png", bbox_inches='tight')
+    plt.close()
+
+@timer
+def save_menu_date_histogram(decades: pd.Series) -> None:
+    decades.plot(kind='hist', x='date', xlabel="Decade", ylabel="Count", title="Number of Menus By Decade", bins=range(1850, 2011, 10), alpha=0.75)
+    plt.savefig("doc/menu-date-histogram.png", bbox_inches='tight')
+    plt.close()
+
+@timer
+def save_reports(menu_dirty: List[int], menu_clean: List[int], dish_dirty: int, dish_clean: int, prices_dirty: Prices, prices_clean: Prices, parallel: bool = False) -> None:
+    if not parallel:
+        save_menu_profile(menu_dirty, menu_clean)
+        save_dish_profile(dish_dirty, dish_clean)
+        save_query_result(prices_dirty, prices_clean)
+        return
+
+    # pyplot keeps one global figure per process, so each figure renders in its own process
+    with process_pool(3, ['matplotlib.pyplot', 'seaborn', 'matplotlib_venn']) as executor:
+        futures = [
+            executor.submit(save_menu_profile, menu_dirty, menu_clean),
+            executor.submit(save_dish_profile, dish_dirty, dish_clean),
+            executor.submit(save_query_result, prices_dirty, prices_clean),
+        ]
+        for future in futures:
+            future.result()
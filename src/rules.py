@@ -0,0 +1,197 @@
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from time import perf_counter
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from changes import ChangeLog, record
+from instrument import span
+from partition import transform_values
+
+TABLES = ['menu', 'page', 'item', 'dish']
+
+Columns = Dict[str, List[str]] # Table name to column names
+Transform = Callable[[str], str]
+
+
+class Rule(NamedTuple):
+    name: str
+    reads: Columns
+    writes: Columns
+    function: Callable[..., None] # Takes menu_df, page_df, item_df, dish_df
+    transform: Optional[Transform] = None # Set for rules that rewrite each string value independently
+
+class Step(NamedTuple):
+    rules: List[Rule]
+    table: Optional[str] = None # Set for fused value rules, which all rewrite this table and column
+    column: Optional[str] = None
+
+@dataclass
+class RuleStats:
+    rule: str
+    seconds: float = 0.0
+    cells: int = 0
+
+RULES: List[Rule] = []
+
+
+def frame_rule(reads: Columns, writes: Columns) -> Callable[[Callable[..., None]], Callable[..., None]]:
+    def decorator(function: Callable[..., None]) -> Callable[..., None]:
+        RULES.append(Rule(function.__name__, reads, writes, function))
+        return function
+    return decorator
+
+def value_rule(**columns: List[str]) -> Callable[[Transform], Callable[..., None]]:
+    def decorator(transform: Transform) -> Callable[..., None]:
+        @functools.wraps(transform)
+        def function(*dfs: pd.DataFrame) -> None:
+            tables = dict(zip(TABLES, dfs))
+            for table, names in columns.items():
+                for column in names:
+                    apply_transforms(tables[table], column, [(transform.__name__, transform)])
+        RULES.append(Rule(transform.__name__, columns, columns, function, transform))
+        return function
+    return decorator
+
+def apply_transforms(df: pd.DataFrame, column: str, transforms: List[Tuple[str, Transform]], table: str = '', log: Optional[ChangeLog] = None) -> Dict[str, RuleStats]:
+    stats = { name: RuleStats(name) for name, _ in transforms }
+    categorical = isinstance(df[column].dtype, pd.CategoricalDtype)
+    if df[column].dtype != object and not categorical: # Only object and categorical columns hold strings
+        return stats
+
+    start = perf_counter()
+    if categorical:
+        codes, uniques = df[column].cat.codes.to_numpy(), df[column].cat.categories
+    else:
+        codes, uniques = pd.factorize(df[column])
+    counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+    overhead = perf_counter() - start
+
+    values = list(uniques)
+    for name, transform in transforms:
+        start = perf_counter()
+        transformed = transform_values(name, transform, values)
+        changed = np.fromiter((old != new for old, new in zip(values, transformed)), dtype=bool, count=len(values))
+        stats[name].seconds += perf_counter() - start
+        stats[name].cells += int(counts[changed].sum())
+        if log is not None and changed.any():
+            positions = np.flatnonzero(np.append(changed, False)[codes])
+            record(log, df, table, column, name, positions, np.asarray(values, dtype=object)[codes[positions]], np.asarray(transformed, dtype=object)[codes[positions]])
+        values = transformed
+
+    start = perf_counter()
+    changed = np.fromiter((old != new for old, new in zip(uniques, values)), dtype=bool, count=len(values))
+    if categorical and changed.any(): # Rewrite the categories and remap the codes without touching the rows
+        categories = pd.Index(pd.unique(np.asarray(values, dtype=object)))
+        remap = np.append(categories.get_indexer(values), -1)
+        df[column] = pd.Categorical.from_codes(remap[codes], categories=categories)
+    elif not categorical:
+        rows = np.append(changed, False)[codes] # Missing values have code -1
+        if rows.any():
+            df.loc[rows, column] = np.asarray(values, dtype=object)[codes[rows]]
+    overhead += perf_counter() - start
+
+    stats[transforms[0][0]].seconds += overhead # The rule that opened a fused pass pays for the factorization
+    return stats
+
+def touches(step: Step, table: str, column: str) -> bool:
+    if step.table is not None:
+        return (step.table, step.column) == (table, column)
+    return any(column in rule.reads.get(table, []) or column in rule.writes.get(table, []) for rule in step.rules)
+
+def plan_steps(rules: List[Rule]) -> List[Step]:
+    steps: List[Step] = []
+    for rule in rules:
+        if rule.transform is None:
+            steps.append(Step([rule]))
+            continue
+        for table, columns in rule.writes.items():
+            for column in columns:
+                previous = next((step for step in reversed(steps) if touches(step, table, column)), None)
+                if previous is not None and previous.table == table and previous.column == column:
+                    previous.rules.append(rule) # Nothing in between touches the column, so fuse into one pass
+                else:
+                    steps.append(Step([rule], table, column))
+    return steps
+
+def group_steps(steps: List[Step]) -> List[List[Step]]:
+    parents = { table: table for table in TABLES }
+
+    def find(table: str) -> str:
+        while parents[table] != table:
+            table = parents[table]
+        return table
+
+    def tables(step: Step) -> List[str]:
+        if step.table is not None:
+            return [step.table]
+        return sorted({ table for rule in step.rules for table in list(rule.reads) + list(rule.writes) })
+
+    for step in steps:
+        first, *others = tables(step)
+        for other in others:
+            parents[find(other)] = find(first)
+
+    groups: Dict[str, List[Step]] = {}
+    for step in steps:
+        groups.setdefault(find(tables(step)[0]), []).append(step)
+    return list(groups.values())
+
+def run_steps(steps: List[Step], tables: Dict[str, pd.DataFrame], stats: Dict[str, RuleStats], lock: threading.Lock, log: Optional[ChangeLog] = None) -> None:
+    for step in steps:
+        if step.table is not None and step.column is not None:
+            with span(f"{step.table}.{step.column}", rules=[ rule.name for rule in step.rules ]):
+                step_stats = apply_transforms(tables[step.table], step.column, [ (rule.name, rule.transform) for rule in step.rules if rule.transform is not None ], step.table, log)
+        else:
+            step_stats = {}
+            for rule in step.rules:
+                with span(rule.name):
+                    step_stats[rule.name] = run_frame_rule(rule, tables, log)
+        with lock:
+            for name, stat in step_stats.items():
+                stats[name].seconds += stat.seconds
+                stats[name].cells += stat.cells
+
+def run_frame_rule(rule: Rule, tables: Dict[str, pd.DataFrame], log: Optional[ChangeLog] = None) -> RuleStats:
+    categorical = [ (table, column) for table, columns in rule.writes.items() for column in columns if isinstance(tables[table][column].dtype, pd.CategoricalDtype) ]
+    for table, column in categorical: # Frame rules may write values that are not categories yet
+        tables[table][column] = tables[table][column].astype(object)
+
+    before = { (table, column): tables[table][column].copy() for table, columns in rule.writes.items() for column in columns }
+
+    start = perf_counter()
+    rule.function(*(tables[table] for table in TABLES))
+    seconds = perf_counter() - start
+
+    for table, column in categorical:
+        tables[table][column] = tables[table][column].astype('category')
+
+    cells = 0
+    for (table, column), old in before.items():
+        new = tables[table][column]
+        changed = (~((old == new) | (old.isna() & new.isna()))).to_numpy()
+        cells += int(changed.sum())
+        if log is not None:
+            rows = np.flatnonzero(changed)
+            record(log, tables[table], table, column, rule.name, rows, old.to_numpy()[rows], new.to_numpy()[rows])
+
+    return RuleStats(rule.name, seconds, cells)
+
+def run_rules(rules: List[Rule], tables: Dict[str, pd.DataFrame], parallel: bool = True, log: Optional[ChangeLog] = None) -> List[RuleStats]:
+    stats = { rule.name: RuleStats(rule.name) for rule in rules }
+    lock = threading.Lock()
+    groups = group_steps(plan_steps(rules))
+
+    if parallel and len(groups) > 1:
+        with ThreadPoolExecutor(max_workers=len(groups)) as executor:
+            for future in [ executor.submit(run_steps, steps, tables, stats, lock, log) for steps in groups ]:
+                future.result()
+    else:
+        for steps in groups:
+            run_steps(steps, tables, stats, lock, log)
+
+    return list(stats.values())
@@ -0,0 +1,149 @@
+import functools
+import json
+import math
+import re
+from argparse import ArgumentParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+import pandas as pd
+
+from dates import add_year_columns
+from instrument import timer
+from main import (add_cache_arguments, add_compact_argument,
+                  add_workers_argument, clean_data, compact, load_data,
+                  resolve_cache_dir, select_prices)
+from partition import set_workers
+from relindex import relation_index
+from regex import IS_CUP_OF_COFFEE, IS_NEW_YORK
+
+Tables = Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame, pd.DataFrame]
+Datasets = Dict[str, Tables] # Dirty and clean tables
+
+
+class Query(NamedTuple):
+    dataset: str = 'clean'
+    place: str = IS_NEW_YORK
+    low: int = 1900
+    high: int = 1909
+    currency: Optional[str] = "Dollars"
+    dish: str = IS_CUP_OF_COFFEE
+    max_price: Optional[float] = 1
+    words: Tuple[str, ...] = () # Words every dish name must contain
+    exclude: Tuple[str, ...] = () # Words no dish name may contain
+
+
+def parse_query(params: Dict[str, List[str]]) -> Query:
+    fields: Dict[str, Any] = { name: values[-1] for name, values in params.items() }
+    unknown = set(fields) - set(Query._fields) - {'years'}
+    if unknown:
+        raise ValueError(f"Unknown parameters: {', '.join(sorted(unknown))}")
+
+    if 'years' in fields: # A single year or an inclusive range such as 1900-1909
+        low, _, high = fields.pop('years').partition('-')
+        fields.update(low=low, high=high or low)
+    for name in ('low', 'high'):
+        if name in fields:
+            fields[name] = int(fields[name])
+    for name, convert in (('currency', str), ('max_price', float)):
+        if name in fields:
+            fields[name] = None if fields[name] in ('', 'any') else convert(fields[name])
+    for name in ('words', 'exclude'): # Comma-separated
+        if name in fields:
+            fields[name] = tuple( word for word in fields[name].split(',') if word )
+    query = Query(**fields)
+
+    if query.dataset not in ('dirty', 'clean'):
+        raise ValueError(f"Unknown dataset {query.dataset!r} (expected dirty or clean)")
+    if query.max_price is not None and math.isnan(query.max_price):
+        raise ValueError("max_price must be a number, not nan")
+    for pattern in (query.place, query.dish):
+        try:
+            re.compile(pattern)
+        except re.error as error: # Not a ValueError
+            raise ValueError(f"Invalid pattern {pattern!r}: {error}") from error
+    return query
+
+@timer
+def load_datasets(dataset_path: str, cache_dir: Optional[str] = None, compact_tables: bool = False) -> Datasets:
+    menu_df, page_df, item_df, dish_df = load_data(dataset_path, cache_dir)
+    if compact_tables:
+        compact(menu_df, page_df, item_df, dish_df)
+
+    dirty_menu_df, dirty_page_df, dirty_item_df, dirty_dish_df = ( df.copy() for df in (menu_df, page_df, item_df, dish_df) )
+    clean_data(menu_df, page_df, item_df, dish_df)
+
+    for tables in ((dirty_page_df, dirty_item_df), (page_df, item_df)):
+        relation_index(*tables) # Every query joins through these, so index them once up front
+
+    return { # Parse the dates once up front rather than on every query
+        'dirty': (add_year_columns(dirty_menu_df), dirty_page_df, dirty_item_df, dirty_dish_df),
+        'clean': (add_year_columns(menu_df), page_df, item_df, dish_df),
+    }
+
+def make_answer(datasets: Datasets, cache_size: int = 1024) -> Callable[[Query], bytes]:
+    @functools.lru_cache(maxsize=cache_size)
+    def answer(query: Query) -> bytes:
+        prices = select_prices(*datasets[query.dataset], place=query.place, low=query.low, high=query.high, currency=query.currency, dish=query.dish, max_price=query.max_price, words=query.words, exclude=query.exclude)
+        return json.dumps({
+            'query': query._asdict(),
+            'count': len(prices),
+            'mean': float(prices.mean()) if len(prices) else None,
+            'median': float(prices.median()) if len(prices) else None,
+            'prices': prices.tolist(),
+        }).encode() # Cache the encoded response so repeat queries skip serialization too
+    return answer
+
+def make_server(datasets: Datasets, host: str = '127.0.0.1', port: int = 8000, cache_size: int = 1024) -> ThreadingHTTPServer:
+    answer = make_answer(datasets, cache_size)
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            url = urlsplit(self.path)
+            if url.path == '/prices':
+                try:
+                    query = parse_query(parse_qs(url.query, keep_blank_values=True))
+                except ValueError as error:
+                    self.send_json(400, json.dumps({'error': str(error)}).encode())
+                    return
+                self.send_json(200, answer(query))
+            elif url.path == '/cache':
+                info = answer.cache_info() # type: ignore[attr-defined]
+                self.send_json(200, json.dumps(info._asdict()).encode())
+            else:
+                self.send_json(404, json.dumps({'error': f"No endpoint {url.path} (expected /prices or /cache)"}).encode())
+
+        def send_json(self, status: int, body: bytes) -> None:
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    return ThreadingHTTPServer((host, port), Handler)
+
+@timer
+def main() -> None:
+    parser = ArgumentParser()
+    parser.add_argument('dataset_path', help='Path to the directory of the dataset to serve')
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8000, help='Port to listen on (default: 8000)')
+    parser.add_argument('--cache-size', type=int, default=1024, help='Number of query results to keep (default: 1024)')
+    add_cache_arguments(parser)
+    add_workers_argument(parser)
+    add_compact_argument(parser)
+    args = parser.parse_args()
+    set_workers(args.workers)
+
+    server = make_server(load_datasets(args.dataset_path, resolve_cache_dir(args), args.compact), args.host, args.port, args.cache_size)
+    print(f"Serving http://{args.host}:{server.server_address[1]}/prices")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+
+
+if __name__ == "__main__":
+    main()
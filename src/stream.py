@@ -0,0 +1,145 @@
+from argparse import ArgumentParser
+from typing import Any, Iterator, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from cache import SCHEMAS, read_table
+from changes import ChangeLog, changes
+from colstore import id_array, is_in, price_array
+from dates import add_year_columns
+from instrument import profiling, span, timer
+from main import (add_cache_arguments, add_profile_argument,
+                  add_report_arguments, add_workers_argument, clean_data,
+                  profile_dish_data, profile_menu_data,
+                  repair_menu_currency_convert_cents_to_dollars,
+                  resolve_cache_dir, save_json, select_keys)
+from partition import set_workers
+from sketch import Prices, Sketch, insert, new_sketch, rank_error, summarize
+
+CHUNK_ROWS = 1_000_000
+ITEM_COLUMNS = ['menu_page_id', 'dish_id', 'price'] # The only MenuItem columns the query reads
+
+StreamAnalysis = Tuple[List[int], int, Prices] # Menu profile, dish profile, prices or a sketch of them
+
+
+class ItemFilter(NamedTuple):
+    page_ids: np.ndarray # Pages of the menus that match the query
+    dish_ids: np.ndarray # Dishes that match the query
+    cents_page_ids: np.ndarray # Pages whose prices cleaning divides by 100
+    max_price: float = 1
+
+
+@timer
+def load_small_tables(dataset_path: str, cache_dir: Optional[str] = None) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    with span("read Menu"):
+        menu_df = read_table(dataset_path, 'Menu', cache_dir)
+    with span("read MenuPage"):
+        page_df = read_table(dataset_path, 'MenuPage', cache_dir)
+    with span("read Dish"):
+        dish_df = read_table(dataset_path, 'Dish', cache_dir)
+    item_df = pd.DataFrame({ column: pd.Series(dtype=dtype) for column, dtype in SCHEMAS['MenuItem'].items() }) # Streamed later
+    return menu_df, page_df, item_df, dish_df
+
+def menu_page_ids(page_df: pd.DataFrame, menu_ids: np.ndarray) -> np.ndarray:
+    return id_array(page_df['id'])[is_in(id_array(page_df['menu_id']), menu_ids)]
+
+def item_filter(menu_df: pd.DataFrame, page_df: pd.DataFrame, dish_df: pd.DataFrame, cents_menu_ids: np.ndarray) -> ItemFilter:
+    menu_ids, dish_ids = select_keys(menu_df, dish_df)
+    return ItemFilter(menu_page_ids(page_df, menu_ids), dish_ids, menu_page_ids(page_df, cents_menu_ids))
+
+def cents_menu_ids(log: ChangeLog) -> np.ndarray:
+    # Menus that cleaning changed from Cents to Dollars, whose prices it divides by 100
+    currency = changes(log, 'menu', 'currency')
+    return id_array(currency.loc[currency['rule'] == repair_menu_currency_convert_cents_to_dollars.__name__, 'row'])
+
+def item_chunks(dataset_path: str, chunk_rows: int = CHUNK_ROWS, columns: List[str] = ITEM_COLUMNS) -> Iterator[pd.DataFrame]:
+    schema = SCHEMAS['MenuItem']
+    return pd.read_csv(f"{dataset_path}/MenuItem.csv", usecols=columns, dtype={ column: schema[column] for column in columns }, chunksize=chunk_rows)
+
+def clean_prices(chunk: pd.DataFrame, cents_page_ids: np.ndarray) -> np.ndarray:
+    prices = price_array(chunk['price'])
+    if len(cents_page_ids):
+        prices = np.where(is_in(id_array(chunk['menu_page_id']), cents_page_ids), prices / 100, prices)
+    return prices
+
+def filter_chunk(chunk: pd.DataFrame, keys: ItemFilter) -> np.ndarray:
+    prices = clean_prices(chunk, keys.cents_page_ids)
+    return prices[is_in(id_array(chunk['menu_page_id']), keys.page_ids) & is_in(id_array(chunk['dish_id']), keys.dish_ids) & (prices < keys.max_price)]
+
+@timer
+def stream_prices(dataset_path: str, filters: List[ItemFilter], chunk_rows: int = CHUNK_ROWS, error: Optional[float] = None) -> List[Prices]:
+    # One pass over MenuItem for all the filters. Only the matching prices outlive each chunk, so
+    # memory grows with the answer rather than with the table. With error, each filter's prices go
+    # into a quantile sketch instead, and memory stays bounded however many prices match.
+    if error is not None:
+        sketches = [ new_sketch(error) for _ in filters ]
+        for chunk in item_chunks(dataset_path, chunk_rows):
+            for sketch, keys in zip(sketches, filters):
+                insert(sketch, filter_chunk(chunk, keys))
+        return list(sketches)
+
+    prices: List[List[np.ndarray]] = [ [] for _ in filters ]
+    for chunk in item_chunks(dataset_path, chunk_rows):
+        for kept, keys in zip(prices, filters):
+            kept.append(filter_chunk(chunk, keys))
+    return [ np.concatenate(kept).tolist() if kept else [] for kept in prices ]
+
+@timer
+def stream_analysis(dataset_path: str, cache_dir: Optional[str] = None, chunk_rows: int = CHUNK_ROWS, error: Optional[float] = None) -> Tuple[StreamAnalysis, StreamAnalysis]:
+    # The same results as main.py without loading MenuItem. The small tables are profiled and
+    # cleaned in memory, and their keys are pushed down into one streaming pass over MenuItem.
+    menu_df, page_df, item_df, dish_df = load_small_tables(dataset_path, cache_dir)
+
+    menu_df = add_year_columns(menu_df)
+    dirty_profiles = profile_menu_data(menu_df), profile_dish_data(dish_df)
+    dirty_filter = item_filter(menu_df, page_df, dish_df, np.array([], dtype=np.int64))
+
+    log = ChangeLog() # Tells which menus were in cents, since those are Dollars after cleaning
+    clean_data(menu_df, page_df, item_df, dish_df, log=log)
+
+    menu_df = add_year_columns(menu_df)
+    clean_profiles = profile_menu_data(menu_df), profile_dish_data(dish_df)
+    clean_filter = item_filter(menu_df, page_df, dish_df, cents_menu_ids(log))
+
+    prices_dirty, prices_clean = stream_prices(dataset_path, [dirty_filter, clean_filter], chunk_rows, error)
+    return (*dirty_profiles, prices_dirty), (*clean_profiles, prices_clean)
+
+def prices_json(prices: Prices) -> Any:
+    if isinstance(prices, Sketch):
+        summary = summarize(prices)
+        return {'count': summary.count, 'mean': summary.mean, 'median': summary.median, 'max': summary.max, 'quantile_rank_error': rank_error(prices.k)}
+    return prices
+
+@timer
+def main() -> None:
+    parser = ArgumentParser()
+    parser.add_argument('dataset_path', help='Path to the directory of the dataset to run on')
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS, metavar='N', help=f"Read MenuItem.csv N rows at a time (default: {CHUNK_ROWS:,})")
+    parser.add_argument('--sketch-error', type=float, metavar='EPS', help='Keep a KLL sketch of the matching prices, whose median is within this normalized rank error (e.g. 0.01), instead of every price')
+    add_cache_arguments(parser)
+    add_workers_argument(parser)
+    add_profile_argument(parser)
+    add_report_arguments(parser, parallel=True)
+    args = parser.parse_args()
+    set_workers(args.workers)
+
+    with profiling(args.profile):
+        dirty, clean = stream_analysis(args.dataset_path, resolve_cache_dir(args), args.chunk_rows, args.sketch_error)
+
+        menu_profile_dirty, dish_profile_dirty, prices_dirty = dirty
+        menu_profile_clean, dish_profile_clean, prices_clean = clean
+
+        if args.json_out:
+            save_json(args.json_out, {
+                'dirty': {'menu_profile': menu_profile_dirty, 'dish_profile': dish_profile_dirty, 'prices': prices_json(prices_dirty)},
+                'clean': {'menu_profile': menu_profile_clean, 'dish_profile': dish_profile_clean, 'prices': prices_json(prices_clean)},
+            })
+
+        if not args.no_plots:
+            from report import save_reports # Importing the plotting libraries is slow, so only plotting runs pay for it
+            save_reports(menu_profile_dirty, menu_profile_clean, dish_profile_dirty, dish_profile_clean, prices_dirty, prices_clean, args.parallel_plots)
+
+
+if __name__ == "__main__":
+    main()
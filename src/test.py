@@ -1,9 +1,41 @@
+import json
+import os
+import subprocess
+import sys
+import threading
+from contextlib import chdir
 from math import isnan
+from tempfile import TemporaryDirectory
 from unittest import TestCase
+from urllib.error import HTTPError
+from urllib.request import urlopen
 
+import numpy as np
 import pandas as pd
 
-from main import (clean_data, profile_dish_data, profile_menu_data, query_data,
+from aggregate import aggregate
+from benchmark import Measurement, compare
+from bonus import price_trends
+from bonus import query_data as bonus_query_data
+from cache import read_table
+from changes import ChangeLog, changes, dirty_table, read_log, summary, write_log
+from classify import MATCHES, classify
+from colstore import attach, column_store, is_in, select_items, write_store
+from compact import compact_data
+from cube import BEVERAGES, REGIONS, Classifier, price_cube
+from dishindex import containing, dish_index, dish_rows, find_names
+from dates import DATE_YEARS, add_year_columns, call_number_years, date_years
+from generate import COLUMNS, generate
+from incremental import update
+from instrument import profiling, span, timer
+from ingest import ingest
+import classify as classify_module
+import dishindex
+import partition
+from main import (analyze_data, analyze_data_concurrently,
+                  clean_and_analyze_data, clean_data, load_data,
+                  profile_dish_data, profile_menu_data, query_data,
+                  query_database,
                   remove_leading_and_trailing_whitespace,
                   repair_dish_name_coffee_spelling,
                   repair_menu_currency_convert_cents_to_dollars,
@@ -11,7 +43,17 @@ from main import (clean_data, profile_dish_data, profile_menu_data, query_data,
                   repair_menu_date_from_call_number,
                   repair_menu_date_outside_expected_range,
                   repair_menu_place_new_york_spelling)
+from partition import match_values, ranges, set_workers
 from regex import IS_1900_TO_1909, IS_CUP_OF_COFFEE, IS_DOLLARS, IS_NEW_YORK
+from regions import MISSING, OTHER, TARGET, marginals, profile, venn_regions
+from relindex import (INDEXES, built_index, children, item_rows, lookup,
+                      menu_item_rows, parent_rows, relation_index)
+from rules import RULES, group_steps, plan_steps
+from server import load_datasets, make_server
+from stream import stream_analysis
+from sketch import (Sketch, insert, k_for_error, merge, new_sketch, quantiles,
+                    rank_error, summarize)
+from typos import build_index, edit_distance, repair_typos
 
 
 class TestRegex(TestCase):
@@ -222,6 +264,40 @@ class TestMain(TestCase):
 
         self.assertListEqual(sorted(result), [0.05, 0.1])
 
+    def test_analyze_data_concurrently(self):
+        def tables():
+            return (
+                pd.DataFrame({'id': [1, 2], 'date': [float('nan'), "1901"], 'place': ["New Yrok", "New York"], 'currency': ["  Cents\t", "Dollars"], 'call_number': ["1900-123", float('nan')]}),
+                pd.DataFrame({'id': [1, 2], 'menu_id': [1, 2]}),
+                pd.DataFrame({'menu_page_id': [1, 2, 2], 'dish_id': [1, 2, 1], 'price': [5.0, 0.25, 0.3]}),
+                pd.DataFrame({'id': [1, 2], 'name': ["Cofee", "Coffee"]}),
+            )
+
+        sequential_dfs = tables()
+        dirty = analyze_data(*sequential_dfs, 'dirty')
+        clean = clean_and_analyze_data(*sequential_dfs)
+
+        concurrent_dfs = tables()
+        result = analyze_data_concurrently.__wrapped__(*concurrent_dfs)
+
+        self.assertEqual(result, (dirty, clean))
+        self.assertListEqual(result[0][2], [0.25]) # The dirty branch doesn't see the cleaning
+        self.assertListEqual(result[1][2], [0.05, 0.25, 0.3])
+        for sequential_df, concurrent_df in zip(sequential_dfs, concurrent_dfs):
+            pd.testing.assert_frame_equal(sequential_df, concurrent_df)
+
+    def test_query_data_engines(self):
+        menu_df = pd.DataFrame({'id': [1, 2, 3, 4], 'date': ["1900-01-01", "1909-05-01", "1909", float('nan')], 'place': ["New York", "NYC", "Albany, NY", "New York"], 'currency': ["Dollars", "Dollars", "Dollars", "Dollars"]})
+        page_df = pd.DataFrame({'id': [1, 2, 3, 4], 'menu_id': [1, 2, 3, 4]})
+        item_df = pd.DataFrame({'menu_page_id': [1, 2, 3, 4, 1, 3], 'dish_id': [1, 1, 2, 1, float('nan'), 3], 'price': [0.05, 0.1, 0.15, 0.2, 0.25, float('nan')]})
+        dish_df = pd.DataFrame({'id': [1, 2, 3], 'name': ["Coffee", "Cup of coffee", "Coffee"]})
+
+        sqlite = query_data.__wrapped__(menu_df, page_df, item_df, dish_df, 'sqlite')
+        native = query_data.__wrapped__(menu_df, page_df, item_df, dish_df, 'native')
+
+        self.assertListEqual(sqlite, [0.05, 0.1, 0.15])
+        self.assertListEqual(native, sqlite)
+
     def test_clean_data(self):
         menu_df = pd.DataFrame({'id': [1, 2], 'date': [float('nan'), "1899"], 'place': ["New Yrok", "Albany, NY"], 'currency': ["  Cents\t", "Dollars"], 'call_number': ["1900-123", float('nan')]})
         page_df = pd.DataFrame({'id': [2], 'menu_id': [1]})
@@ -237,3 +313,722 @@ class TestMain(TestCase):
         result = query_data.__wrapped__(menu_df, page_df, item_df, dish_df)
 
         self.assertListEqual(sorted(result), [0.05, 0.1])
+
+class TestBonus(TestCase):
+    def test_query_data_engines(self):
+        menu_df = pd.DataFrame({'id': [1, 2, 3], 'date': ["1900-01-01", "1901-01-01", float('nan')], 'currency': ["Dollars", "Dollars", "Dollars"]})
+        page_df = pd.DataFrame({'id': [1, 2, 3], 'menu_id': [1, 2, 3]})
+        item_df = pd.DataFrame({'menu_page_id': [1, 1, 2, 3], 'dish_id': [1, 2, 1, 1], 'price': [0.1, 0.3, 0.2, 0.4]})
+        dish_df = pd.DataFrame({'id': [1, 2], 'name': ["Iced Coffee", "Coffee"]})
+
+        sqlite = bonus_query_data.__wrapped__(menu_df, page_df, item_df, dish_df, 'sqlite')
+        native = bonus_query_data.__wrapped__(menu_df, page_df, item_df, dish_df, 'native')
+
+        self.assertListEqual(sqlite, [(1900, 0.2, 0.2), (1901, 0.2, 0.2)])
+        self.assertListEqual(native, sqlite)
+
+    def test_year_only_dates(self):
+        # Dates recovered from call numbers are only a year. pd.to_datetime guessed the format from
+        # the first date and dropped these; they now count toward their year.
+        menu_df = pd.DataFrame({'id': [1, 2, 3], 'date': ["1900-01-01", "1901", "1901-06"], 'place': ["New York", "New York", "Boston"], 'currency': ["Dollars", "Dollars", "Dollars"]})
+        page_df = pd.DataFrame({'id': [1, 2, 3], 'menu_id': [1, 2, 3]})
+        item_df = pd.DataFrame({'menu_page_id': [1, 2, 3], 'dish_id': [1, 1, 1], 'price': [0.1, 0.25, 0.75]})
+        dish_df = pd.DataFrame({'id': [1], 'name': ["Coffee"]})
+
+        self.assertTrue(pd.to_datetime(menu_df['date'], errors='coerce').iloc[1:].isna().all()) # The old parsing
+        for engine in ('native', 'sqlite'):
+            self.assertListEqual(bonus_query_data.__wrapped__(menu_df, page_df, item_df, dish_df, engine), [(1900, 0.1, 0.1), (1901, 0.5, 0.5)])
+        self.assertListEqual(list(price_trends.__wrapped__(menu_df, page_df, item_df, dish_df, ['year'])['count']), [1, 2])
+
+    def test_price_trends(self):
+        menu_df = pd.DataFrame({'id': [1, 2, 3, 4], 'date': ["1900-01-01", "1911-01-01", "1905-06-01", "1902-01-01"], 'place': ["New York", "Boston", float('nan'), "NY"], 'currency': ["Dollars", "Dollars", "Dollars", "Francs"]})
+        page_df = pd.DataFrame({'id': [1, 2, 3, 4], 'menu_id': [1, 2, 3, 4]})
+        item_df = pd.DataFrame({'menu_page_id': [1, 1, 2, 3, 4], 'dish_id': [1, 2, 1, 1, 1], 'price': [0.1, 0.3, 0.2, 0.4, 2.0]})
+        dish_df = pd.DataFrame({'id': [1, 2], 'name': ["Coffee", "Iced Coffee"]})
+
+        by_region = price_trends.__wrapped__(menu_df, page_df, item_df, dish_df, ['decade', 'region'])
+        by_currency = price_trends.__wrapped__(menu_df, page_df, item_df, dish_df, ['currency', 'dish'])
+
+        self.assertListEqual(list(by_region.index), [(1900, "New York"), (1910, "Elsewhere")])
+        self.assertListEqual(list(by_region['count']), [2, 1])
+        self.assertListEqual(list(by_currency.index), [("Dollars", "Cup of coffee"), ("Dollars", "Other coffee"), ("Francs", "Cup of coffee")])
+        self.assertListEqual(list(by_currency['count']), [3, 1, 1])
+
+class TestAggregate(TestCase):
+    def test_aggregate(self):
+        df = pd.DataFrame({'year': [1900, 1900, 1901, 1900, None, 1901, 1902], 'price': [0.4, 0.1, 0.5, 0.2, 9.0, float('nan'), 1.0]})
+
+        stats = aggregate(df, ['year'], quantiles=[0.25, 0.5])
+        grouped = df.dropna().groupby('year')['price']
+
+        self.assertListEqual(list(stats.columns), ['count', 'mean', 'min', 'max', 'p25', 'median'])
+        self.assertListEqual(list(stats.index), [1900, 1901, 1902])
+        self.assertListEqual(list(stats['count']), [3, 1, 1])
+        for column, expected in [('mean', grouped.mean()), ('min', grouped.min()), ('max', grouped.max()), ('p25', grouped.quantile(0.25)), ('median', grouped.median())]:
+            self.assertListEqual([ round(value, 9) for value in stats[column] ], [ round(value, 9) for value in expected ])
+
+class TestSketch(TestCase):
+    def test_quantiles_within_error(self):
+        values = np.random.default_rng(1).lognormal(size=100_000)
+        exact = np.sort(values)
+
+        sketch = new_sketch(0.01)
+        for chunk in np.array_split(values, 3)[:2]:
+            insert(sketch, chunk)
+        other = new_sketch(0.01)
+        insert(other, np.append(np.array_split(values, 3)[2], float('nan')))
+        merge(sketch, other)
+
+        qs = [0.01, 0.25, 0.5, 0.75, 0.99]
+        ranks = np.searchsorted(exact, quantiles(sketch, qs)) / len(values)
+
+        self.assertEqual(sketch.count, len(values))
+        self.assertLess(sum(len(level) for level in sketch.levels), 1000)
+        self.assertLessEqual(rank_error(k_for_error(0.01)), 0.01)
+        self.assertLessEqual(float(np.abs(ranks - qs).max()), 0.01)
+        self.assertTrue(np.isnan(quantiles(new_sketch(), [0.5])).all())
+
+    def test_quantiles_of_prices(self):
+        # Menu prices are whole cents with many ties and a long tail. Chunks go into separate sketches,
+        # as in a streaming scan, which are then merged.
+        prices = np.round(np.random.default_rng(2).lognormal(np.log(0.15), 0.9, size=300_000), 2)
+        exact = np.sort(prices)
+
+        sketches = [ new_sketch(0.01) for _ in range(4) ]
+        for i, chunk in enumerate(np.array_split(prices, 30)):
+            insert(sketches[i % 4], chunk)
+        for other in sketches[1:]:
+            merge(sketches[0], other)
+        sketch = sketches[0]
+
+        qs = np.linspace(0.01, 0.99, 99)
+        estimates = quantiles(sketch, qs)
+        low = np.searchsorted(exact, estimates, side='left') / len(prices) # A tied estimate covers a range of ranks
+        high = np.searchsorted(exact, estimates, side='right') / len(prices)
+        measured = np.maximum(np.maximum(low - qs, qs - high), 0)
+
+        self.assertLessEqual(float(measured.max()), rank_error(sketch.k))
+        self.assertEqual(summarize(sketch).count, len(prices))
+        self.assertAlmostEqual(summarize(sketch).mean, float(prices.mean()))
+        self.assertEqual(summarize(sketch).max, float(prices.max()))
+
+    def test_aggregate_with_sketches(self):
+        df = pd.DataFrame({'year': [1900, 1900, 1901, 1900, None, 1901, 1902], 'price': [0.4, 0.1, 0.5, 0.2, 9.0, float('nan'), 1.0]})
+
+        stats = aggregate(df, ['year'], error=0.01)
+        exact = aggregate(df, ['year'])
+
+        pd.testing.assert_frame_equal(stats[['count', 'mean', 'min', 'max']], exact[['count', 'mean', 'min', 'max']])
+        self.assertListEqual(list(stats['median']), [0.2, 0.5, 1.0])
+
+class TestCache(TestCase):
+    def test_read_table(self):
+        with TemporaryDirectory() as dataset_path:
+            cache_dir = f"{dataset_path}/.cache"
+            pd.DataFrame({'id': [1, 2], 'name': ["Coffee", float('nan')], 'description': ["Hot", "Cold"]}).to_csv(f"{dataset_path}/Dish.csv", index=False)
+
+            dish_df = read_table(dataset_path, 'Dish', cache_dir)
+
+            self.assertListEqual(list(dish_df.columns), ['id', 'name'])
+            self.assertTrue(os.path.exists(f"{cache_dir}/Dish.parquet"))
+
+            dish_df = read_table(dataset_path, 'Dish', cache_dir)
+
+            self.assertEqual(dish_df['name'].iloc[0], "Coffee")
+            self.assertTrue(isnan(dish_df['name'].iloc[1]))
+
+            pd.DataFrame({'id': [1, 2, 3], 'name': ["Tea", "Milk", "Eggs"]}).to_csv(f"{dataset_path}/Dish.csv", index=False)
+
+            dish_df = read_table(dataset_path, 'Dish', cache_dir)
+
+            self.assertListEqual(list(dish_df['name']), ["Tea", "Milk", "Eggs"])
+
+    def test_pages_without_menu(self):
+        with TemporaryDirectory() as dataset_path:
+            cache_dir = f"{dataset_path}/.cache"
+            pd.DataFrame({'id': [1], 'date': ["1900"], 'place': ["New York"], 'currency': ["Dollars"], 'call_number': [float('nan')]}).to_csv(f"{dataset_path}/Menu.csv", index=False)
+            pd.DataFrame({'id': [1, 2], 'menu_id': [1, float('nan')]}).to_csv(f"{dataset_path}/MenuPage.csv", index=False)
+            pd.DataFrame({'id': [1, 2], 'menu_page_id': [1, 2], 'dish_id': [1, 1], 'price': [0.1, 0.2]}).to_csv(f"{dataset_path}/MenuItem.csv", index=False)
+            pd.DataFrame({'id': [1], 'name': ["Coffee"]}).to_csv(f"{dataset_path}/Dish.csv", index=False)
+
+            for _ in range(2): # From the CSV, then from the cache
+                menu_df, page_df, item_df, dish_df = load_data.__wrapped__(dataset_path, cache_dir)
+
+                self.assertEqual(page_df['menu_id'].dtype, 'Int64')
+                self.assertTrue(page_df['menu_id'].isna().iloc[1])
+                self.assertListEqual(query_data.__wrapped__(menu_df, page_df, item_df, dish_df), [0.1])
+
+class TestClassify(TestCase):
+    def test_classify(self):
+        values = pd.Series(["New York", "Boston", float('nan'), "New York", "Albany, NY", 1900], index=[5, 4, 3, 2, 1, 0])
+
+        result = classify(values, IS_NEW_YORK)
+
+        self.assertListEqual(list(result.index), [5, 4, 3, 2, 1, 0])
+        self.assertListEqual(list(result), [True, False, False, True, True, False])
+        self.assertListEqual(list(result), list(values.str.contains(IS_NEW_YORK, na=False)))
+
+    def test_classify_memoizes_distinct_values(self):
+        classify(pd.Series(["Dollars", "Cents", "Dollars"]), IS_DOLLARS)
+
+        self.assertTrue(MATCHES[IS_DOLLARS]["Dollars"])
+        self.assertFalse(MATCHES[IS_DOLLARS]["Cents"])
+
+        MATCHES[IS_DOLLARS]["Cents"] = True
+
+        self.assertListEqual(list(classify(pd.Series(["Cents"]), IS_DOLLARS)), [True])
+
+        del MATCHES[IS_DOLLARS]["Cents"]
+
+    def test_classify_keeps_recent_patterns(self):
+        max_patterns = classify_module.MAX_PATTERNS
+        classify_module.MAX_PATTERNS = 2
+        try:
+            for pattern in (IS_DOLLARS, "a", "b", IS_DOLLARS, "c"):
+                classify(pd.Series(["Dollars"]), pattern)
+            self.assertListEqual(list(MATCHES)[-2:], [IS_DOLLARS, "c"])
+            self.assertEqual(len(MATCHES), 2)
+        finally:
+            classify_module.MAX_PATTERNS = max_patterns
+
+class TestColumnStore(TestCase):
+    def test_is_in(self):
+        values = np.array([3, -1, 0, 7, 3, 10**9])
+
+        self.assertListEqual(list(is_in(values, np.array([3, 0]))), [True, False, True, False, True, False])
+        self.assertListEqual(list(is_in(values, np.array([10**9, -1]))), [False, False, False, False, False, True])
+        self.assertListEqual(list(is_in(values, np.array([], dtype=np.int64))), [False] * 6)
+
+    def test_attach(self):
+        menu_df = pd.DataFrame({'id': [1, 2], 'date': ["1900", "1901"], 'place': ["New York", "Boston"], 'currency': ["Dollars", "Dollars"]})
+        page_df = pd.DataFrame({'id': [1, 2], 'menu_id': [1, 2]})
+        item_df = pd.DataFrame({'id': [1, 2, 3, 4], 'menu_page_id': [1, 1, 2, 1], 'dish_id': [1, float('nan'), 1, 1], 'price': [0.1, 0.2, 0.3, float('nan')]})
+        dish_df = pd.DataFrame({'id': [1], 'name': ["Coffee"]})
+
+        with TemporaryDirectory() as store_dir:
+            write_store(column_store(page_df, item_df), store_dir)
+            store = attach(store_dir)
+
+            self.assertIsInstance(store.item_price, np.memmap)
+            self.assertFalse(store.item_price.flags.writeable)
+            self.assertListEqual(list(store.item_dish_id), [1, -1, 1, 1])
+            self.assertListEqual(list(store.item_price[select_items(store, np.array([1]), np.array([1]), max_price=1)]), query_data.__wrapped__(menu_df, page_df, item_df, dish_df))
+
+class TestRelationIndex(TestCase):
+    def test_lookup(self):
+        parent_ids = np.random.default_rng(0).integers(-1, 50, size=1000)
+        ids = np.array([3, 7, 100, -1, 3, 49])
+
+        rows = lookup(children(parent_ids), ids)
+
+        self.assertListEqual(list(rows), [ row for id in ids if id >= 0 for row in np.flatnonzero(parent_ids == id) ])
+        self.assertEqual(len(lookup(children(parent_ids), np.array([], dtype=np.int64))), 0)
+
+    def test_parent_rows(self):
+        self.assertListEqual(list(parent_rows(np.array([30, 10, -1, 20]), np.array([10, 20, 40, -1, 30, 5]))), [1, 3, -1, -1, 0, -1])
+        self.assertListEqual(list(parent_rows(np.array([], dtype=np.int64), np.array([1]))), [-1])
+
+    def test_relation_index(self):
+        page_df = pd.DataFrame({'id': [10, 11, 12], 'menu_id': [1, 2, 1]})
+        item_df = pd.DataFrame({'id': [1, 2, 3, 4], 'menu_page_id': [12, 11, 10, 13], 'dish_id': [1, 2, float('nan'), 1]})
+
+        index = relation_index(page_df, item_df)
+
+        self.assertIs(relation_index(page_df, item_df), index)
+        self.assertListEqual(list(menu_item_rows(index, np.array([1, 1, 3]))), [0, 2])
+        key = (id(page_df), id(item_df))
+        self.assertIn(key, INDEXES)
+        del page_df
+        self.assertNotIn(key, INDEXES)
+
+    def test_item_rows(self):
+        page_df = pd.DataFrame({'id': [10, 11, 12], 'menu_id': [1, 2, 1]})
+        item_df = pd.DataFrame({'id': [1, 2, 3, 4, 5], 'menu_page_id': [12, 11, 10, 13, 10], 'dish_id': [1, 2, float('nan'), 1, 2]})
+
+        scanned = item_rows(page_df, item_df, np.array([1, 3])), item_rows(page_df, item_df, np.array([1, 2]), np.array([2]))
+        self.assertIsNone(built_index(page_df, item_df)) # Only built on request
+        relation_index(page_df, item_df)
+        indexed = item_rows(page_df, item_df, np.array([1, 3])), item_rows(page_df, item_df, np.array([1, 2]), np.array([2]))
+
+        self.assertListEqual([ list(rows) for rows in scanned ], [[0, 2, 4], [1, 4]])
+        self.assertListEqual([ list(rows) for rows in indexed ], [[0, 2, 4], [1, 4]])
+
+class TestDishIndex(TestCase):
+    def test_find_names(self):
+        dish_df = pd.DataFrame({'id': [1, 2, 3, 4, 5, 6], 'name': ["Cup of Coffee", "Iced coffee", "Coffeecake", float('nan'), "Tea, cup", "COFFEE"]})
+
+        index = dish_index(dish_df)
+
+        self.assertIs(dish_index(dish_df), index)
+        self.assertListEqual(list(dish_rows(index, find_names(index, pattern=IS_CUP_OF_COFFEE))), list(np.flatnonzero(classify(dish_df['name'], IS_CUP_OF_COFFEE))))
+        self.assertListEqual(list(dish_rows(index, containing(index, "coffee"))), [0, 1, 2, 5])
+        self.assertListEqual(list(dish_rows(index, containing(index, "D C"))), [1])
+        self.assertListEqual(list(dish_rows(index, find_names(index, words=["cup"], exclude=["tea"]))), [0])
+        self.assertListEqual(list(dish_rows(index, find_names(index, words=["soup"]))), [])
+
+    def test_postings_keep_recent_words(self):
+        index = dish_index(pd.DataFrame({'id': [1, 2], 'name': ["Cup of Coffee", "Tea"]}))
+        max_postings = dishindex.MAX_POSTINGS
+        dishindex.MAX_POSTINGS = 2
+        try:
+            for word in ("cup", "tea", "cup", "of"):
+                find_names(index, words=[word])
+            self.assertListEqual(list(index.postings), ["cup", "of"])
+            self.assertListEqual(list(dish_rows(index, find_names(index, words=["tea"]))), [1]) # Found again once dropped
+        finally:
+            dishindex.MAX_POSTINGS = max_postings
+
+class TestRegions(TestCase):
+    def test_profile(self):
+        rng = np.random.default_rng(0)
+        values = [ pd.Series(rng.choice(["a", "b", None], size=500)) for _ in range(4) ]
+        targets = [ value == "a" for value in values ]
+
+        counts = profile(values, targets)
+
+        self.assertEqual(counts.shape, (3, 3, 3, 3))
+        self.assertEqual(counts[TARGET, OTHER, MISSING, TARGET], int((targets[0] & (values[1] == "b") & values[2].isna() & targets[3]).sum()))
+        self.assertListEqual(list(marginals(counts)[2]), [int(targets[2].sum()), int((values[2] == "b").sum()), int(values[2].isna().sum())])
+        self.assertListEqual(venn_regions(counts), [ int((np.all([ targets[i] == bool(region >> i & 1) for i in range(4) ], axis=0)).sum()) for region in range(1, 16) ])
+
+class TestDates(TestCase):
+    def test_date_years(self):
+        values = pd.Series(["1900-01-02", "1909-05-01", "1905", float('nan'), "12/31/1899", "Unknown", "0190-01-01", "1900-01-02"], index=[7, 6, 5, 4, 3, 2, 1, 0])
+
+        result = date_years(values)
+
+        self.assertListEqual(list(result.index), [7, 6, 5, 4, 3, 2, 1, 0])
+        self.assertListEqual(list(result.fillna(0)), [1900, 1909, 1905, 0, 1899, 0, 190, 1900])
+        self.assertEqual(DATE_YEARS["1909-05-01"], 1909)
+        self.assertListEqual(list(call_number_years(pd.Series(["1899-01", "Other", "", float('nan')])).fillna(0)), [1899, 0, 0, 0])
+
+    def test_add_year_columns(self):
+        menu_df = pd.DataFrame({'id': [1, 2, 3], 'date': ["1909-12-31", "1910", float('nan')]})
+
+        result = add_year_columns(menu_df)
+
+        self.assertListEqual(list(result['decade'].fillna(0)), [1900, 1910, 0])
+        self.assertNotIn('year', menu_df.columns)
+
+class TestIngest(TestCase):
+    def test_ingest(self):
+        with TemporaryDirectory() as dataset_path:
+            database_path = f"{dataset_path}/coffee.db"
+            pd.DataFrame({'id': [1, 2], 'date': [float('nan'), "1905"], 'place': ["New Yrok", "New York"], 'currency': ["  Cents\t", "Dollars"], 'call_number': ["1900-123", float('nan')]}).to_csv(f"{dataset_path}/Menu.csv", index=False)
+            pd.DataFrame({'id': [1, 2], 'menu_id': [1, 2]}).to_csv(f"{dataset_path}/MenuPage.csv", index=False)
+            pd.DataFrame({'id': [1, 2, 3, 4, 5], 'menu_page_id': [1, 2, 1, 2, 1], 'dish_id': [1, 2, 2, 3, 1], 'price': [5.0, 0.2, 10.0, 0.5, 15.0]}).to_csv(f"{dataset_path}/MenuItem.csv", index=False)
+            pd.DataFrame({'id': [1, 2, 3], 'name': [" Cofee ", "Coffee", "Eggs"]}).to_csv(f"{dataset_path}/Dish.csv", index=False)
+
+            self.assertTrue(ingest.__wrapped__(dataset_path, database_path))
+            self.assertFalse(ingest.__wrapped__(dataset_path, database_path))
+
+            self.assertListEqual(query_database.__wrapped__(database_path, 'dirty'), [0.2])
+            self.assertListEqual(query_database.__wrapped__(database_path, 'clean'), [0.05, 0.2, 0.1, 0.15])
+
+            self.assertTrue(ingest.__wrapped__(dataset_path, database_path, force=True, chunk_rows=2)) # The Cents items land in all three chunks
+            self.assertListEqual(query_database.__wrapped__(database_path, 'dirty'), [0.2])
+            self.assertListEqual(query_database.__wrapped__(database_path, 'clean'), [0.05, 0.2, 0.1, 0.15])
+
+class TestRules(TestCase):
+    def test_plan_steps(self):
+        steps = plan_steps(RULES)
+
+        place = [ step for step in steps if (step.table, step.column) == ('menu', 'place') ]
+        date = [ step for step in steps if (step.table, step.column) == ('menu', 'date') ]
+
+        self.assertEqual(len(place), 1)
+        self.assertListEqual([ rule.name for rule in place[0].rules ], ['remove_leading_and_trailing_whitespace', 'repair_menu_place_new_york_spelling'])
+        self.assertEqual(len(date), 2) # repair_menu_date_from_call_number reads the date in between
+
+    def test_group_steps(self):
+        groups = group_steps(plan_steps(RULES))
+
+        self.assertEqual(len(groups), 2)
+        self.assertSetEqual({ step.table for step in groups[1] }, {'dish'})
+
+    def test_clean_data_stats(self):
+        menu_df = pd.DataFrame({'id': [1, 2, 3], 'date': [float('nan'), " 0190-01-01", "1091"], 'place': ["New Yrok", "New Yrok", " Albany, NY"], 'currency': ["Cents", "Dollers", "Dollars"], 'call_number': ["1900-123", float('nan'), float('nan')]})
+        page_df = pd.DataFrame({'id': [1], 'menu_id': [1]})
+        item_df = pd.DataFrame({'menu_page_id': [1, 1, 1], 'dish_id': [1, 2, 1], 'price': [5.0, float('nan'), 15.0]})
+        dish_df = pd.DataFrame({'id': [1, 2, 3], 'name': ["Cofee", "Cofee ", "Eggs"]})
+
+        stats = { stat.rule: stat.cells for stat in clean_data.__wrapped__(menu_df, page_df, item_df, dish_df) }
+
+        self.assertDictEqual(stats, { # Cells, so a repeated value counts once per row
+            'remove_leading_and_trailing_whitespace': 3,
+            'repair_menu_date_from_call_number': 1,
+            'repair_menu_date_outside_expected_range': 2,
+            'repair_menu_place_new_york_spelling': 2,
+            'repair_menu_currency_dollars_spelling': 1,
+            'repair_menu_currency_convert_cents_to_dollars': 3, # The currency and the two prices that are present
+            'repair_dish_name_coffee_spelling': 2,
+        })
+
+class TestTypos(TestCase):
+    def test_edit_distance(self):
+        self.assertEqual(edit_distance("coffee", "coffee"), 0)
+        self.assertEqual(edit_distance("cofee", "coffee"), 1)
+        self.assertEqual(edit_distance("cofefe", "coffee"), 1)
+        self.assertEqual(edit_distance("caffe", "coffee"), 2)
+        self.assertEqual(edit_distance("ne wyork", "new york"), 1)
+
+    def test_repair_typos(self):
+        index = build_index(["Brooklyn", "Tea"], protected=["tee"])
+
+        self.assertEqual(repair_typos("Hotel Brookyln, NY", index), "Hotel Brooklyn, NY")
+        self.assertEqual(repair_typos("Brooklyns", index), "Brooklyns") # A stuck on letter that doesn't double its neighbour
+        self.assertEqual(repair_typos("brooklyn", index), "brooklyn")
+        self.assertEqual(repair_typos("Iced Tae", index), "Iced Tea")
+        self.assertEqual(repair_typos("Tee time", index), "Tee time")
+        self.assertEqual(repair_typos("Teapot", index), "Teapot")
+        self.assertEqual(repair_typos("Bruklin", index), "Bruklin")
+
+    def test_repair_typos_inserted_letters(self):
+        index = build_index(["Coffee", "New York"])
+
+        self.assertEqual(repair_typos("Cofffee", index), "Coffee")
+        self.assertEqual(repair_typos("Pot of CCoffee", index), "Pot of Coffee")
+        self.assertEqual(repair_typos("NNew York, NY", index), "New York, NY")
+        self.assertEqual(repair_typos("Pot o fCoffee", index), "Pot o fCoffee") # The f belongs to "of"
+        self.assertEqual(repair_typos("New Yorkz NY", index), "New Yorkz NY")
+
+    def test_repair_typos_across_words(self):
+        index = build_index(["Coffee", "New York"])
+
+        self.assertEqual(repair_typos("Iced Cof fee", index), "Iced Coffee")
+        self.assertEqual(repair_typos("Ne wyork", index), "New York")
+        self.assertEqual(repair_typos("Newyork City", index), "New York City")
+        self.assertEqual(repair_typos("Cup of offee", index), "Cup of Coffee")
+        self.assertEqual(repair_typos("Coffee a la Yrok", index), "Coffee a la Yrok")
+
+    def test_repair_typos_whole(self):
+        index = build_index(["Dollars"])
+
+        self.assertEqual(repair_typos("Dollar", index, whole=True), "Dollars")
+        self.assertEqual(repair_typos("Canadian Dollar", index, whole=True), "Canadian Dollar")
+
+class TestCompact(TestCase):
+    def test_compact_data(self):
+        menu_df = pd.DataFrame({'id': [1, 2, 3, 4], 'date': [float('nan'), "1899", "1899", "1899"], 'place': ["New Yrok", "New Yrok", "New Yrok", "Albany, NY"], 'currency': ["  Cents\t", "  Cents\t", "Dollars", "Dollars"], 'call_number': ["1900-123", float('nan'), "1899-1", "1899-2"]})
+        page_df = pd.DataFrame({'id': [2], 'menu_id': [1]})
+        item_df = pd.DataFrame({'id': [1, 2, 3], 'menu_page_id': [2, 2, 2], 'dish_id': [1, 2, float('nan')], 'price': [5.0, 10.0, 20.0]})
+        dish_df = pd.DataFrame({'id': [1, 2, 3], 'name': [" \n Cofee (demi-tasse)", "\nCaffee  ", "Eggs\r\n"]})
+
+        reports = compact_data(menu_df, page_df, item_df, dish_df)
+
+        self.assertTrue(all(report.after <= report.before for report in reports))
+        self.assertEqual(menu_df['place'].dtype, 'category')
+        self.assertEqual(menu_df['call_number'].dtype, object)
+        self.assertEqual(item_df['dish_id'].dtype, 'Int32')
+        self.assertEqual(item_df['price'].dtype, 'float64')
+
+        clean_data.__wrapped__(menu_df, page_df, item_df, dish_df)
+
+        self.assertListEqual(list(menu_df['place']), ["New York", "New York", "New York", "Albany, NY"])
+        self.assertListEqual(list(menu_df['currency']), ["Dollars", "Dollars", "Dollars", "Dollars"])
+        self.assertEqual(menu_df['date'].iloc[0], "1900")
+        self.assertEqual(profile_menu_data.__wrapped__(menu_df), [0, 0, 0, 0, 3, 0, 1])
+        self.assertListEqual(sorted(round(price, 2) for price in query_data.__wrapped__(menu_df, page_df, item_df, dish_df)), [0.05, 0.1])
+
+    def test_compact_matches_default(self):
+        results = []
+        for compact_tables in (False, True):
+            menu_df = pd.DataFrame({'id': [1, 2, 3], 'date': [float('nan'), "1901", "1903"], 'place': ["New Yrok", "New York", "New York"], 'currency': ["  Cents\t", "Dollars", "Dollars"], 'call_number': ["1900-123", float('nan'), float('nan')]})
+            page_df = pd.DataFrame({'id': [1, 2, 3], 'menu_id': [1, 2, 3]})
+            item_df = pd.DataFrame({'id': [1, 2, 3, 4], 'menu_page_id': [1, 2, 3, 3], 'dish_id': [1, 1, 1, 2], 'price': [16.0, 0.16, 0.1, 0.35]})
+            dish_df = pd.DataFrame({'id': [1, 2], 'name': ["Cup of Cofee", "Coffee"]})
+            if compact_tables:
+                compact_data(menu_df, page_df, item_df, dish_df)
+
+            dirty = query_data.__wrapped__(menu_df, page_df, item_df, dish_df)
+            clean_data.__wrapped__(menu_df, page_df, item_df, dish_df)
+            results.append((dirty, query_data.__wrapped__(menu_df, page_df, item_df, dish_df), profile_menu_data.__wrapped__(menu_df), profile_dish_data.__wrapped__(dish_df)))
+
+        self.assertEqual(results[1], results[0]) # Exactly, so no precision is lost
+        self.assertListEqual(sorted(results[1][1]), [0.1, 0.16, 0.16, 0.35])
+
+class TestIncremental(TestCase):
+    def tables(self):
+        return (
+            pd.DataFrame({'id': [1, 2, 3], 'date': [float('nan'), "1899", "1905"], 'place': ["New Yrok", "Albany, NY", "Boston"], 'currency': ["  Cents\t", "Dollars", "Dollars"], 'call_number': ["1900-123", float('nan'), float('nan')]}),
+            pd.DataFrame({'id': [1, 2, 3], 'menu_id': [1, 2, 3]}),
+            pd.DataFrame({'id': [1, 2, 3, 4, 5], 'menu_page_id': [1, 1, 1, 2, 3], 'dish_id': [1, 2, 3, 1, 1], 'price': [5.0, 10.0, 20.0, 0.3, 0.4]}),
+            pd.DataFrame({'id': [1, 2, 3], 'name': [" \n Cofee (demi-tasse)", "\nCaffee  ", "Eggs\r\n"]}),
+        )
+
+    def test_update(self):
+        with TemporaryDirectory() as state_dir, TemporaryDirectory() as full_state_dir:
+            update.__wrapped__(*self.tables(), state_dir)
+
+            menu_df, page_df, item_df, dish_df = self.tables()
+            menu_df.loc[1, 'place'] = "NY"
+            menu_df.loc[1, 'date'] = "1901"
+            page_df.loc[2, 'menu_id'] = 1
+            item_df = item_df.drop(index=1)
+            dish_df.loc[2, 'name'] = "Coffee"
+
+            incremental = update.__wrapped__(menu_df, page_df, item_df, dish_df, state_dir)
+            full = update.__wrapped__(menu_df, page_df, item_df, dish_df, full_state_dir)
+
+            self.assertEqual(incremental, full)
+            self.assertListEqual(incremental[1][2], [0.05, 0.2, 0.3, 0.004])
+
+class TestInstrument(TestCase):
+    def test_span_disabled(self):
+        with span("outer") as details:
+            details['rows'] = 1
+        self.assertDictEqual(details, {'rows': 1})
+
+    def test_profiling(self):
+        @timer
+        def double(df: pd.DataFrame) -> pd.DataFrame:
+            with span("inner"):
+                return pd.concat([df, df])
+
+        with TemporaryDirectory() as directory:
+            path = f"{directory}/trace.json"
+            with profiling(path):
+                double(pd.DataFrame({'id': [1, 2, 3]}))
+            with open(path) as f:
+                events = { event['name']: event for event in json.load(f)['traceEvents'] }
+
+        self.assertSetEqual(set(events), {'run', 'double', 'inner'})
+        self.assertEqual(events['double']['args']['rows_in'], 3)
+        self.assertEqual(events['double']['args']['rows_out'], 6)
+        self.assertIn('peak_alloc_bytes', events['inner']['args'])
+        self.assertLessEqual(events['run']['ts'], events['double']['ts'])
+        self.assertLessEqual(events['double']['ts'] + events['double']['dur'], events['run']['ts'] + events['run']['dur'])
+
+    def test_profiling_threads(self):
+        def other_thread():
+            with span("other"):
+                pass
+
+        with TemporaryDirectory() as directory:
+            path = f"{directory}/trace.json"
+            with profiling(path):
+                with span("outer"):
+                    block = bytearray(10 * 2**20)
+                    del block
+                    thread = threading.Thread(target=other_thread)
+                    thread.start()
+                    thread.join()
+            with open(path) as f:
+                events = { event['name']: event for event in json.load(f)['traceEvents'] }
+
+        self.assertGreaterEqual(events['outer']['args']['peak_alloc_bytes'], 10 * 2**20) # The other thread's span reset the peak
+        self.assertGreaterEqual(events['run']['args']['peak_alloc_bytes'], 10 * 2**20)
+
+class TestGenerate(TestCase):
+    def test_generate(self):
+        with TemporaryDirectory() as dataset_path:
+            sizes = generate.__wrapped__(dataset_path, scale=0.002, seed=1)
+            for table, columns in COLUMNS.items():
+                self.assertListEqual(list(pd.read_csv(f"{dataset_path}/{table}.csv", nrows=0).columns), columns)
+
+            menu_df, page_df, item_df, dish_df = load_data.__wrapped__(dataset_path)
+
+        self.assertListEqual([len(menu_df), len(page_df), len(item_df), len(dish_df)], [sizes['Menu'], sizes['MenuPage'], sizes['MenuItem'], sizes['Dish']])
+        self.assertTrue(page_df['menu_id'].isin(menu_df['id']).all())
+        self.assertTrue(item_df['menu_page_id'].isin(page_df['id']).all())
+        self.assertTrue(item_df['dish_id'].dropna().isin(dish_df['id']).all())
+        self.assertGreater(menu_df['place'].isna().sum(), 0)
+        self.assertGreater(classify(dish_df['name'], IS_CUP_OF_COFFEE).sum(), 0)
+
+class TestBenchmark(TestCase):
+    def test_compare(self):
+        baseline = {'results': [
+            {'stage': "fast", 'seconds': 0.001, 'rows': 10, 'peak_bytes': 100},
+            {'stage': "slow", 'seconds': 1.0, 'rows': 10, 'peak_bytes': 2**30},
+        ]}
+        results = [
+            Measurement("fast", 0.005, 10, 100), # Noise
+            Measurement("slow", 1.5, 10, 2**31),
+            Measurement("new", 9.0, 10, 2**31),
+        ]
+
+        regressions = compare(results, baseline, tolerance=0.2)
+
+        self.assertListEqual([ (regression.stage, regression.metric) for regression in regressions ], [("slow", 'seconds'), ("slow", 'peak_bytes')])
+        self.assertListEqual(compare(results, baseline, tolerance=1.5), [])
+
+class TestReport(TestCase):
+    def test_plotting_is_lazy(self):
+        code = "import sys, bonus, explore, main; sys.exit('matplotlib' in sys.modules)"
+        self.assertEqual(subprocess.run([sys.executable, "-c", code], cwd=os.path.dirname(__file__)).returncode, 0)
+
+    def test_save_reports_parallel(self):
+        from report import save_reports
+
+        with TemporaryDirectory() as directory, chdir(directory):
+            os.makedirs("doc")
+            save_reports.__wrapped__([1, 2, 3, 4, 5, 6, 7], [2, 3, 4, 5, 6, 7, 8], 10, 20, [0.1, 0.2], [0.1, 0.3], parallel=True)
+            self.assertListEqual(sorted(os.listdir("doc")), ["coffee-price-histogram.png", "dish-name-coffee-bar-chart.png", "menu-venn-diagram.png"])
+
+class TestChanges(TestCase):
+    def tables(self):
+        return (
+            pd.DataFrame({'id': [1, 2, 3], 'date': [float('nan'), "1899", " 0190-01-01"], 'place': ["New Yrok", "Albany, NY", float('nan')], 'currency': ["  Cents\t", "Dollars", "Dollars"], 'call_number': ["1900-123", float('nan'), float('nan')]}),
+            pd.DataFrame({'id': [1, 2], 'menu_id': [1, 2]}),
+            pd.DataFrame({'id': [1, 2, 3], 'menu_page_id': [1, 1, 2], 'dish_id': [1, 2, 3], 'price': [5.0, float('nan'), 20.0]}),
+            pd.DataFrame({'id': [1, 2, 3], 'name': [" \n Cofee (demi-tasse)", "\nCaffee  ", "Eggs\r\n"]}),
+        )
+
+    def test_clean_data_log(self):
+        dirty = self.tables()
+        clean = self.tables()
+        log = ChangeLog()
+        stats = clean_data.__wrapped__(*clean, log=log)
+
+        dates = changes(log, 'menu', 'date')
+        self.assertListEqual(list(dates['row']), [3, 1, 3])
+        self.assertListEqual(list(dates['old'].fillna("")), [" 0190-01-01", "", "0190-01-01"])
+        self.assertListEqual(list(dates['new']), ["0190-01-01", "1900", "1900-01-01"])
+        self.assertListEqual(list(dates['rule']), ["remove_leading_and_trailing_whitespace", "repair_menu_date_from_call_number", "repair_menu_date_outside_expected_range"])
+
+        prices = changes(log, 'item', 'price')
+        self.assertListEqual(list(zip(prices['row'], prices['old'], prices['new'])), [(1, 5.0, 0.05)])
+        self.assertEqual(summary(log)['cells'].sum(), sum(stat.cells for stat in stats))
+
+        with TemporaryDirectory() as directory:
+            write_log(log, directory)
+            log = read_log(directory)
+
+        for table, dirty_df, clean_df in zip(['menu', 'page', 'item', 'dish'], dirty, clean):
+            pd.testing.assert_frame_equal(dirty_table(clean_df, table, log), dirty_df)
+
+class TestServer(TestCase):
+    def test_prices(self):
+        with TemporaryDirectory() as dataset_path:
+            pd.DataFrame({'id': [1, 2], 'date': [float('nan'), "1915-03-01"], 'place': ["New Yrok", "Boston"], 'currency': ["  Cents\t", "Dollars"], 'call_number': ["1900-123", float('nan')]}).to_csv(f"{dataset_path}/Menu.csv", index=False)
+            pd.DataFrame({'id': [1, 2], 'menu_id': [1, 2]}).to_csv(f"{dataset_path}/MenuPage.csv", index=False)
+            pd.DataFrame({'id': [1, 2, 3, 4], 'menu_page_id': [1, 1, 1, 2], 'dish_id': [1, 2, 3, 3], 'price': [5.0, 10.0, 20.0, 0.15]}).to_csv(f"{dataset_path}/MenuItem.csv", index=False)
+            pd.DataFrame({'id': [1, 2, 3], 'name': [" \n Cofee (demi-tasse)", "\nCaffee  ", "Tea\r\n"]}).to_csv(f"{dataset_path}/Dish.csv", index=False)
+
+            server = make_server(load_datasets.__wrapped__(dataset_path, None), port=0)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            url = f"http://127.0.0.1:{server.server_address[1]}"
+
+            def get(path):
+                with urlopen(f"{url}{path}") as response:
+                    return json.load(response)
+
+            try:
+                self.assertListEqual(get("/prices?dataset=dirty")['prices'], [])
+                self.assertListEqual(get("/prices")['prices'], [0.05, 0.1])
+                self.assertListEqual(get("/prices")['prices'], [0.05, 0.1])
+                self.assertListEqual(get("/prices?dish=Tea&place=Boston&years=1910-1919&max_price=any")['prices'], [0.15])
+                self.assertListEqual(get("/prices?dish=Tea&place=.&currency=any&max_price=any")['prices'], [0.2])
+                self.assertListEqual(get("/prices?dish=.&words=tea&place=.&years=1900-1919&currency=any&max_price=any")['prices'], [0.2, 0.15])
+                self.assertListEqual(get("/prices?dish=.&exclude=tea,demi&place=.&currency=any&max_price=any")['prices'], [0.1])
+                self.assertEqual(get("/cache")['hits'], 1)
+                for path in ("/prices?years=soon", "/prices?place=(", "/prices?dish=[a-", "/prices?max_price=nan"):
+                    with self.assertRaises(HTTPError) as error:
+                        get(path)
+                    self.assertEqual(error.exception.code, 400)
+                    self.assertIn('error', json.load(error.exception))
+            finally:
+                server.shutdown()
+                server.server_close()
+
+class TestCube(TestCase):
+    def test_price_cube(self):
+        menu_df = pd.DataFrame({'id': [1, 2, 3, 4], 'date': ["1900-01-01", "1905", "1915-03-01", "1901"], 'place': ["New York", "Brooklyn, NY", "Boston", "Paris"], 'currency': ["Dollars", "Dollars", "Dollars", "Francs"]})
+        page_df = pd.DataFrame({'id': [10, 20, 30, 40], 'menu_id': [1, 2, 3, 4]})
+        item_df = pd.DataFrame({'id': [1, 2, 3, 4, 5, 6, 7], 'menu_page_id': [10, 10, 20, 20, 30, 40, 50], 'dish_id': [1, 2, 1, 3, 2, 1, 1], 'price': [0.1, 0.05, 0.3, 0.2, 1.5, 0.5, 0.4]})
+        dish_df = pd.DataFrame({'id': [1, 2, 3], 'name': ["Cup of Coffee", "Tea", "Iced Coffee"]})
+
+        cube = price_cube.__wrapped__(menu_df, page_df, item_df, dish_df)
+
+        self.assertListEqual(list(cube.index), [("New York", 1900, "Cup of coffee"), ("New York", 1900, "Other coffee"), ("New York", 1900, "Tea")])
+        self.assertListEqual(list(cube.columns), ['count', 'mean', 'median', 'max'])
+        self.assertListEqual(cube.loc[("New York", 1900, "Cup of coffee")].tolist(), [2, 0.2, 0.2, 0.3])
+        self.assertEqual(cube.loc[("New York", 1900, "Cup of coffee"), 'count'], len(query_data.__wrapped__(menu_df, page_df, item_df, dish_df)))
+
+        cube = price_cube.__wrapped__(menu_df, page_df, item_df, dish_df, REGIONS[:1] + [Classifier("Everywhere", r".")], BEVERAGES[2:3], period_years=20, currency=None, max_price=None)
+
+        self.assertListEqual(list(cube.index), [("New York", 1900, "Tea"), ("Everywhere", 1900, "Tea")])
+        self.assertListEqual(cube['max'].tolist(), [0.05, 1.5])
+
+    def test_other_region(self):
+        menu_df = pd.DataFrame({'id': [1, 2, 3, 4], 'date': ["1900", "1901", "1902", "1903"], 'place': ["Boston", "Cleveland, OH", "Hotel Astor", float('nan')], 'currency': ["Dollars"] * 4})
+        page_df = pd.DataFrame({'id': [1, 2, 3, 4], 'menu_id': [1, 2, 3, 4]})
+        item_df = pd.DataFrame({'id': [1, 2, 3, 4], 'menu_page_id': [1, 2, 3, 4], 'dish_id': [1, 1, 1, 1], 'price': [0.1, 0.2, 0.3, 0.4]})
+        dish_df = pd.DataFrame({'id': [1], 'name': ["Tea"]})
+
+        cube = price_cube.__wrapped__(menu_df, page_df, item_df, dish_df)
+
+        self.assertListEqual(list(cube.index), [("Boston", 1900, "Tea"), ("Other", 1900, "Tea")])
+        self.assertListEqual(cube['count'].tolist(), [1, 2]) # Only the menu without a place is left out
+
+class TestStream(TestCase):
+    def test_stream_analysis(self):
+        with TemporaryDirectory() as dataset_path:
+            pd.DataFrame({'id': [1, 2, 3], 'date': [float('nan'), "1905-03-01", "1901"], 'place': ["New Yrok", "NY", "Boston"], 'currency': ["  Cents\t", "Dollars", "Cents"], 'call_number': ["1900-123", float('nan'), float('nan')]}).to_csv(f"{dataset_path}/Menu.csv", index=False)
+            pd.DataFrame({'id': [1, 2, 3], 'menu_id': [1, 2, 3]}).to_csv(f"{dataset_path}/MenuPage.csv", index=False)
+            pd.DataFrame({'id': [1, 2, 3, 4, 5, 6], 'menu_page_id': [1, 1, 2, 2, 3, 1], 'dish_id': [1, 2, 1, float('nan'), 1, 3], 'price': [5.0, 10.0, 0.15, 0.2, 20.0, float('nan')]}).to_csv(f"{dataset_path}/MenuItem.csv", index=False)
+            pd.DataFrame({'id': [1, 2, 3], 'name': [" \n Cofee (demi-tasse)", "\nCaffee  ", "Tea\r\n"]}).to_csv(f"{dataset_path}/Dish.csv", index=False)
+
+            streamed = stream_analysis.__wrapped__(dataset_path, chunk_rows=2)
+            menu_df, page_df, item_df, dish_df = load_data.__wrapped__(dataset_path)
+            loaded = analyze_data(menu_df, page_df, item_df, dish_df, 'dirty'), clean_and_analyze_data(menu_df, page_df, item_df, dish_df)
+
+        self.assertEqual(streamed, loaded)
+        self.assertListEqual(streamed[1][2], [0.05, 0.1, 0.15])
+
+    def test_stream_sketches(self):
+        with TemporaryDirectory() as dataset_path:
+            pd.DataFrame({'id': [1, 2], 'date': ["1901", "1905"], 'place': ["New York", "New Yrok"], 'currency': ["Dollars", "Cents"], 'call_number': [float('nan'), float('nan')]}).to_csv(f"{dataset_path}/Menu.csv", index=False)
+            pd.DataFrame({'id': [1, 2], 'menu_id': [1, 2]}).to_csv(f"{dataset_path}/MenuPage.csv", index=False)
+            prices = np.round(np.random.default_rng(3).lognormal(np.log(0.1), 0.5, size=5_000), 2)
+            pd.DataFrame({'id': np.arange(len(prices)), 'menu_page_id': np.arange(len(prices)) % 2 + 1, 'dish_id': 1, 'price': np.where(np.arange(len(prices)) % 2, prices * 100, prices)}).to_csv(f"{dataset_path}/MenuItem.csv", index=False)
+            pd.DataFrame({'id': [1], 'name': ["Coffee"]}).to_csv(f"{dataset_path}/Dish.csv", index=False)
+
+            exact = stream_analysis.__wrapped__(dataset_path, chunk_rows=1000)[1][2]
+            sketch = stream_analysis.__wrapped__(dataset_path, chunk_rows=1000, error=0.05)[1][2]
+
+        exact_summary, sketch_summary = summarize(exact), summarize(sketch)
+        self.assertIsInstance(sketch, Sketch)
+        self.assertLess(sum(len(level) for level in sketch.levels), len(exact))
+        self.assertEqual(sketch_summary.count, exact_summary.count)
+        self.assertAlmostEqual(sketch_summary.mean, exact_summary.mean)
+        self.assertAlmostEqual(sketch_summary.max, exact_summary.max)
+        ranks = np.searchsorted(np.sort(exact), sketch_summary.median, side='left') / len(exact), np.searchsorted(np.sort(exact), sketch_summary.median, side='right') / len(exact)
+        self.assertLessEqual(ranks[0], 0.5 + rank_error(sketch.k))
+        self.assertGreaterEqual(ranks[1], 0.5 - rank_error(sketch.k))
+
+class TestPartition(TestCase):
+    def test_ranges(self):
+        self.assertListEqual(ranges(10, 3), [(0, 3), (3, 6), (6, 10)])
+        self.assertListEqual(ranges(2, 4), [(0, 1), (1, 2)])
+
+    def test_workers(self):
+        def tables():
+            return (
+                pd.DataFrame({'id': [1, 2, 3, 4], 'date': [float('nan'), "1901", "1899", "1905 "], 'place': ["New Yrok", "Nwe York", "Boston", "Brooklyn, N.Y."], 'currency': ["  Cents\t", "Dollars", "Dollars ", "Dolars"], 'call_number': ["1900-123", float('nan'), float('nan'), float('nan')]}),
+                pd.DataFrame({'id': [1, 2, 3, 4], 'menu_id': [1, 2, 3, 4]}),
+                pd.DataFrame({'menu_page_id': [1, 2, 3, 4], 'dish_id': [1, 2, 3, 4], 'price': [5.0, 0.1, 0.2, 0.3]}),
+                pd.DataFrame({'id': [1, 2, 3, 4], 'name': [" Cofee", "Coffee ", "Tea", "Cofee (demi-tasse)"]}),
+            )
+        values = ["Coffee", "Tea", float('nan'), "Cup of coffee", "Coffee pot"]
+        serial = tables()
+        serial_stats = [ stat.cells for stat in clean_data.__wrapped__(*serial) ]
+
+        min_values = partition.MIN_VALUES
+        partition.MIN_VALUES = 1
+        set_workers(2)
+        try:
+            parallel = tables()
+            parallel_stats = [ stat.cells for stat in clean_data.__wrapped__(*parallel) ]
+            matches = match_values(IS_CUP_OF_COFFEE, values)
+        finally:
+            set_workers(1)
+            partition.MIN_VALUES = min_values
+
+        self.assertListEqual(parallel_stats, serial_stats)
+        for parallel_df, serial_df in zip(parallel, serial):
+            pd.testing.assert_frame_equal(parallel_df, serial_df)
+        self.assertListEqual(list(parallel[0]['place']), ["New York", "New York", "Boston", "Brooklyn, N.Y."])
+        self.assertListEqual(list(parallel[0]['currency']), ["Dollars", "Dollars", "Dollars", "Dollars"])
+        self.assertListEqual(list(parallel[3]['name']), ["Coffee", "Coffee", "Tea", "Coffee (demi-tasse)"])
+        self.assertListEqual(list(matches), [True, False, False, True, False])
@@ -0,0 +1,116 @@
+import re
+from itertools import combinations
+from typing import (Dict, FrozenSet, Iterable, List, NamedTuple, Optional,
+                    Pattern, Set, Tuple)
+
+
+class VariantIndex(NamedTuple):
+    terms: Dict[str, str] # Lowercase term to canonical spelling
+    variants: Dict[str, Set[str]] # Deletion variant to the lowercase terms it was derived from
+    max_distance: int
+    protected: FrozenSet[str] # Lowercase words that are within the budget of a term but are not typos
+    lengths: range
+    tokens: int # Most words a span can have and still match a term, which a stray separator may have split
+    matches: Dict[str, Optional[Tuple[int, str]]] # Memo of match by span text, as names repeat the same words
+    nearby: Pattern[str] # Finds every lowercase text within max_distance of a term, and some others
+
+
+TOKEN = re.compile(r"[^\W_]+") # Runs of letters and digits
+WILDCARD = "\0" # Any one character in a neighbourhood pattern
+
+
+def deletions(word: str, max_distance: int) -> Set[str]:
+    return { ''.join(word[i] for i in range(len(word)) if i not in removed)
+             for distance in range(max_distance + 1)
+             for removed in combinations(range(len(word)), distance) }
+
+def edit_distance(a: str, b: str) -> int: # Optimal string alignment (Levenshtein plus adjacent transpositions)
+    previous: List[int] = []
+    row = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        before, previous, row = previous, row, [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            row[j] = min(previous[j] + 1, row[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                row[j] = min(row[j], before[j - 2] + 1)
+    return row[len(b)]
+
+def edits(pattern: str) -> Set[str]:
+    # Patterns one deletion, substitution, insertion or transposition away from pattern
+    return ({ pattern[:i] + pattern[i + 1:] for i in range(len(pattern)) }
+            | { pattern[:i] + WILDCARD + pattern[i + 1:] for i in range(len(pattern)) }
+            | { pattern[:i] + WILDCARD + pattern[i:] for i in range(len(pattern) + 1) }
+            | { pattern[:i] + pattern[i + 1] + pattern[i] + pattern[i + 2:] for i in range(len(pattern) - 1) })
+
+def neighbourhood(terms: Iterable[str], max_distance: int) -> Pattern[str]:
+    # One regex search tells whether a value can contain a typo at all, so the word by word search
+    # only runs on the few values that can
+    patterns = set(terms)
+    for _ in range(max_distance):
+        patterns |= { edited for pattern in patterns for edited in edits(pattern) }
+    patterns = { pattern.strip(WILDCARD) for pattern in patterns } # Searches are much slower from a wildcard, and from ignoring case
+    alternatives = sorted( ''.join('.' if char == WILDCARD else re.escape(char) for char in pattern) for pattern in patterns )
+    return re.compile('|'.join(alternatives), re.DOTALL)
+
+def build_index(terms: Iterable[str], max_distance: int = 1, protected: Iterable[str] = ()) -> VariantIndex:
+    canonical = { term.lower(): term for term in terms }
+    variants: Dict[str, Set[str]] = {}
+    for term in canonical:
+        for variant in deletions(term, max_distance):
+            variants.setdefault(variant, set()).add(term)
+    lengths = range(min(map(len, canonical)) - max_distance, max(map(len, canonical)) + max_distance + 1)
+    tokens = max( len(TOKEN.findall(term)) for term in canonical ) + max_distance
+    return VariantIndex(canonical, variants, max_distance, frozenset(word.lower() for word in protected), lengths, tokens, {}, neighbourhood(canonical, max_distance))
+
+def lookup(index: VariantIndex, word: str) -> Optional[Tuple[int, str]]:
+    word = word.lower()
+    if word in index.protected:
+        return None
+    candidates = { term for variant in deletions(word, index.max_distance) for term in index.variants.get(variant, ()) }
+    matches = sorted((edit_distance(word, term), term) for term in candidates)
+    if not matches or matches[0][0] > index.max_distance:
+        return None
+    distance, term = matches[0]
+    return distance, index.terms[term]
+
+def glued(word: str, term: str) -> bool:
+    # word is term with a letter stuck to its start or end, as in "fCoffee", that doesn't double the
+    # letter beside it, as in "CCoffee". That letter most likely belongs to the next word.
+    return len(word) == len(term) + 1 and ((word[1:] == term and word[0] != word[1]) or (word[:-1] == term and word[-1] != word[-2]))
+
+def match(index: VariantIndex, text: str) -> Optional[Tuple[int, str]]:
+    if text not in index.matches:
+        found = lookup(index, text)
+        index.matches[text] = None if found is None or glued(text.lower(), found[1].lower()) else found
+    return index.matches[text]
+
+def repair_typos(value: str, index: VariantIndex, whole: bool = False) -> str:
+    if whole:
+        if len(value) not in index.lengths:
+            return value
+        found = lookup(index, value)
+        return found[1] if found is not None and found[0] > 0 else value
+
+    if index.nearby.search(value.lower()) is None:
+        return value
+
+    # Tries the spans of up to index.tokens words from each word, taking the closest match and
+    # continuing after it
+    tokens = [ token.span() for token in TOKEN.finditer(value) ]
+    pieces: List[str] = []
+    copied = 0
+    i = 0
+    while i < len(tokens):
+        start = tokens[i][0]
+        matches = [ (found, j) for j in range(i, min(i + index.tokens, len(tokens))) if tokens[j][1] - start in index.lengths
+                    for found in [match(index, value[start:tokens[j][1]])] if found is not None ]
+        if not matches:
+            i += 1
+            continue
+        (distance, term), j = min(matches, key=lambda candidate: candidate[0][0])
+        if distance > 0: # Leave correct spellings untouched
+            pieces += [value[copied:start], term]
+            copied = tokens[j][1]
+        i = j + 1
+    return ''.join(pieces) + value[copied:]